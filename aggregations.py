@@ -0,0 +1,343 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from dataset import filter_signature
+
+# --- Result Cache ---
+
+class LRUCache:
+    """Small thread-safe LRU cache for computed results, with hit/miss counters."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# --- Helpers ---
+
+# Magnitude bands drawn by the dashboard's violin plot
+VIOLIN_BANDS = [
+    ('Low', 0.0, 4.5),
+    ('Medium', 4.5, 6.0),
+    ('High', 6.0, 7.0),
+    ('Critical', 7.0, np.inf),
+]
+
+_DAY_NS = 86400 * 10**9
+
+
+def _float(value):
+    """Plain float for JSON, with NaN as None."""
+    value = float(value)
+    return None if value != value else value
+
+
+def _counts(codes, uniques, exclude=('Unknown',)):
+    """Category counts sorted by count (descending), skipping missing and excluded labels."""
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    keep = [i for i in np.argsort(-counts, kind='stable') if counts[i] > 0 and uniques[i] not in exclude]
+    return {'labels': [str(uniques[i]) for i in keep], 'values': [int(counts[i]) for i in keep]}
+
+
+def _period_counts(day_numbers, period):
+    """Event counts per day/week/month/year from integer days since the epoch."""
+    if period == 'day':
+        keys = day_numbers
+    elif period == 'week':
+        # Weeks start on Sunday, as in the dashboard (1970-01-01 was a Thursday)
+        keys = day_numbers - (day_numbers + 4) % 7
+    elif period == 'month':
+        keys = day_numbers.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    else:
+        keys = day_numbers.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64)
+
+    if len(keys) == 0:
+        return {'x': [], 'y': []}
+    offset = keys.min()
+    counts = np.bincount(keys - offset)
+    present = np.flatnonzero(counts)
+    labels = present + offset
+    if period in ('day', 'week'):
+        x = labels.astype('datetime64[D]').astype(str)
+    elif period == 'month':
+        x = labels.astype('datetime64[M]').astype(str)
+    else:
+        x = labels.astype('datetime64[Y]').astype(str)
+    return {'x': x.tolist(), 'y': counts[present].tolist()}
+
+
+def _violin_band(values, name, low, high, grid_points=50):
+    """Quantiles plus a binned Gaussian KDE outline for one magnitude band."""
+    band = np.sort(values[(values >= low) & (values < high)])
+    summary = {'name': name, 'range': [low, None if np.isinf(high) else high], 'count': int(len(band))}
+    if len(band) == 0:
+        return summary
+
+    q = np.quantile(band, [0.0, 0.25, 0.5, 0.75, 1.0])
+    iqr = q[3] - q[1]
+    summary.update({
+        'mean': _float(band.mean()),
+        'min': _float(q[0]), 'q1': _float(q[1]), 'median': _float(q[2]), 'q3': _float(q[3]), 'max': _float(q[4]),
+        'lowerfence': _float(max(q[0], q[1] - 1.5 * iqr)),
+        'upperfence': _float(min(q[4], q[3] + 1.5 * iqr)),
+    })
+
+    # Silverman's bandwidth over binned data keeps the KDE O(grid^2) regardless of band size
+    spread = band.std()
+    bandwidth = max(1.06 * spread * len(band) ** -0.2, 0.02)
+    grid = np.linspace(q[0] - bandwidth, q[4] + bandwidth, grid_points)
+    counts, edges = np.histogram(band, bins=grid_points, range=(grid[0], grid[-1]))
+    centers = (edges[:-1] + edges[1:]) / 2
+    density = (counts[None, :] * np.exp(-0.5 * ((grid[:, None] - centers[None, :]) / bandwidth) ** 2)).sum(axis=1)
+    density /= len(band) * bandwidth * np.sqrt(2 * np.pi)
+    summary['density'] = {'y': grid.tolist(), 'x': density.tolist()}
+    return summary
+
+
+# --- Rollup Engine ---
+
+class RollupEngine:
+    """
+    Computes every dashboard chart aggregate for a filtered view in one
+    vectorized pass over typed columns. Unfiltered results are precomputed at
+    load time; filtered results are cached per filter signature.
+    """
+
+    CATEGORY_COLUMNS = ['country', 'continent', 'magType', 'magnitude_category', 'depth_category']
+
+    def __init__(self, frame, query_index, cache_size=256):
+        self.query_index = query_index
+        self.magnitude = query_index.numeric.get('magnitude', np.full(len(frame), np.nan))
+        self.depth = query_index.numeric.get('depth', np.full(len(frame), np.nan))
+        self.tsunami = query_index.numeric.get('tsunami', np.full(len(frame), np.nan))
+        dated = query_index.date_ns != np.iinfo(np.int64).min
+        self.dated_rows = dated
+        self.day_numbers = np.where(dated, query_index.date_ns // _DAY_NS, 0)
+
+        self.codes = {}
+        self.uniques = {}
+        for col in self.CATEGORY_COLUMNS:
+            if col in frame.columns:
+                self.codes[col], self.uniques[col] = pd.factorize(frame[col])
+            else:
+                self.codes[col], self.uniques[col] = np.full(len(frame), -1), np.array([], dtype=object)
+
+        self.cache = LRUCache(cache_size)
+        self.default = self.compute(np.arange(len(frame)))
+
+    def get(self, filters):
+        """Rollups for parsed filters, from the precomputed default or the cache."""
+        if not filters:
+            return self.default
+        key = filter_signature(filters)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.compute(self.query_index.select(filters))
+            self.cache.put(key, result)
+        return result
+
+    def compute(self, rows):
+        magnitude = self.magnitude[rows]
+        depth = self.depth[rows]
+        tsunami = self.tsunami[rows]
+        codes = {col: values[rows] for col, values in self.codes.items()}
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            summary = {
+                'count': int(len(rows)),
+                'avg_magnitude': _float(np.nanmean(magnitude)) if np.isfinite(magnitude).any() else None,
+                'avg_depth': _float(np.nanmean(depth)) if np.isfinite(depth).any() else None,
+            }
+
+            # Per-country statistics from weighted bincounts over the country codes
+            country_codes = codes['country']
+            uniques = self.uniques['country']
+            located = country_codes >= 0
+            n = len(uniques)
+            cc = country_codes[located]
+            count = np.bincount(cc, minlength=n)
+            mag = magnitude[located]
+            dep = depth[located]
+            mag_ok = ~np.isnan(mag)
+            dep_ok = ~np.isnan(dep)
+            avg_mag = np.bincount(cc[mag_ok], weights=mag[mag_ok], minlength=n) / np.bincount(cc[mag_ok], minlength=n)
+            avg_dep = np.bincount(cc[dep_ok], weights=dep[dep_ok], minlength=n) / np.bincount(cc[dep_ok], minlength=n)
+            tsunami_rate = np.bincount(cc, weights=(tsunami[located] == 1), minlength=n) / count * 100
+        order = [i for i in np.argsort(-count, kind='stable') if count[i] > 0 and uniques[i] != 'Unknown']
+
+        dated = self.dated_rows[rows]
+        day_numbers = self.day_numbers[rows][dated]
+
+        tsunami_known = tsunami[~np.isnan(tsunami)]
+        yes = int((tsunami_known == 1).sum())
+
+        return {
+            'summary': summary,
+            'time_series': {period: _period_counts(day_numbers, period) for period in ('day', 'week', 'month', 'year')},
+            'magnitude_category': _counts(codes['magnitude_category'], self.uniques['magnitude_category']),
+            'depth_category': _counts(codes['depth_category'], self.uniques['depth_category']),
+            'continents': _counts(codes['continent'], self.uniques['continent']),
+            'mag_type': _counts(codes['magType'], self.uniques['magType'], exclude=()),
+            'tsunami': {'labels': ['Yes', 'No'], 'values': [yes, int(len(tsunami_known)) - yes]},
+            'countries': {
+                'country': [str(uniques[i]) for i in order],
+                'count': [int(count[i]) for i in order],
+                'avg_magnitude': [_float(avg_mag[i]) or 0 for i in order],
+                'avg_depth': [_float(avg_dep[i]) or 0 for i in order],
+                'tsunami_rate': [_float(tsunami_rate[i]) for i in order],
+            },
+            'violin': [_violin_band(magnitude[~np.isnan(magnitude)], *band) for band in VIOLIN_BANDS],
+        }
+
+
+# --- Correlation Matrices ---
+
+CORRELATION_METHODS = ('pearson', 'spearman')
+
+DEFAULT_CORRELATION_COLUMNS = ['magnitude', 'depth', 'sig', 'latitude', 'longitude']
+
+
+def _pairwise_pearson(values):
+    """
+    Pearson matrix over the columns of an n x k array with NaN handled pairwise.
+    Every pairwise sum comes out of one Gram matrix product over
+    [centred values, centred values squared, validity mask].
+    Returns (matrix, counts) where counts[i, j] is the number of complete pairs.
+    """
+    k = values.shape[1]
+    valid = ~np.isnan(values)
+    counts_per_column = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Centring first keeps the one-pass sums numerically stable
+        means = np.where(valid, values, 0.0).sum(axis=0) / counts_per_column
+        centred = np.where(valid, values - means, 0.0)
+        gram = np.hstack([centred, centred ** 2, valid.astype(np.float64)])
+        gram = gram.T @ gram
+
+        sxy = gram[:k, :k]
+        sx = gram[:k, 2 * k:]       # sum of column i over rows where i and j are both present
+        sxx = gram[k:2 * k, 2 * k:]
+        counts = gram[2 * k:, 2 * k:]
+
+        cov = sxy - sx * sx.T / counts
+        var = sxx - sx ** 2 / counts
+        matrix = cov / np.sqrt(var * var.T)
+    matrix[(counts < 2) | ~np.isfinite(matrix)] = np.nan
+    np.clip(matrix, -1.0, 1.0, out=matrix)
+    return matrix, np.rint(counts).astype(np.int64)
+
+
+def _rank_columns(values):
+    """Average ranks of each column, computed once, with NaN left in place."""
+    return pd.DataFrame(values).rank(method='average').to_numpy(dtype=np.float64)
+
+
+def correlation_matrix(values, method='pearson'):
+    """Pearson or Spearman matrix with pairwise NaN handling; returns (matrix, counts)."""
+    if method == 'pearson':
+        return _pairwise_pearson(values)
+
+    ranks = _rank_columns(values)
+    matrix, counts = _pairwise_pearson(ranks)
+
+    # Ranking once is exact for a pair only when its complete rows are all the
+    # non-missing rows of both columns; otherwise re-rank that pair's subset.
+    present = (~np.isnan(values)).sum(axis=0)
+    stale = (counts < present[:, None]) | (counts < present[None, :])
+    for i, j in zip(*np.nonzero(np.triu(stale, k=1))):
+        both = ~(np.isnan(values[:, i]) | np.isnan(values[:, j]))
+        pair, _ = _pairwise_pearson(_rank_columns(values[both][:, [i, j]]))
+        matrix[i, j] = matrix[j, i] = pair[0, 1]
+    return matrix, counts
+
+
+class CorrelationEngine:
+    """
+    Serves correlation matrices over the numeric columns of the dataset, cached
+    per (method, columns, filter signature). Absolute latitude/longitude are
+    available as 'abs_latitude' and 'abs_longitude'.
+    """
+
+    def __init__(self, frame, query_index, cache_size=256):
+        self.query_index = query_index
+        self.columns = {}
+        for col in frame.columns:
+            if pd.api.types.is_numeric_dtype(frame[col]) and not pd.api.types.is_bool_dtype(frame[col]):
+                self.columns[col] = frame[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        for col in ('latitude', 'longitude'):
+            if col in self.columns:
+                self.columns[f'abs_{col}'] = np.abs(self.columns[col])
+        self.cache = LRUCache(cache_size)
+
+    def parse_request(self, args):
+        """Validate the 'method' and comma-separated 'columns' query parameters."""
+        method = args.get('method', 'pearson').lower()
+        if method not in CORRELATION_METHODS:
+            raise ValueError(f"Parameter 'method' must be one of {', '.join(CORRELATION_METHODS)}.")
+
+        value = args.get('columns')
+        columns = [c.strip() for c in value.split(',') if c.strip()] if value else DEFAULT_CORRELATION_COLUMNS
+        # Repeated names are dropped before counting, so 'magnitude,magnitude' is one column
+        columns = list(dict.fromkeys(columns))
+        unknown = [c for c in columns if c not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown numeric columns: {', '.join(unknown)}.")
+        if len(columns) < 2:
+            raise ValueError("Parameter 'columns' needs at least two distinct columns.")
+        return method, columns
+
+    def get(self, filters, columns, method='pearson'):
+        """Correlation matrix for parsed filters, served from the cache when possible."""
+        key = (method, tuple(columns), filter_signature(filters))
+        result = self.cache.get(key)
+        if result is None:
+            rows = self.query_index.select(filters) if filters else slice(None)
+            values = np.column_stack([self.columns[col][rows] for col in columns])
+            matrix, counts = correlation_matrix(values, method)
+            result = {
+                'method': method,
+                'columns': columns,
+                'rows': int(len(values)),
+                'matrix': [[_float(v) for v in row] for row in matrix],
+                'counts': counts.tolist(),
+            }
+            self.cache.put(key, result)
+        return result
@@ -0,0 +1,254 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from aggregations import LRUCache
+from dataset import filter_signature
+from serialization import frame_to_records
+
+# --- Anomaly Detection ---
+
+ANOMALY_METRICS = ['magnitude', 'depth', 'sig', 'seismic_energy']
+
+ANOMALY_METHODS = ('zscore', 'mad', 'rolling')
+
+# Scale factor that makes the MAD a consistent estimator of the standard deviation
+MAD_SCALE = 1.4826
+
+# Columns returned for each flagged event
+EVENT_FIELDS = ['title', 'date_time', 'location', 'country', 'latitude', 'longitude']
+
+_NAT = np.iinfo(np.int64).min
+_DAY_NS = 86400 * 10**9
+
+
+class RunningStats:
+    """
+    Welford mean/variance that can absorb new values without revisiting old
+    ones. Batches are merged with Chan's parallel update, so appending a
+    block of events costs one vectorized pass over the block only.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        n_b = len(values)
+        mean_b = values.mean()
+        m2_b = ((values - mean_b) ** 2).sum()
+
+        n = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta ** 2 * self.count * n_b / n
+        self.count = n
+        return self
+
+    @property
+    def std(self):
+        """Population standard deviation, as the dashboard has always used."""
+        return float(np.sqrt(self.m2 / self.count)) if self.count else float('nan')
+
+
+def _scaled_distance(values, center, scale):
+    """|values - center| / scale, or all NaN when the spread is zero (nothing stands out)."""
+    if not scale > 0:
+        return np.full(len(values), np.nan)
+    return np.abs(values - center) / scale
+
+
+def zscore_scores(values, stats=None):
+    """Absolute z-scores; `stats` (a RunningStats) skips recomputing mean/std."""
+    if stats is None:
+        stats = RunningStats().update(values)
+    center, scale = stats.mean, stats.std
+    scores = _scaled_distance(values, center, scale)
+    return scores, np.full(len(values), center), center, scale
+
+
+def mad_scores(values):
+    """Robust scores: distance from the median in units of the scaled MAD."""
+    present = values[~np.isnan(values)]
+    if len(present) == 0:
+        return np.full(len(values), np.nan), np.full(len(values), np.nan), float('nan'), float('nan')
+    center = float(np.median(present))
+    scale = float(np.median(np.abs(present - center))) * MAD_SCALE
+    scores = _scaled_distance(values, center, scale)
+    return scores, np.full(len(values), center), center, scale
+
+
+def rolling_scores(values, date_ns, window_days=365, min_periods=10):
+    """
+    Z-scores of each event against the events in the preceding `window_days`
+    (excluding itself). Window sums come from prefix sums over the time-sorted
+    values, so the whole series is scored in O(n log n).
+    Returns (scores, window means) aligned with the inputs.
+    """
+    scores = np.full(len(values), np.nan)
+    expected = np.full(len(values), np.nan)
+    usable = np.flatnonzero(~np.isnan(values) & (date_ns != _NAT))
+    if len(usable) == 0:
+        return scores, expected
+
+    order = usable[np.argsort(date_ns[usable], kind='stable')]
+    times = date_ns[order]
+    # Shift by the series mean so the prefix sums don't lose precision
+    shift = values[order].mean()
+    shifted = values[order] - shift
+    c1 = np.r_[0.0, np.cumsum(shifted)]
+    c2 = np.r_[0.0, np.cumsum(shifted ** 2)]
+
+    end = np.arange(len(order))
+    start = np.searchsorted(times, times - int(window_days * _DAY_NS), side='left')
+    n = end - start
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (c1[end] - c1[start]) / n
+        var = np.maximum((c2[end] - c2[start]) / n - mean ** 2, 0.0)
+        z = np.abs(shifted - mean) / np.sqrt(var)
+    z[(n < min_periods) | (var <= 0)] = np.nan
+
+    scores[order] = z
+    expected[order] = np.where(n > 0, mean + shift, np.nan)
+    return scores, expected
+
+
+class AnomalyDetector:
+    """
+    Scores events on one numeric column with z-score, MAD or rolling-window
+    statistics and returns only the flagged events. Whole-catalogue z-scores
+    use running Welford statistics that `append` extends with new rows only.
+    Column values are kept as blocks, one per append, and joined on first use.
+    """
+
+    def __init__(self, frame, cache_size=256):
+        self.frame = frame
+        self.size = len(frame)
+        self.blocks = {col: [self._column(frame, col)] for col in ANOMALY_METRICS if col in frame.columns}
+        self.date_blocks = [self._dates(frame)]
+        self.stats = {col: RunningStats().update(blocks[0]) for col, blocks in self.blocks.items()}
+        self.cache = LRUCache(cache_size)
+        self._values = self._date_ns = None
+
+    @staticmethod
+    def _column(frame, col):
+        return pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=np.float64)
+
+    @staticmethod
+    def _dates(frame):
+        if 'date_time' not in frame.columns:
+            return np.full(len(frame), _NAT, dtype=np.int64)
+        dates = pd.to_datetime(frame['date_time'], errors='coerce')
+        return dates.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = {col: np.concatenate(blocks) for col, blocks in self.blocks.items()}
+        return self._values
+
+    @property
+    def date_ns(self):
+        if self._date_ns is None:
+            self._date_ns = np.concatenate(self.date_blocks)
+        return self._date_ns
+
+    def append(self, frame):
+        """
+        A detector over `frame`, whose first rows are this detector's events and
+        the rest newly appended ones. Only the new rows are converted and merged
+        into copies of the running statistics; this detector is left unchanged
+        for requests still using it.
+        """
+        new = frame.iloc[self.size:]
+        if any(col in frame.columns for col in ANOMALY_METRICS if col not in self.blocks):
+            return AnomalyDetector(frame, self.cache.max_entries)
+        detector = copy.copy(self)
+        detector.frame = frame
+        detector.size = len(frame)
+        detector.blocks = {}
+        detector.stats = {}
+        for col, blocks in self.blocks.items():
+            block = self._column(new, col) if col in new.columns else np.full(len(new), np.nan)
+            detector.blocks[col] = blocks + [block]
+            detector.stats[col] = copy.copy(self.stats[col]).update(block)
+        detector.date_blocks = self.date_blocks + [self._dates(new)]
+        detector.cache = LRUCache(self.cache.max_entries)
+        detector._values = detector._date_ns = None
+        return detector
+
+    def parse_request(self, args):
+        """Validate metric, method, threshold, window_days and limit query parameters."""
+        metric = args.get('metric', 'magnitude')
+        if metric not in self.blocks:
+            raise ValueError(f"Parameter 'metric' must be one of {', '.join(self.blocks)}.")
+        method = args.get('method', 'zscore').lower()
+        if method not in ANOMALY_METHODS:
+            raise ValueError(f"Parameter 'method' must be one of {', '.join(ANOMALY_METHODS)}.")
+        try:
+            threshold = float(args.get('threshold', 2.0))
+            window_days = float(args.get('window_days', 365))
+            limit = int(args.get('limit', 500))
+        except ValueError:
+            raise ValueError("Parameters 'threshold', 'window_days' and 'limit' must be numbers.")
+        if threshold <= 0 or window_days <= 0 or limit <= 0:
+            raise ValueError("Parameters 'threshold', 'window_days' and 'limit' must be positive.")
+        return {'metric': metric, 'method': method, 'threshold': threshold,
+                'window_days': window_days, 'limit': limit}
+
+    def get(self, filters, rows, options):
+        """Flagged events for parsed filters; `rows` are the matching dataset rows or None for all."""
+        key = (filter_signature(filters), tuple(sorted(options.items())))
+        result = self.cache.get(key)
+        if result is None:
+            result = self.detect(rows, **options)
+            self.cache.put(key, result)
+        return result
+
+    def detect(self, rows=None, metric='magnitude', method='zscore', threshold=2.0, window_days=365, limit=500):
+        if rows is None:
+            rows = np.arange(self.size)
+        values = self.values[metric][rows]
+
+        center = scale = None
+        if method == 'zscore':
+            # The unfiltered view reuses the running statistics
+            stats = self.stats[metric] if len(rows) == self.size else None
+            scores, expected, center, scale = zscore_scores(values, stats)
+        elif method == 'mad':
+            scores, expected, center, scale = mad_scores(values)
+        else:
+            scores, expected = rolling_scores(values, self.date_ns[rows], window_days)
+
+        flagged = np.flatnonzero(scores > threshold)
+        flagged = flagged[np.argsort(-scores[flagged], kind='stable')][:limit]
+
+        fields = [col for col in EVENT_FIELDS if col in self.frame.columns]
+        events = frame_to_records(self.frame.iloc[rows[flagged]][fields])
+        for event, pos in zip(events, flagged):
+            event['value'] = float(values[pos])
+            event['score'] = float(scores[pos])
+            event['deviation'] = float(values[pos] - expected[pos])
+
+        bounds = {}
+        if center is not None and np.isfinite(scale):
+            bounds = {'lower': center - threshold * scale, 'upper': center + threshold * scale}
+        return {
+            'metric': metric,
+            'method': method,
+            'threshold': threshold,
+            'window_days': window_days if method == 'rolling' else None,
+            'scored': int((~np.isnan(scores)).sum()),
+            'flagged': int((scores > threshold).sum()),
+            'center': None if center is None or np.isnan(center) else float(center),
+            'scale': None if scale is None or np.isnan(scale) else float(scale),
+            'lower': bounds.get('lower'),
+            'upper': bounds.get('upper'),
+            'events': events,
+        }
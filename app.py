@@ -1,55 +1,142 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
 import pandas as pd
-import joblib
-from datetime import datetime
 import os
-import numpy as np
-import json
+import io
+import threading
+import time
+
+from dataset import SORTABLE_COLUMNS, parse_filters
+from inference import (
+    MAX_BATCH_ROWS, PredictionCache, model_stages, parse_quantization, predict_batch, risk_label, validate_events,
+)
+import metrics
+from metrics import phase
+from serialization import columns_to_lists, frame_to_records, make_ndjson_response, make_payload_response
+from spatial import MAX_SPATIAL_RESULTS, cell_size, parse_bbox, parse_point, parse_radius
+from state import DataState, ModelState, Reloader, VersionWatcher, load_data_state, load_model_state
 
 app = Flask(__name__)
 
+# Using the relative paths that worked in your environment
+DATA_PATH = 'data/earthquake_cleaned.csv'
+MODEL_PATH = 'models/earthquake_model.pkl'
+COLUMNS_PATH = 'models/model_columns.pkl'
+
 # --- Global Variables ---
-df = pd.DataFrame()
-model = None
-model_columns = None
+# Each request reads these references once; reloads replace them whole (see state.py)
+data_state = DataState.empty()
+model_state = ModelState.empty()
+
+# Cache of /api/predict results, cleared whenever the model is (re)loaded
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 3600)),
+    quantize=parse_quantization(os.environ.get('PREDICTION_CACHE_QUANTIZE', '')),
+)
+
+# Dataset columns are memory-mapped from the shared snapshot unless DATA_MMAP=0
+DATA_MMAP = os.environ.get('DATA_MMAP', '1') != '0'
+
+# ?profile=1 returns a sampled stack profile of that one request when PROFILE_REQUESTS=1
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0') == '1'
+
+data_watcher = VersionWatcher(DATA_PATH)
+model_watcher = VersionWatcher(MODEL_PATH, COLUMNS_PATH)
 
 # --- Application Startup: Load Data and Model ---
-def load_essentials():
-    global df, model, model_columns
-    
-    # Using the relative paths that worked in your environment
-    data_path = 'data/earthquake_cleaned.csv'
-    model_path = 'models/earthquake_model.pkl'
-    columns_path = 'models/model_columns.pkl'
-    
-    # Load earthquake data
-    try:
-        print(f"Attempting to load data from: '{data_path}'")
-        df = pd.read_csv(data_path)
-        
-        # CRITICAL FIX: Replace numpy's NaN with Python's None for JSON compatibility
-        # This prevents the "Unexpected token N" error on the frontend.
-        df = df.astype(object).where(pd.notnull(df), None)
-        
-        df['date_time'] = pd.to_datetime(df['date_time'])
-        print(f"Successfully loaded data with {len(df)} rows.")
+def load_data():
+    global data_state
+    try:
+        print(f"Attempting to load data from: '{DATA_PATH}'")
+        data_state = load_data_state(DATA_PATH, mmap=DATA_MMAP, previous=data_state)
     except FileNotFoundError:
         print(f"---")
-        print(f"CRITICAL ERROR: Data file not found at '{data_path}'.")
+        print(f"CRITICAL ERROR: Data file not found at '{DATA_PATH}'.")
         print(f"Please ensure you are running this script from the correct root directory (the parent of the 'Earthquake-app' folder).")
         print(f"---")
-        df = pd.DataFrame()
+        # data_state stays as it was: empty at startup, the last good version on a reload
+    data_watcher.current = data_state.version
 
-    # Load the prediction model and columns
+def load_model():
+    global model_state
     try:
-        print(f"Loading prediction model from: '{model_path}'")
-        model = joblib.load(model_path)
-        model_columns = joblib.load(columns_path)
-        print("Prediction model and columns loaded successfully.")
+        print(f"Loading prediction model from: '{MODEL_PATH}'")
+        model_state = load_model_state(MODEL_PATH, COLUMNS_PATH)
+        prediction_cache.invalidate(model_state.version)
     except FileNotFoundError:
-        print("Warning: Prediction model or columns not found. Prediction API will not work.")
-        model = None
-        model_columns = None
+        # A failed reload keeps serving the model already loaded
+        if model_state.version is not None:
+            print("Warning: Prediction model or columns not found; keeping the loaded model.")
+        else:
+            print("Warning: Prediction model or columns not found. Prediction API will not work.")
+            model_state = ModelState.empty()
+            prediction_cache.invalidate()
+    model_watcher.current = model_state.version
+
+def load_essentials():
+    load_data()
+    load_model()
+
+def reload_if_changed():
+    """Load settled new versions of the data or model and swap them in."""
+    if data_watcher.changed():
+        load_data()
+    if model_watcher.changed():
+        load_model()
+
+# Polls for new data/model versions every RELOAD_INTERVAL seconds (0 disables)
+reloader = Reloader(reload_if_changed, float(os.environ.get('RELOAD_INTERVAL', 30)))
+
+@app.before_request
+def start_reloader():
+    reloader.ensure_started()
+
+# --- Metrics ---
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    if PROFILE_REQUESTS and request.args.get('profile') == '1':
+        g.profiler = metrics.SamplingProfiler(threading.get_ident()).start()
+
+@app.after_request
+def record_request(response):
+    # Streamed bodies are timed up to their first byte; the rest is sent after this hook
+    metrics.observe_request(response, g.request_start)
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.stop()
+    print(f"Profiled {request.path}: {profiler.samples} samples every {profiler.interval * 1000:g} ms.")
+    profile = Response(profiler.collapsed(), mimetype='text/plain')
+    profile.headers['X-Profile-Samples'] = str(profiler.samples)
+    profile.headers['X-Profile-Status'] = str(response.status_code)
+    return profile
+
+@app.teardown_request
+def stop_profiler(error=None):
+    # Runs even when an unhandled exception skips record_request
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+def collect_caches():
+    state = data_state
+    caches = {'prediction': prediction_cache.stats()}
+    if state.rollup_engine is not None:
+        caches['rollups'] = state.rollup_engine.cache.stats()
+        caches['correlation'] = state.correlation_engine.cache.stats()
+        caches['anomalies'] = state.anomaly_detector.cache.stats()
+        caches['nearby_history'] = state.spatial_index.history_cache.stats()
+        caches['heatmap'] = state.grid_pyramid.cache.stats()
+    return metrics.cache_metrics(caches)
+
+metrics.registry.add_collector(collect_caches)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: request and phase latencies, load phases, caches and memory."""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 # --- Routes ---
 
@@ -60,37 +147,385 @@ def home():
 
 @app.route('/api/data')
 def api_data():
-    """Provides the main dataset to the frontend."""
-    if df.empty:
+    """
+    Provides the main dataset to the frontend; ?format=ndjson streams it in
+    record batches and ?format=columnar returns typed column buffers.
+    """
+    state = data_state
+    if state.df.empty:
         return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
         
     try:
-        data_to_send = df.copy()
-        if 'date_time' in data_to_send.columns:
-            # Convert datetime to string for JSON
-            data_to_send['date_time'] = data_to_send['date_time'].astype(str)
-        records = data_to_send.to_dict(orient='records')
-        return jsonify(records)
+        with phase('serialization'):
+            if request.args.get('format') == 'ndjson':
+                return make_ndjson_response(state.df, state.version, app.json.dumps, request)
+            if request.args.get('format') == 'columnar':
+                return make_payload_response(state.columnar_payload(), request)
+            return make_payload_response(state.payload(app.json.dumps), request)
     except Exception as e:
         print(f"Error in /api/data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/earthquake-data')
+def api_earthquake_data():
+    """Returns one sorted page of events matching the standard filters."""
+    state = data_state
+    df, query_index = state.df, state.query_index
+    if df.empty or query_index is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        filters = parse_filters(request.args)
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 10, type=int)
+        sort_by = request.args.get('sort', 'date_time')
+        order = request.args.get('order', 'desc')
+        if page < 1 or not 1 <= per_page <= 1000:
+            raise ValueError("'page' must be >= 1 and 'per_page' between 1 and 1000.")
+        if sort_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort_by}'. Choose one of: {', '.join(SORTABLE_COLUMNS)}.")
+        if order not in ('asc', 'desc'):
+            raise ValueError("'order' must be 'asc' or 'desc'.")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with phase('filtering'):
+            rows = query_index.select(filters)
+            page_rows = query_index.page(rows, sort_by, order == 'desc', (page - 1) * per_page, per_page)
+        page_df = df.iloc[page_rows]
+        fields = [f for f in request.args.get('fields', '').split(',') if f in df.columns]
+        if fields:
+            page_df = page_df[fields]
+        total = len(rows)
+        with phase('serialization'):
+            return jsonify({
+                'total': total,
+                'page': page,
+                'per_page': per_page,
+                'pages': (total + per_page - 1) // per_page,
+                'sort': sort_by,
+                'order': order,
+                'records': frame_to_records(page_df),
+            })
+    except Exception as e:
+        print(f"Error in /api/earthquake-data: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/heatmap')
+def api_heatmap():
+    """Returns pre-aggregated heatmap cells inside a bounding box at a zoom level."""
+    state = data_state
+    grid_pyramid = state.grid_pyramid
+    if grid_pyramid is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        filters = parse_filters(request.args)
+        zoom = grid_pyramid.clamp_zoom(request.args.get('zoom', 2, type=int))
+        bbox = parse_bbox(request.args.get('bbox'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Unfiltered views are served straight from the precomputed pyramid
+        with phase('filtering'):
+            rows = state.query_index.select(filters) if filters else None
+        with phase('aggregation'):
+            cells = grid_pyramid.query(zoom, bbox, rows)
+        with phase('serialization'):
+            return jsonify({
+                'zoom': zoom,
+                'cell_size': cell_size(zoom),
+                'total': int(cells['count'].sum()),
+                'cells': columns_to_lists(cells),
+            })
+    except Exception as e:
+        print(f"Error in /api/heatmap: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def spatial_records(df, rows, distances):
+    """Event records for spatial query results, each with its distance from the query point."""
+    records = frame_to_records(df.iloc[rows])
+    for record, distance in zip(records, distances.tolist()):
+        record['distance_km'] = distance
+    return records
+
+def parse_result_count(name, default):
+    count = request.args.get(name, default, type=int)
+    if not 1 <= count <= MAX_SPATIAL_RESULTS:
+        raise ValueError(f"'{name}' must be between 1 and {MAX_SPATIAL_RESULTS}.")
+    return count
+
+@app.route('/api/nearby')
+def api_nearby():
+    """Returns the events within a radius of a point, nearest first, for the standard filters."""
+    state = data_state
+    spatial_index = state.spatial_index
+    if spatial_index is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        filters = parse_filters(request.args)
+        lat, lon = parse_point(request.args)
+        radius_km = parse_radius(request.args)
+        limit = parse_result_count('limit', 500)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with phase('filtering'):
+            rows = state.query_index.select(filters) if filters else None
+        with phase('spatial_query'):
+            hits, distances = spatial_index.within(lat, lon, radius_km, rows)
+        with phase('aggregation'):
+            summary = spatial_index.summarize(hits, distances)
+        with phase('serialization'):
+            return jsonify({
+                'lat': lat,
+                'lon': lon,
+                'radius_km': radius_km,
+                'total': len(hits),
+                'summary': summary,
+                'events': spatial_records(state.df, hits[:limit], distances[:limit]),
+            })
+    except Exception as e:
+        print(f"Error in /api/nearby: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nearest')
+def api_nearest():
+    """Returns the k events nearest to a point, nearest first, for the standard filters."""
+    state = data_state
+    spatial_index = state.spatial_index
+    if spatial_index is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        filters = parse_filters(request.args)
+        lat, lon = parse_point(request.args)
+        k = parse_result_count('k', 10)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with phase('filtering'):
+            rows = state.query_index.select(filters) if filters else None
+        with phase('spatial_query'):
+            hits, distances = spatial_index.nearest(lat, lon, k, rows)
+        with phase('serialization'):
+            return jsonify({
+                'lat': lat,
+                'lon': lon,
+                'k': k,
+                'events': spatial_records(state.df, hits, distances),
+            })
+    except Exception as e:
+        print(f"Error in /api/nearest: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nearby/history')
+def api_nearby_history():
+    """Returns the cached summary of past events around a point (count, magnitudes, tsunami rate)."""
+    spatial_index = data_state.spatial_index
+    if spatial_index is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        lat, lon = parse_point(request.args)
+        radius_km = parse_radius(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with phase('aggregation'):
+            history = spatial_index.history(lat, lon, radius_km)
+        with phase('serialization'):
+            return jsonify(history)
+    except Exception as e:
+        print(f"Error in /api/nearby/history: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rollups')
+def api_rollups():
+    """Returns every dashboard chart aggregate for the standard filters."""
+    rollup_engine = data_state.rollup_engine
+    if rollup_engine is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Rollups filter and aggregate in one cached pass
+        with phase('aggregation'):
+            rollups = rollup_engine.get(filters)
+        with phase('serialization'):
+            return jsonify(rollups)
+    except Exception as e:
+        print(f"Error in /api/rollups: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/correlation')
+def api_correlation():
+    """Returns the Pearson or Spearman matrix of numeric columns for the standard filters."""
+    correlation_engine = data_state.correlation_engine
+    if correlation_engine is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        filters = parse_filters(request.args)
+        method, columns = correlation_engine.parse_request(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with phase('aggregation'):
+            matrix = correlation_engine.get(filters, columns, method)
+        with phase('serialization'):
+            return jsonify(matrix)
+    except Exception as e:
+        print(f"Error in /api/correlation: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/anomalies')
+def api_anomalies():
+    """Returns only the events flagged as anomalous on a numeric column, with their scores."""
+    state = data_state
+    anomaly_detector = state.anomaly_detector
+    if anomaly_detector is None:
+        return jsonify({'error': 'Data not available, DataFrame is empty.'}), 500
+
+    try:
+        filters = parse_filters(request.args)
+        options = anomaly_detector.parse_request(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with phase('filtering'):
+            rows = state.query_index.select(filters) if filters else None
+        with phase('aggregation'):
+            anomalies = anomaly_detector.get(filters, rows, options)
+        with phase('serialization'):
+            return jsonify(anomalies)
+    except Exception as e:
+        print(f"Error in /api/anomalies: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """Handles prediction requests from the frontend."""
+    state = model_state
+    model, model_columns, compiled_model = state.model, state.model_columns, state.compiled_model
     if not model or not model_columns:
         return jsonify({'success': False, 'error': 'Model not loaded on the server.'})
 
     try:
         data = request.get_json()
-        input_df = pd.DataFrame([data])[model_columns]
-        prediction_encoded = model.predict(input_df)
-        prediction_label = 'High Risk' if prediction_encoded[0] == 1 else 'Low Risk'
-        return jsonify({'success': True, 'prediction': prediction_label})
+        key, event = prediction_cache.normalize(data, model_columns, state.categorical)
+        prediction = prediction_cache.get(key)
+        if prediction is None:
+            transform, score = model_stages(compiled_model or model)
+            with phase('model_transform'):
+                # The compiled model gives the pipeline's output without building a DataFrame per request
+                X = transform(event if compiled_model is not None else pd.DataFrame([event])[model_columns])
+            with phase('model_predict'):
+                prediction = score(X)[0][0]
+            prediction_cache.put(key, prediction, state.version)
+        prediction_label = risk_label(prediction)
+        with phase('aggregation'):
+            nearby = nearby_history(event)
+        with phase('serialization'):
+            return jsonify({'success': True, 'prediction': prediction_label, 'nearby': nearby})
     except Exception as e:
         print(f"An error occurred during prediction: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+def nearby_history(event):
+    """Past events around a predicted event's location, or None when the data or coordinates are missing."""
+    spatial_index = data_state.spatial_index
+    try:
+        lat, lon = float(event['latitude']), float(event['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if spatial_index is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return spatial_index.history(lat, lon)
+
+def read_batch_events():
+    """Reads batch events from an uploaded CSV, a text/csv body, or a JSON array."""
+    upload = request.files.get('file')
+    if upload is not None:
+        return pd.read_csv(upload)
+    if request.mimetype == 'text/csv':
+        return pd.read_csv(io.BytesIO(request.get_data()))
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('events')
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ValueError('Expected a JSON array of event objects, {"events": [...]}, or a CSV upload.')
+    return pd.DataFrame.from_records(data)
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch_route():
+    """Scores many events in one request with vectorized, chunked inference."""
+    state = model_state
+    model, model_columns, compiled_model = state.model, state.model_columns, state.compiled_model
+    if not model or not model_columns:
+        return jsonify({'success': False, 'error': 'Model not loaded on the server.'})
+
+    try:
+        events = read_batch_events()
+        if len(events) > MAX_BATCH_ROWS:
+            raise ValueError(f"A batch may contain at most {MAX_BATCH_ROWS} events, got {len(events)}.")
+        events = events.reset_index(drop=True)
+        valid, errors = validate_events(events, model_columns, state.categorical)
+    except (ValueError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        labels, probabilities = predict_batch(compiled_model or model, valid[model_columns])
+        results = [None] * len(events)
+        for pos, label, probability in zip(valid.index, labels.tolist(), probabilities.tolist()):
+            results[pos] = {
+                'row': pos,
+                'prediction': risk_label(label),
+                'label': label,
+                'probability': None if probability != probability else probability,
+            }
+        for pos, message in errors.items():
+            results[pos] = {'row': pos, 'error': message}
+        with phase('serialization'):
+            return jsonify({
+                'success': True,
+                'count': len(events),
+                'scored': len(valid),
+                'failed': len(errors),
+                'predictions': results,
+            })
+    except Exception as e:
+        print(f"An error occurred during batch prediction: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/predict/cache')
+def predict_cache_stats():
+    """Reports prediction cache size, hit/miss counters and the model version it serves."""
+    return jsonify(prediction_cache.stats())
+
+@app.route('/api/version')
+def api_version():
+    """Reports the data and model versions this worker is serving."""
+    return jsonify({
+        'pid': os.getpid(),
+        'data': data_state.info(),
+        'model': model_state.info(),
+        'reload_interval': reloader.interval,
+    })
+
 # --- Main Execution ---
 if __name__ == '__main__':
     load_essentials()
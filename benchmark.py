@@ -0,0 +1,462 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# --- Benchmark Suite ---
+#
+# `generate` writes synthetic raw and cleaned catalogues shaped like the USGS
+# export, `run` times cleaning, app start-up and memory, /api/data and
+# /api/predict under concurrent load, and training, and `compare` flags
+# regressions against a saved results file. Every measurement runs in a fresh
+# interpreter so start-up times and peak memory are not polluted by earlier ones.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SEED_PATH = os.path.join(REPO_DIR, 'data', 'earthquake_1995-2023.csv')
+MODELS_DIR = os.path.join(REPO_DIR, 'models')
+BENCH_DIR = os.path.join(REPO_DIR, 'data', 'benchmark')
+
+RESULTS_FORMAT = 1
+
+# Rows generated and cleaned per block, so 10M-row catalogues never sit in memory whole
+GENERATE_CHUNK_ROWS = 500_000
+
+# The record JSON of /api/data is ~740 bytes per event; beyond this it no longer fits in memory
+MAX_JSON_PAYLOAD_ROWS = 2_000_000
+
+# Training fits three models per fold; larger catalogues are skipped unless asked for
+MAX_TRAINING_ROWS = 1_000_000
+
+# Relative change in the wrong direction reported as a regression by `compare`
+DEFAULT_THRESHOLD = 0.10
+
+DIRECTIONS = [('_per_second', 1), ('_seconds', -1), ('_ms', -1), ('_bytes', -1)]
+
+# Offsets used for the synthetic titles ("M 6.5 - 42 km W of Sola, Vanuatu")
+COMPASS = np.array(['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'])
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1m' -> 1000000, '250000' -> 250000."""
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    try:
+        rows = int(float(text[:-1] if scale > 1 else text) * scale)
+    except ValueError:
+        raise ValueError(f"Invalid size '{text}'. Use a row count such as 10000, 10k or 1m.")
+    if rows <= 0:
+        raise ValueError(f"Size must be positive, got '{text}'.")
+    return rows
+
+
+def size_label(rows):
+    for scale, suffix in ((1_000_000, 'm'), (1_000, 'k')):
+        if rows >= scale and rows % scale == 0:
+            return f'{rows // scale}{suffix}'
+    return str(rows)
+
+
+# --- Synthetic Catalogues ---
+
+def synthetic_raw_chunk(seed_frame, rows, rng):
+    """
+    `rows` raw events resampled from the real catalogue: categorical fields and
+    place names are drawn with their observed frequencies, magnitudes, depths
+    and coordinates are jittered, and times are spread over 1995-2023.
+    """
+    sample = seed_frame.iloc[rng.integers(0, len(seed_frame), rows)].reset_index(drop=True)
+    low, high = seed_frame['magnitude'].min(), seed_frame['magnitude'].max()
+    magnitude = np.clip(np.round(sample['magnitude'].to_numpy() + rng.normal(0, 0.1, rows), 1), low, high)
+    sample['magnitude'] = magnitude
+    sample['depth'] = np.round(sample['depth'].to_numpy() * rng.lognormal(0, 0.1, rows), 3)
+    sample['latitude'] = np.round(np.clip(sample['latitude'].to_numpy() + rng.normal(0, 0.2, rows), -90, 90), 4)
+    sample['longitude'] = np.round((sample['longitude'].to_numpy() + rng.normal(0, 0.2, rows) + 180) % 360 - 180, 4)
+
+    start = pd.Timestamp('1995-01-01').value // 60_000_000_000
+    end = pd.Timestamp('2023-12-31 23:59').value // 60_000_000_000
+    minutes = rng.integers(start, end, rows)
+    sample['date_time'] = pd.to_datetime(minutes, unit='m').strftime('%d-%m-%Y %H:%M')
+
+    offsets = pd.Series(rng.integers(1, 200, rows).astype(str)) + ' km ' + COMPASS[rng.integers(0, len(COMPASS), rows)] + ' of '
+    place = sample['location'].fillna(sample['country']).fillna('the ' + sample['net'].str.upper() + ' network region')
+    sample['title'] = 'M ' + pd.Series(magnitude).map('{:.1f}'.format) + ' - ' + offsets + place
+    return sample[seed_frame.columns]
+
+
+def generate_catalogues(rows, out_dir, seed=42, seed_path=SEED_PATH):
+    """
+    Write raw_<size>.csv and cleaned_<size>.csv to `out_dir`; the cleaned file is
+    the raw one passed through the cleaning pipeline chunk by chunk, so it has
+    exactly the columns the app loads. Existing files of the same size and seed
+    are reused. Returns (raw path, cleaned path).
+    """
+    from data_cleaning import clean_chunk
+
+    os.makedirs(out_dir, exist_ok=True)
+    label = f'{size_label(rows)}_seed{seed}'
+    raw_path = os.path.join(out_dir, f'raw_{label}.csv')
+    cleaned_path = os.path.join(out_dir, f'cleaned_{label}.csv')
+    if os.path.exists(raw_path) and os.path.exists(cleaned_path):
+        return raw_path, cleaned_path
+
+    seed_frame = pd.read_csv(seed_path)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    written = 0
+    for first in range(0, rows, GENERATE_CHUNK_ROWS):
+        raw = synthetic_raw_chunk(seed_frame, min(GENERATE_CHUNK_ROWS, rows - first), rng)
+        mode, header = ('w', True) if first == 0 else ('a', False)
+        raw.to_csv(raw_path + '.tmp', mode=mode, header=header, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cleaned = clean_chunk(raw.copy())
+        cleaned.to_csv(cleaned_path + '.tmp', mode=mode, header=header, index=False)
+        written += len(raw)
+        print(f"Generated {written}/{rows} rows...")
+    # Publish both only once complete, so an interrupted run is never reused
+    os.replace(raw_path + '.tmp', raw_path)
+    os.replace(cleaned_path + '.tmp', cleaned_path)
+    print(f"Wrote {raw_path} and {cleaned_path} in {time.perf_counter() - start:.1f}s.")
+    return raw_path, cleaned_path
+
+
+# --- Measurements (each runs in its own interpreter) ---
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure_cleaning(raw_path, chunksize):
+    from data_cleaning import clean_earthquake_data_streaming
+
+    output = os.path.join(os.getcwd(), 'cleaned.csv')
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = clean_earthquake_data_streaming(raw_path, output, chunksize=chunksize)
+    seconds = time.perf_counter() - start
+    rows = sum(1 for _ in open(raw_path, 'rb')) - 1
+    return {
+        'rows': rows,
+        'cleaned_rows': int(summary.total),
+        'chunksize': chunksize,
+        'wall_seconds': seconds,
+        'rows_per_second': rows / seconds,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def load_test(app, send, n_requests, concurrency):
+    """Send `n_requests` through `concurrency` threads, each with its own test client."""
+    shares = [n_requests // concurrency + (i < n_requests % concurrency) for i in range(concurrency)]
+
+    def worker(worker_id, count):
+        client = app.test_client()
+        latencies, errors = [], 0
+        for i in range(count):
+            start = time.perf_counter()
+            response = send(client, worker_id * n_requests + i)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency), shares))
+    seconds = time.perf_counter() - start
+    latencies = np.array([value for values, _ in results for value in values]) * 1000
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'errors': sum(errors for _, errors in results),
+        'wall_seconds': seconds,
+        'requests_per_second': n_requests / seconds,
+        'latency_mean_ms': float(latencies.mean()),
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def measure_app(n_requests, concurrency, serve):
+    """Import the app from the current directory's data/ and models/, then optionally load-test it."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+    import metrics
+
+    result = {
+        'rows': len(app_module.data_state.df),
+        'import_seconds': time.perf_counter() - start,
+        'rss_after_start_bytes': metrics.resident_memory_bytes(),
+        'load_phases': {f'{name}_seconds': seconds for (name,), seconds in metrics.LOAD_PHASE_SECONDS.samples().items()},
+    }
+    if not serve:
+        result['peak_rss_bytes'] = peak_rss_bytes()
+        return result
+
+    app = app_module.app
+    client = app.test_client()
+    endpoints = {}
+    formats = ['columnar', 'ndjson'] + (['json'] if result['rows'] <= MAX_JSON_PAYLOAD_ROWS else [])
+    for data_format in formats:
+        url = f'/api/data?format={data_format}'
+        start = time.perf_counter()
+        client.get(url, headers={'Accept-Encoding': 'gzip'}).get_data()
+        first = time.perf_counter() - start
+        # The cached payloads are cheap to serve; NDJSON re-encodes every request, so one stream is timed
+        count, clients = (n_requests, concurrency) if data_format != 'ndjson' else (1, 1)
+        endpoints[url] = load_test(app, lambda c, i, url=url: c.get(url, headers={'Accept-Encoding': 'gzip'}),
+                                   count, clients)
+        endpoints[url]['first_request_seconds'] = first
+
+    model_columns = app_module.model_state.model_columns
+    if model_columns:
+        sample = app_module.data_state.df.sample(min(1000, result['rows']), random_state=0)
+        events = [{col: (value.item() if hasattr(value, 'item') else value) for col, value in row.items()}
+                  for row in sample[model_columns].astype(object).to_dict('records')]
+        endpoints['/api/predict'] = load_test(app, lambda c, i: c.post('/api/predict', json=events[i % len(events)]),
+                                              n_requests, concurrency)
+    result['endpoints'] = endpoints
+    result['peak_rss_bytes'] = peak_rss_bytes()
+    return result
+
+
+def measure_training(cleaned_path, n_splits):
+    import prediction
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        prediction.main(cleaned_path, os.path.join(os.getcwd(), 'models'), n_splits=n_splits)
+    seconds = time.perf_counter() - start
+    return {'n_splits': n_splits, 'wall_seconds': seconds, 'peak_rss_bytes': peak_rss_bytes()}
+
+
+def run_child(task, workdir, *args, env=None):
+    """Run one measurement in a fresh interpreter inside `workdir` and return its JSON result."""
+    os.makedirs(workdir, exist_ok=True)
+    child_env = dict(os.environ, PYTHONPATH=REPO_DIR, RELOAD_INTERVAL='0', **(env or {}))
+    command = [sys.executable, os.path.abspath(__file__), '_measure', task] + [str(arg) for arg in args]
+    completed = subprocess.run(command, cwd=workdir, env=child_env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark '{task}' failed:\n{completed.stderr[-4000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def prepare_app_dir(workdir, cleaned_path, models_dir):
+    """A directory laid out like the project root, pointing at the synthetic dataset."""
+    data_dir = os.path.join(workdir, 'data')
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(data_dir)
+    os.symlink(os.path.abspath(cleaned_path), os.path.join(data_dir, 'earthquake_cleaned.csv'))
+    os.symlink(os.path.abspath(models_dir), os.path.join(workdir, 'models'))
+
+
+def run_size(rows, args):
+    print(f"\n=== {size_label(rows)} rows ===")
+    raw_path, cleaned_path = generate_catalogues(rows, args.data_dir, seed=args.seed)
+    workdir = os.path.join(args.data_dir, f'run_{size_label(rows)}')
+    results = {}
+
+    if 'cleaning' in args.suites:
+        results['cleaning'] = run_child('clean', os.path.join(workdir, 'clean'), os.path.abspath(raw_path), args.chunksize)
+        print(f"Cleaning: {results['cleaning']['rows_per_second']:,.0f} rows/s")
+
+    if 'startup' in args.suites or 'api' in args.suites:
+        app_dir = os.path.join(workdir, 'app')
+        prepare_app_dir(app_dir, cleaned_path, args.models_dir)
+        # First start parses the CSV and writes the snapshot; later starts map the snapshot
+        startup = {'csv': run_child('app', app_dir, 0, 1, 0)}
+        serve = 'api' in args.suites
+        # Cache disabled so /api/predict measures the model rather than dictionary hits
+        snapshot = run_child('app', app_dir, args.requests, args.concurrency, int(serve),
+                             env={'PREDICTION_CACHE_SIZE': '0'})
+        endpoints = snapshot.pop('endpoints', None)
+        startup['snapshot'] = snapshot
+        results['startup'] = startup
+        print(f"Start-up: {startup['csv']['import_seconds']:.2f}s from CSV, "
+              f"{snapshot['import_seconds']:.2f}s from snapshot, {snapshot['rss_after_start_bytes'] / 1e6:.0f} MB RSS")
+        if endpoints is not None:
+            results['api'] = endpoints
+            for url, stats in endpoints.items():
+                print(f"{url}: {stats['requests_per_second']:,.0f} req/s, p50 {stats['latency_p50_ms']:.2f} ms, "
+                      f"p99 {stats['latency_p99_ms']:.2f} ms")
+
+    if 'training' in args.suites:
+        if rows > args.max_training_rows:
+            results['training'] = {'skipped': f'more than {args.max_training_rows} rows (see --max-training-rows)'}
+        else:
+            results['training'] = run_child('train', os.path.join(workdir, 'train'), os.path.abspath(cleaned_path), args.folds)
+            print(f"Training: {results['training']['wall_seconds']:.1f}s")
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+# --- Comparison ---
+
+def flatten(results, prefix=''):
+    """{'10k': {'cleaning': {'wall_seconds': 1.0}}} -> {'10k.cleaning.wall_seconds': 1.0}."""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def direction(metric):
+    """+1 when higher is better, -1 when lower is better, None for counts and settings."""
+    for suffix, sign in DIRECTIONS:
+        if metric.endswith(suffix):
+            return sign
+    return None
+
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Returns (regressions, improvements) as lists of (metric, baseline, current, relative change)."""
+    regressions, improvements = [], []
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    for metric in sorted(old.keys() & new.keys()):
+        sign = direction(metric)
+        if sign is None or old[metric] == 0:
+            continue
+        change = (new[metric] - old[metric]) / abs(old[metric])
+        if sign * change < -threshold:
+            regressions.append((metric, old[metric], new[metric], change))
+        elif sign * change > threshold:
+            improvements.append((metric, old[metric], new[metric], change))
+    return regressions, improvements
+
+
+def print_comparison(regressions, improvements, threshold):
+    print(f"\n--- Comparison against baseline (threshold {threshold:.0%}) ---")
+    for title, rows in (('Regressions', regressions), ('Improvements', improvements)):
+        print(f"{title}: {len(rows)}")
+        for metric, old, new, change in rows:
+            print(f"  {metric}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+
+
+def compare_files(results_path, baseline_path, threshold):
+    with open(results_path) as f:
+        current = json.load(f)
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions, improvements = compare_results(current, baseline, threshold)
+    print_comparison(regressions, improvements, threshold)
+    return 1 if regressions else 0
+
+
+# --- Command Line ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark cleaning, start-up, the API and training on synthetic catalogues.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='Write synthetic raw and cleaned catalogues')
+    generate.add_argument('--sizes', default='10k', help='Comma-separated row counts, e.g. 10k,1m,10m')
+    generate.add_argument('--data-dir', default=BENCH_DIR, help='Where catalogues and scratch files are written')
+    generate.add_argument('--seed', type=int, default=42, help='Random seed of the generator')
+
+    run = commands.add_parser('run', help='Run the benchmarks and write a results file')
+    run.add_argument('--sizes', default='10k', help='Comma-separated row counts, e.g. 10k,1m,10m')
+    run.add_argument('--suites', default='cleaning,startup,api,training',
+                     help='Any of cleaning, startup, api, training')
+    run.add_argument('--data-dir', default=BENCH_DIR, help='Where catalogues and scratch files are written')
+    run.add_argument('--seed', type=int, default=42, help='Random seed of the generator')
+    run.add_argument('--models-dir', default=MODELS_DIR, help='Model served during the start-up and API benchmarks')
+    run.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    run.add_argument('--concurrency', type=int, default=8, help='Concurrent client threads')
+    run.add_argument('--chunksize', type=int, default=100_000, help='Rows per chunk for the cleaning benchmark')
+    run.add_argument('--folds', type=int, default=3, help='Cross-validation folds for the training benchmark')
+    run.add_argument('--max-training-rows', type=int, default=MAX_TRAINING_ROWS,
+                     help='Skip training on larger catalogues')
+    run.add_argument('--output', default='benchmark_results.json', help='Results file')
+    run.add_argument('--baseline', help='Compare against this results file and exit 1 on regressions')
+    run.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Relative change counted as a regression')
+
+    compare = commands.add_parser('compare', help='Compare a results file against a baseline')
+    compare.add_argument('results', help='Results file of the current run')
+    compare.add_argument('baseline', help='Saved baseline results file')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Relative change counted as a regression')
+
+    measure = commands.add_parser('_measure')
+    measure.add_argument('task', choices=['clean', 'app', 'train'])
+    measure.add_argument('params', nargs='*')
+
+    args = parser.parse_args(argv)
+
+    if args.command == '_measure':
+        params = args.params
+        if args.task == 'clean':
+            result = measure_cleaning(params[0], int(params[1]))
+        elif args.task == 'app':
+            result = measure_app(int(params[0]), int(params[1]), params[2] == '1')
+        else:
+            result = measure_training(params[0], int(params[1]))
+        print(json.dumps(result))
+        return 0
+
+    if args.command == 'compare':
+        return compare_files(args.results, args.baseline, args.threshold)
+
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(',')]
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.command == 'generate':
+        for rows in sizes:
+            generate_catalogues(rows, args.data_dir, seed=args.seed)
+        return 0
+
+    args.suites = {suite.strip() for suite in args.suites.split(',')}
+    unknown = args.suites - {'cleaning', 'startup', 'api', 'training'}
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}.")
+    results = {
+        'format': RESULTS_FORMAT,
+        'created': pd.Timestamp.now(tz='UTC').isoformat(),
+        'environment': environment(),
+        'settings': {'seed': args.seed, 'requests': args.requests, 'concurrency': args.concurrency,
+                     'chunksize': args.chunksize, 'folds': args.folds},
+        'results': {size_label(rows): run_size(rows, args) for rows in sizes},
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        return compare_files(args.output, args.baseline, args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,12 +3,12 @@ import numpy as np
 import re
 from datetime import datetime
 import json
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+import os
+import sys
 
-# Initialize Nominatim geocoder with a user agent
-geolocator = Nominatim(user_agent="earthquake_app")
-geocode = RateLimiter(geolocator.reverse, min_delay_seconds=1)
+# geocoding.py lives in the project root, one level above this script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from geocoding import build_geocoder
 
 def clean_data(df):
     # ... existing code ...
@@ -20,43 +20,12 @@ def clean_data(df):
     print(f"Found {unknown_count_before} rows with Unknown location.")
 
     if unknown_count_before > 0:
-        # Filter DataFrame to only include rows needing geocoding
-        df_to_geocode = df[unknown_locations_mask].copy()
+        # Resolve every unknown row in one bulk call (offline gazetteer by default)
+        known = df.loc[~unknown_locations_mask & df['location'].notna(), ['location', 'latitude', 'longitude']]
+        geocoder = build_geocoder(known_locations=known)
+        names = geocoder.reverse(df.loc[unknown_locations_mask, 'latitude'], df.loc[unknown_locations_mask, 'longitude'])
+        df.loc[unknown_locations_mask, 'location'] = pd.Series(names).fillna('Unknown').to_numpy()
 
-        locations = []
-        # Iterate through the filtered DataFrame
-        for index, row in df_to_geocode.iterrows():
-            lat = row['latitude']
-            lon = row['longitude']
-            location_name = 'Unknown'
-            
-            # Ensure lat/lon are valid numbers before attempting to geocode
-            if pd.notnull(lat) and pd.notnull(lon) and isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
-                try:
-                    # Use the RateLimiter wrapper for geocoding
-                    # We reverse geocode (coords to address)
-                    location = geocode(f"{lat}, {lon}", language='en')
-                    if location and location.address:
-                         # Use the full address or try to extract a relevant part
-                         location_name = location.address
-                         print(f"Geocoded {lat},{lon} to {location_name}")
-                    else:
-                        print(f"Could not geocode {lat},{lon}")
-
-                except Exception as e:
-                    print(f"Error geocoding {lat},{lon}: {e}")
-                    # Keep location_name as 'Unknown' or handle error
-                    location_name = 'Unknown'
-            else:
-                 print(f"Invalid lat/lon for geocoding at index {index}: {lat}, {lon}")
-                 location_name = 'Unknown'
-                 
-            locations.append({'index': index, 'location': location_name})
-
-        # Update the original DataFrame with geocoded locations
-        for loc_info in locations:
-             df.loc[loc_info['index'], 'location'] = loc_info['location']
-             
         unknown_count_after = (df['location'] == 'Unknown').sum()
         print(f"Finished geocoding. {unknown_count_before - unknown_count_after} locations updated, {unknown_count_after} remain Unknown.")
     # ------------------------------------------------------------------
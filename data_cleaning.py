@@ -1,42 +1,54 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import re
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
-
-# Initialize Nominatim geocoder with a user agent and rate limiter
-geolocator = Nominatim(user_agent="earthquake_app_geocoding")
-# Rate limit requests to 1 second between calls to comply with Nominatim policy
-geocode = RateLimiter(geolocator.reverse, min_delay_seconds=1)
-
-def extract_magnitude_from_title(title):
-    """Extract magnitude from title using regex"""
-    match = re.search(r'M\s*(\d+\.?\d*)', title)
-    return float(match.group(1)) if match else np.nan
-
-def extract_location_details(location):
-    """Extract city and country from location string"""
-    if pd.isna(location):
-        return pd.Series([np.nan, np.nan])
-    
-    parts = location.split(',')
-    city = parts[0].strip() if len(parts) > 0 else np.nan
-    country = parts[-1].strip() if len(parts) > 1 else np.nan
-    return pd.Series([city, country])
+import sys
+from collections import Counter
+
+from dataset import apply_dtypes, write_snapshot
+from geocoding import build_geocoder
+
+# Free-text columns; read_csv types a chunk in which one of them is entirely blank as float64
+TEXT_COLUMNS = ['title', 'alert', 'net', 'magType', 'location', 'continent', 'country']
+
+def as_text(values):
+    """A column as text, so `.str` works even when every value in it is missing."""
+    return values if pd.api.types.is_string_dtype(values.dtype) else values.astype(object)
+
+def extract_magnitude_from_title(titles):
+    """Extract magnitudes from a Series of titles using a vectorized regex"""
+    return titles.str.extract(r'M\s*(\d+\.?\d*)', expand=False).astype(float)
+
+def extract_location_details(locations):
+    """Extract city and country columns from a Series of location strings"""
+    # Catalogues repeat the same few thousand place names, so parse each distinct one once
+    codes, uniques = pd.factorize(locations)
+    if len(uniques) == 0:
+        return pd.DataFrame({0: np.nan, 1: np.nan}, index=locations.index)
+    uniques = pd.Series(uniques, dtype=object)
+    # City is the text before the first comma; country is after the last one (if any)
+    city = uniques.str.partition(',')[0].str.strip()
+    parts = uniques.str.rpartition(',')
+    country = parts[2].str.strip().where(parts[1] == ',')
+    city = city.to_numpy(dtype=object)[codes]
+    country = country.to_numpy(dtype=object)[codes]
+    missing = codes < 0
+    city[missing] = country[missing] = np.nan
+    return pd.DataFrame({0: city, 1: country}, index=locations.index)
 
 def calculate_seismic_energy(magnitude):
     """Calculate seismic energy in joules using Gutenberg-Richter relationship"""
     return 10 ** (1.5 * magnitude + 4.8)
 
-def clean_earthquake_data(input_file, output_file):
+def clean_chunk(df, geocoder=None):
     """
-    Clean and prepare earthquake dataset for analysis and visualization
-    with advanced preprocessing techniques
+    Clean one block of raw USGS rows. Every step is row-local and vectorized,
+    so the same function serves the in-memory and the streaming pipeline.
+    Pass a shared `geocoder` when cleaning many chunks of one file.
     """
-    # Read the dataset
-    df = pd.read_csv(input_file)
-    
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            df[col] = as_text(df[col])
+
     # Convert date_time to datetime
     df['date_time'] = pd.to_datetime(df['date_time'], format='%d-%m-%Y %H:%M')
     
@@ -49,7 +61,7 @@ def clean_earthquake_data(input_file, output_file):
     df['quarter'] = df['date_time'].dt.quarter
     
     # Extract magnitude from title as a backup
-    df['magnitude_from_title'] = df['title'].apply(extract_magnitude_from_title)
+    df['magnitude_from_title'] = extract_magnitude_from_title(df['title'])
     
     # Clean magnitude data - use title magnitude if main magnitude is missing
     df['magnitude'] = pd.to_numeric(df['magnitude'], errors='coerce')
@@ -63,7 +75,7 @@ def clean_earthquake_data(input_file, output_file):
     df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
     
     # Extract location details
-    location_details = df['location'].apply(extract_location_details)
+    location_details = extract_location_details(df['location'])
     df['city'] = location_details[0]
     df['location_country'] = location_details[1]
     
@@ -74,9 +86,9 @@ def clean_earthquake_data(input_file, output_file):
     df['alert'] = df['alert'].fillna('unknown')
     
     # Clean country data - use location_country if country is missing
-    df['country'] = df['country'].fillna(df['location_country'])
+    df['country'] = as_text(df['country'].fillna(df['location_country']))
     # Ensure 'location' is treated case-insensitively for 'unknown'
-    df['country'] = df['country'].replace('unknown', 'Unknown', regex=True) # Replace lowercase 'unknown' first
+    df['country'] = df['country'].str.replace('unknown', 'Unknown', regex=False) # Replace lowercase 'unknown' first
     df['country'] = df['country'].fillna('Unknown') # Fill remaining NaNs
     
     # Clean continent data
@@ -90,42 +102,14 @@ def clean_earthquake_data(input_file, output_file):
     print(f"Found {unknown_count_before} rows with Unknown location.")
 
     if unknown_count_before > 0:
-        # Filter DataFrame to only include rows needing geocoding
-        df_to_geocode = df[unknown_locations_mask].copy()
-
-        locations_update = []
-        # Use iterrows is generally discouraged for large dataframes due to performance,
-        # but for geocoding external API calls, it's often simpler to handle row by row.
-        # For very large datasets, consider batch geocoding if the service supports it.
-        for index, row in df_to_geocode.iterrows():
-            lat = row['latitude']
-            lon = row['longitude']
-            location_name = 'Unknown' # Default if geocoding fails
-            
-            # Ensure lat/lon are valid numbers before attempting to geocode
-            if pd.notnull(lat) and pd.notnull(lon) and isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
-                try:
-                    # Use the RateLimiter wrapper for geocoding (coords to address)
-                    location = geocode(f"{lat}, {lon}", language='en')
-                    if location and location.address:
-                         # Use the full address returned by the geocoder
-                         location_name = location.address
-                         # print(f"Geocoded {lat},{lon} to {location_name}") # Optional: print each geocoded location
-                    # else: print(f"Could not geocode {lat},{lon}") # Optional: print failures
-
-                except Exception as e:
-                    # print(f"Error geocoding {lat},{lon}: {e}") # Optional: print errors
-                    location_name = 'Unknown' # Keep as Unknown on error
-            # else: print(f"Invalid lat/lon for geocoding at index {index}: {lat}, {lon}") # Optional: print invalid coords
-                 
-            # Store update information
-            locations_update.append({'index': index, 'location': location_name})
-
-        # Update the original DataFrame with geocoded locations
-        for loc_info in locations_update:
-             # Use .loc for label-based indexing
-             df.loc[loc_info['index'], 'location'] = loc_info['location']
-             
+        # Resolve every unknown row in one bulk call; the backend (offline gazetteer
+        # by default, Nominatim optionally) is chosen in geocoding.build_geocoder
+        if geocoder is None:
+            known = df.loc[~unknown_locations_mask & df['location'].notna(), ['location', 'latitude', 'longitude']]
+            geocoder = build_geocoder(known_locations=known)
+        names = geocoder.reverse(df.loc[unknown_locations_mask, 'latitude'], df.loc[unknown_locations_mask, 'longitude'])
+        df.loc[unknown_locations_mask, 'location'] = pd.Series(names).fillna('Unknown').to_numpy()
+
         unknown_count_after = (df['location'].str.lower() == 'unknown').sum() # Check case-insensitively again
         print(f"Finished geocoding. {unknown_count_before - unknown_count_after} locations updated, {unknown_count_after} remain Unknown.")
     # ------------------------------------------------------------------
@@ -145,7 +129,7 @@ def clean_earthquake_data(input_file, output_file):
     )
     
     # Calculate seismic energy
-    df['seismic_energy'] = df['magnitude'].apply(calculate_seismic_energy)
+    df['seismic_energy'] = calculate_seismic_energy(df['magnitude'])
     
     # Create alert level categories
     df['alert_level'] = pd.Categorical(
@@ -178,36 +162,182 @@ def clean_earthquake_data(input_file, output_file):
     df = df.dropna(subset=essential_columns)
     
     # Calculate additional features
-    df['magnitude_depth_ratio'] = df.apply(lambda row: row['magnitude'] / row['depth'] if row['depth'] != 0 else 0, axis=1)
+    depth = df['depth'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['magnitude_depth_ratio'] = np.where(depth != 0, df['magnitude'].to_numpy() / depth, 0.0)
     df['is_coastal'] = df['depth'] < 50
     
+    return df
+
+class CleaningSummary:
+    """
+    Dataset statistics accumulated chunk by chunk. Counts, sums, extrema and
+    distinct sets merge exactly, so streaming reports the same numbers as one pass.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.date_min = self.date_max = None
+        self.magnitude_min = self.magnitude_max = None
+        self.depth_min = self.depth_max = None
+        self.tsunamis = 0
+        self.countries = set()
+        self.continents = set()
+        self.magnitude_counts = Counter()
+        self.depth_counts = Counter()
+        self.alert_counts = Counter()
+        self.missing = Counter()
+
+    @staticmethod
+    def _merge_min(current, value):
+        return value if current is None or (pd.notna(value) and value < current) else current
+
+    @staticmethod
+    def _merge_max(current, value):
+        return value if current is None or (pd.notna(value) and value > current) else current
+
+    def update(self, df):
+        """Fold one cleaned chunk into the running statistics."""
+        if df.empty:
+            return self
+        self.total += len(df)
+        self.date_min = self._merge_min(self.date_min, df['date_time'].min())
+        self.date_max = self._merge_max(self.date_max, df['date_time'].max())
+        self.magnitude_min = self._merge_min(self.magnitude_min, df['magnitude'].min())
+        self.magnitude_max = self._merge_max(self.magnitude_max, df['magnitude'].max())
+        self.depth_min = self._merge_min(self.depth_min, df['depth'].min())
+        self.depth_max = self._merge_max(self.depth_max, df['depth'].max())
+        self.tsunamis += df['tsunami'].sum()
+        self.countries.update(df['country'].dropna().unique())
+        self.continents.update(df['continent'].dropna().unique())
+        self.magnitude_counts.update(df['magnitude_category'].astype(str).value_counts().to_dict())
+        self.depth_counts.update(df['depth_category'].astype(str).value_counts().to_dict())
+        self.alert_counts.update(df['alert_level'].astype(str).value_counts().to_dict())
+        self.missing.update(df.isnull().sum().to_dict())
+        return self
+
+    def to_dict(self):
+        """JSON-ready form, so the statistics can be stored and updated on later runs."""
+        def plain(value):
+            if value is None or pd.isna(value):
+                return None
+            return value.isoformat() if isinstance(value, pd.Timestamp) else float(value)
+
+        return {
+            'total': int(self.total),
+            'date_min': plain(self.date_min), 'date_max': plain(self.date_max),
+            'magnitude_min': plain(self.magnitude_min), 'magnitude_max': plain(self.magnitude_max),
+            'depth_min': plain(self.depth_min), 'depth_max': plain(self.depth_max),
+            'tsunamis': int(self.tsunamis),
+            'countries': sorted(map(str, self.countries)),
+            'continents': sorted(map(str, self.continents)),
+            'magnitude_counts': {k: int(v) for k, v in self.magnitude_counts.items()},
+            'depth_counts': {k: int(v) for k, v in self.depth_counts.items()},
+            'alert_counts': {k: int(v) for k, v in self.alert_counts.items()},
+            'missing': {k: int(v) for k, v in self.missing.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.total = data['total']
+        summary.date_min = pd.Timestamp(data['date_min']) if data['date_min'] else None
+        summary.date_max = pd.Timestamp(data['date_max']) if data['date_max'] else None
+        for name in ('magnitude_min', 'magnitude_max', 'depth_min', 'depth_max', 'tsunamis'):
+            setattr(summary, name, data[name])
+        summary.countries = set(data['countries'])
+        summary.continents = set(data['continents'])
+        for name in ('magnitude_counts', 'depth_counts', 'alert_counts', 'missing'):
+            setattr(summary, name, Counter(data[name]))
+        return summary
+
+    @staticmethod
+    def _distribution(counts, name):
+        series = pd.Series(counts, name='count', dtype='int64').sort_index()
+        series.index.name = name
+        return series
+
+    def report(self):
+        # Print dataset information
+        print("\nDataset Information:")
+        print("-" * 40)
+        print(f"Total number of earthquakes: {self.total}")
+        print(f"Date range: {self.date_min} to {self.date_max}")
+        print(f"Magnitude range: {self.magnitude_min:.1f} to {self.magnitude_max:.1f}")
+        print(f"Depth range: {self.depth_min:.1f} to {self.depth_max:.1f} km")
+        print(f"Number of tsunamis: {self.tsunamis}")
+        print(f"Number of countries affected: {len(self.countries)}")
+        print(f"Number of continents affected: {len(self.continents)}")
+        print("\nMagnitude Distribution:")
+        print(self._distribution(self.magnitude_counts, 'magnitude_category'))
+        print("\nDepth Distribution:")
+        print(self._distribution(self.depth_counts, 'depth_category'))
+        print("\nAlert Level Distribution:")
+        print(self._distribution(self.alert_counts, 'alert_level'))
+        print("\nMissing values after cleaning:")
+        missing = pd.Series(self.missing, dtype='int64')
+        print(missing[missing > 0])
+
+def clean_earthquake_data(input_file, output_file):
+    """
+    Clean and prepare earthquake dataset for analysis and visualization
+    with advanced preprocessing techniques
+    """
+    # Read the dataset
+    df = clean_chunk(pd.read_csv(input_file))
+
     # Save cleaned dataset
     df.to_csv(output_file, index=False)
-    
-    # Print dataset information
-    print("\nDataset Information:")
-    print("-" * 40)
-    print(f"Total number of earthquakes: {len(df)}")
-    print(f"Date range: {df['date_time'].min()} to {df['date_time'].max()}")
-    print(f"Magnitude range: {df['magnitude'].min():.1f} to {df['magnitude'].max():.1f}")
-    print(f"Depth range: {df['depth'].min():.1f} to {df['depth'].max():.1f} km")
-    print(f"Number of tsunamis: {df['tsunami'].sum()}")
-    print(f"Number of countries affected: {df['country'].nunique()}")
-    print(f"Number of continents affected: {df['continent'].nunique()}")
-    print("\nMagnitude Distribution:")
-    print(df['magnitude_category'].astype(str).value_counts().sort_index())
-    print("\nDepth Distribution:")
-    print(df['depth_category'].astype(str).value_counts().sort_index())
-    print("\nAlert Level Distribution:")
-    print(df['alert_level'].astype(str).value_counts().sort_index())
-    print("\nMissing values after cleaning:")
-    print(df.isnull().sum()[df.isnull().sum() > 0])
-    
+
+    # Write the typed binary snapshot the app loads at startup, parsed back from the
+    # CSV so both files describe exactly the same values
+    write_snapshot(apply_dtypes(pd.read_csv(output_file)), output_file)
+
+    CleaningSummary().update(df).report()
+
     return df
 
+def collect_known_locations(input_file, chunksize):
+    """Distinct named locations in a raw CSV, read in chunks, for the offline geocoder."""
+    known = []
+    for chunk in pd.read_csv(input_file, usecols=['location', 'latitude', 'longitude'], chunksize=chunksize):
+        chunk = chunk.dropna()
+        chunk = chunk[as_text(chunk['location']).str.lower() != 'unknown']
+        known.append(chunk.round({'latitude': 3, 'longitude': 3}).drop_duplicates())
+    if not known:
+        return None
+    return pd.concat(known, ignore_index=True).drop_duplicates()
+
+def clean_earthquake_data_streaming(input_file, output_file, chunksize=100_000):
+    """
+    Clean a raw catalogue of any size in fixed-size chunks, appending each
+    cleaned chunk to `output_file` as soon as it is done. Memory stays bounded
+    by `chunksize`; returns the merged CleaningSummary.
+    """
+    summary = CleaningSummary()
+    geocoder = None
+    first = True
+    for chunk in pd.read_csv(input_file, chunksize=chunksize):
+        if geocoder is None and (as_text(chunk['location']).str.lower() == 'unknown').any():
+            # One geocoder (and one gazetteer) is shared by every chunk of the file
+            geocoder = build_geocoder(known_locations=collect_known_locations(input_file, chunksize))
+        cleaned = clean_chunk(chunk, geocoder)
+        cleaned.to_csv(output_file, mode='w' if first else 'a', header=first, index=False)
+        summary.update(cleaned)
+        first = False
+        print(f"Cleaned {summary.total} rows so far...")
+
+    # The app rebuilds its binary snapshot from the CSV on first load, so the full
+    # file never has to be held in memory here
+    summary.report()
+    return summary
+
 if __name__ == "__main__":
-    # Clean the dataset
-    df = clean_earthquake_data(
-        'Earthquake-app/data/earthquake_1995-2023.csv',
-        'Earthquake-app/data/earthquake_cleaned.csv'
-    ) 
\ No newline at end of file
+    # Pass a chunk size (e.g. `python data_cleaning.py 500000`) to stream large catalogues
+    input_file = 'Earthquake-app/data/earthquake_1995-2023.csv'
+    output_file = 'Earthquake-app/data/earthquake_cleaned.csv'
+    if len(sys.argv) > 1:
+        clean_earthquake_data_streaming(input_file, output_file, chunksize=int(sys.argv[1]))
+    else:
+        # Clean the dataset
+        df = clean_earthquake_data(input_file, output_file)
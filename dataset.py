@@ -0,0 +1,426 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from metrics import load_phase
+
+# --- Column Types ---
+
+# Low-cardinality text columns held as pandas categoricals
+CATEGORY_COLUMNS = [
+    'alert', 'net', 'magType', 'continent', 'country', 'city', 'location_country',
+    'magnitude_category', 'depth_category', 'alert_level', 'time_of_day', 'season',
+]
+
+# Integer columns small enough to be downcast when they contain no missing values
+INTEGER_COLUMNS = [
+    'cdi', 'mmi', 'tsunami', 'sig', 'nst', 'year', 'month', 'day', 'hour',
+    'day_of_week', 'quarter',
+]
+
+SNAPSHOT_FORMAT = 1
+
+# Snapshot versions kept on disk; older ones are pruned after each write
+SNAPSHOTS_KEPT = 2
+
+# --- Filter Definitions ---
+
+# Query parameter -> (column, comparison) for the numeric range filters
+RANGE_FILTERS = {
+    'min_magnitude': ('magnitude', np.greater_equal),
+    'max_magnitude': ('magnitude', np.less_equal),
+    'min_depth': ('depth', np.greater_equal),
+    'max_depth': ('depth', np.less_equal),
+}
+
+# Categorical columns that can be filtered on one or more exact values
+CATEGORICAL_FILTERS = ['magnitude_category', 'country', 'continent']
+
+# Numeric columns kept as typed arrays for filtering and sorting
+NUMERIC_COLUMNS = ['magnitude', 'depth', 'latitude', 'longitude', 'sig', 'tsunami']
+
+SORTABLE_COLUMNS = NUMERIC_COLUMNS + ['date_time']
+
+_NAT = np.iinfo(np.int64).min
+
+
+def _parse_float(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Parameter '{name}' must be a number, got '{value}'.")
+
+
+def _parse_date(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise ValueError(f"Parameter '{name}' must be a date (YYYY-MM-DD), got '{value}'.")
+
+
+def _parse_values(args, name):
+    """Collect a multi-valued parameter given as repeated keys and/or comma-separated values."""
+    if hasattr(args, 'getlist'):
+        raw = args.getlist(name)
+    else:
+        raw = [args[name]] if args.get(name) is not None else []
+    values = [v.strip() for item in raw for v in str(item).split(',') if v.strip()]
+    return [v for v in values if v != 'All']
+
+
+def parse_filters(args):
+    """
+    Parse the standard dashboard filters from request arguments.
+    Raises ValueError with a user-facing message for malformed values.
+    """
+    filters = {}
+    for name in RANGE_FILTERS:
+        value = _parse_float(args, name)
+        if value is not None:
+            filters[name] = value
+
+    start_date = _parse_date(args, 'start_date')
+    end_date = _parse_date(args, 'end_date')
+    if start_date is not None:
+        filters['start_date'] = start_date
+    if end_date is not None:
+        # The end date is inclusive of the whole day, as in the dashboard filter panel
+        if end_date == end_date.normalize():
+            end_date = end_date + pd.Timedelta(days=1)
+        filters['end_date'] = end_date
+
+    for name in CATEGORICAL_FILTERS:
+        values = _parse_values(args, name)
+        if values:
+            filters[name] = values
+
+    tsunami = args.get('tsunami')
+    if tsunami not in (None, '', 'All'):
+        if tsunami not in ('0', '1', 0, 1):
+            raise ValueError(f"Parameter 'tsunami' must be 0 or 1, got '{tsunami}'.")
+        filters['tsunami'] = int(tsunami)
+
+    return filters
+
+
+def filter_signature(filters):
+    """Canonical, hashable form of parsed filters, used as a cache key."""
+    items = []
+    for name, value in filters.items():
+        if isinstance(value, list):
+            value = tuple(sorted(value))
+        elif isinstance(value, pd.Timestamp):
+            value = value.isoformat()
+        items.append((name, value))
+    return tuple(sorted(items))
+
+
+# --- Columnar Query Index ---
+
+class QueryIndex:
+    """
+    Typed column arrays over the cleaned dataset so filters run as vectorized
+    boolean masks, plus a sorted date_time index for range lookups.
+    """
+
+    def __init__(self, frame):
+        self.size = len(frame)
+
+        self.numeric = {}
+        for col in NUMERIC_COLUMNS:
+            if col in frame.columns:
+                self.numeric[col] = pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=np.float64)
+
+        if 'date_time' in frame.columns:
+            dates = pd.to_datetime(frame['date_time'], errors='coerce')
+            self.date_ns = dates.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            self.date_ns = np.full(self.size, _NAT, dtype=np.int64)
+        self.date_order = np.argsort(self.date_ns, kind='stable')
+        self.date_sorted = self.date_ns[self.date_order]
+        # Rows without a timestamp (NaT) sort first and never match a date range
+        self._first_dated = int(np.searchsorted(self.date_sorted, _NAT, side='right'))
+
+        self.codes = {}
+        self.code_lookup = {}
+        for col in CATEGORICAL_FILTERS:
+            if col in frame.columns:
+                codes, uniques = pd.factorize(frame[col])
+                self.codes[col] = codes
+                self.code_lookup[col] = {value: code for code, value in enumerate(uniques)}
+
+    def _date_rows(self, start, end):
+        """Row positions whose date_time falls in [start, end), via binary search."""
+        lo = self._first_dated
+        hi = self.size
+        if start is not None:
+            lo = max(lo, int(np.searchsorted(self.date_sorted, start.value, side='left')))
+        if end is not None:
+            hi = int(np.searchsorted(self.date_sorted, end.value, side='left'))
+        return np.sort(self.date_order[lo:max(lo, hi)])
+
+    def select(self, filters):
+        """Return the ascending row positions matching all filters."""
+        rows = None
+        if 'start_date' in filters or 'end_date' in filters:
+            rows = self._date_rows(filters.get('start_date'), filters.get('end_date'))
+
+        def column(values):
+            return values if rows is None else values[rows]
+
+        mask = None
+
+        def combine(current, new):
+            return new if current is None else current & new
+
+        for name, (col, compare) in RANGE_FILTERS.items():
+            if name in filters and col in self.numeric:
+                mask = combine(mask, compare(column(self.numeric[col]), filters[name]))
+
+        if 'tsunami' in filters and 'tsunami' in self.numeric:
+            mask = combine(mask, column(self.numeric['tsunami']) == filters['tsunami'])
+
+        for col in CATEGORICAL_FILTERS:
+            if col in filters and col in self.codes:
+                lookup = self.code_lookup[col]
+                wanted = [lookup[v] for v in filters[col] if v in lookup]
+                mask = combine(mask, np.isin(column(self.codes[col]), wanted))
+
+        if rows is None:
+            rows = np.arange(self.size) if mask is None else np.flatnonzero(mask)
+        elif mask is not None:
+            rows = rows[mask]
+        return rows
+
+    def sort_key(self, sort_by):
+        if sort_by == 'date_time':
+            key = self.date_ns.astype(np.float64)
+            key[self.date_ns == _NAT] = np.nan
+            return key
+        if sort_by in self.numeric:
+            return self.numeric[sort_by]
+        raise ValueError(f"Cannot sort by '{sort_by}'. Choose one of: {', '.join(SORTABLE_COLUMNS)}.")
+
+    def page(self, rows, sort_by='date_time', descending=True, offset=0, limit=10):
+        """
+        Return the row positions for one page of `rows` ordered by `sort_by`.
+        Only the rows up to the end of the requested page are fully sorted;
+        missing values always sort last and ties keep dataset order.
+        """
+        keys = self.sort_key(sort_by)[rows]
+        if descending:
+            keys = -keys
+
+        stop = offset + limit
+        candidates = np.arange(len(rows))
+        if stop < len(rows):
+            kth = np.partition(keys, stop - 1)[stop - 1]
+            if not np.isnan(kth):
+                candidates = np.flatnonzero(keys <= kth)
+        order = candidates[np.argsort(keys[candidates], kind='stable')]
+        return rows[order[offset:stop]]
+
+
+# --- Typed Loading and Binary Snapshots ---
+
+def apply_dtypes(frame):
+    """Convert a freshly parsed cleaned frame to compact numeric, datetime and categorical dtypes."""
+    if 'date_time' in frame.columns:
+        frame['date_time'] = pd.to_datetime(frame['date_time'], errors='coerce').astype('datetime64[ns]')
+    for col in INTEGER_COLUMNS:
+        if col in frame.columns and frame[col].notna().all():
+            frame[col] = pd.to_numeric(frame[col], downcast='integer')
+    for col in CATEGORY_COLUMNS:
+        if col in frame.columns:
+            frame[col] = frame[col].astype('category')
+    return frame
+
+
+def source_version(path):
+    """Identify a data file by its modification time and size."""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+# Bytes hashed at the end of a data file to recognise a later append to it
+TAIL_BYTES = 65536
+
+
+def file_tail(path, size=None):
+    """(size, digest of the last TAIL_BYTES before `size`) for a data file."""
+    size = os.stat(path).st_size if size is None else size
+    with open(path, 'rb') as f:
+        f.seek(max(size - TAIL_BYTES, 0))
+        digest = hashlib.sha1(f.read(min(size, TAIL_BYTES))).hexdigest()
+    return size, digest
+
+
+def appended_to(path, tail):
+    """
+    True when the file has only grown since `tail` was taken: it is longer and
+    the bytes that ended it then are unchanged. ingest.py only ever appends.
+    """
+    if tail is None:
+        return False
+    size, digest = tail
+    try:
+        return os.stat(path).st_size > size and file_tail(path, size) == tail
+    except OSError:
+        return False
+
+
+def snapshot_root(csv_path):
+    """Snapshots of data/earthquake_cleaned.csv live in data/earthquake_cleaned.snapshots/."""
+    return os.path.splitext(csv_path)[0] + '.snapshots'
+
+
+def write_snapshot(frame, csv_path, version=None):
+    """
+    Write `frame` as a columnar snapshot next to `csv_path`: one .npy file per
+    column plus a manifest, published by atomically repointing CURRENT.
+    """
+    version = version or source_version(csv_path)
+    root = snapshot_root(csv_path)
+    os.makedirs(root, exist_ok=True)
+
+    target = os.path.join(root, version)
+    if not os.path.isdir(target):
+        staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=root)
+        columns = []
+        for i, col in enumerate(frame.columns):
+            series = frame[col]
+            entry = {'name': col, 'file': f'{i}.npy'}
+            if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(series.dtype) \
+                    or pd.api.types.is_string_dtype(series.dtype):
+                # Text is stored dictionary-encoded: int32 codes plus a fixed-width category array
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    entry['kind'] = 'category'
+                    entry['ordered'] = bool(series.cat.ordered)
+                    codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+                else:
+                    entry['kind'] = 'string'
+                    codes, uniques = pd.factorize(series)
+                entry['categories'] = f'{i}.categories.npy'
+                np.save(os.path.join(staging, entry['categories']), np.asarray(uniques, dtype=str))
+                np.save(os.path.join(staging, entry['file']), codes.astype(np.int32))
+            elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+                entry['kind'] = 'datetime'
+                np.save(os.path.join(staging, entry['file']), series.to_numpy(dtype='datetime64[ns]').view(np.int64))
+            else:
+                entry['kind'] = 'numeric'
+                np.save(os.path.join(staging, entry['file']), series.to_numpy())
+            columns.append(entry)
+
+        manifest = {'format': SNAPSHOT_FORMAT, 'version': version, 'rows': len(frame), 'columns': columns}
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another worker published the same version first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    pointer = os.path.join(root, f'.CURRENT-{os.getpid()}')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, 'CURRENT'))
+    prune_snapshots(csv_path, keep=SNAPSHOTS_KEPT)
+    return target
+
+
+def prune_snapshots(csv_path, keep=SNAPSHOTS_KEPT):
+    """
+    Delete all but the `keep` newest snapshot versions. Workers still mapping an
+    older version keep reading it: unlinked files live on until they are unmapped.
+    """
+    root = snapshot_root(csv_path)
+    current = current_snapshot(csv_path)
+    versions = [os.path.join(root, name) for name in os.listdir(root)
+                if not name.startswith('.') and os.path.isdir(os.path.join(root, name))]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[keep:]:
+        if path != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_snapshot(path, mmap_mode=None):
+    """Load a snapshot directory written by write_snapshot()."""
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format in '{path}'.")
+
+    data = {}
+    for entry in manifest['columns']:
+        values = np.load(os.path.join(path, entry['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        kind = entry['kind']
+        if kind in ('category', 'string'):
+            categories = np.load(os.path.join(path, entry['categories']), allow_pickle=False)
+            column = pd.Categorical.from_codes(
+                np.asarray(values), categories=categories.astype(object), ordered=entry.get('ordered', False)
+            )
+            data[entry['name']] = column if kind == 'category' else column.astype(object)
+        elif kind == 'datetime':
+            data[entry['name']] = values.view('datetime64[ns]')
+        else:
+            data[entry['name']] = values
+    return pd.DataFrame(data, copy=False), manifest['version']
+
+
+def current_snapshot(csv_path):
+    """Return the path of the published snapshot, or None if there is none."""
+    root = snapshot_root(csv_path)
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, version)
+    return path if os.path.isdir(path) else None
+
+
+def load_dataset(csv_path, mmap_mode=None):
+    """
+    Load the cleaned dataset with typed columns. The binary snapshot is used when
+    it matches the CSV; otherwise the CSV is parsed and a fresh snapshot written.
+    With `mmap_mode='r'` numeric columns are memory-mapped from the snapshot, so
+    every worker process shares one copy through the page cache.
+    Returns (DataFrame, version).
+    """
+    version = source_version(csv_path)
+    snapshot = current_snapshot(csv_path)
+    if snapshot is not None and os.path.basename(snapshot) == version:
+        try:
+            with load_phase('snapshot_read'):
+                return read_snapshot(snapshot, mmap_mode)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: could not read snapshot '{snapshot}' ({e}), falling back to CSV.")
+
+    with load_phase('csv_parse'):
+        frame = pd.read_csv(csv_path)
+    with load_phase('dtype_conversion'):
+        frame = apply_dtypes(frame)
+    try:
+        with load_phase('snapshot_write'):
+            snapshot = write_snapshot(frame, csv_path, version)
+    except OSError as e:
+        print(f"Warning: could not write data snapshot next to '{csv_path}': {e}")
+        return frame, version
+    if mmap_mode:
+        # Map the files just written so this process shares them with the others too
+        try:
+            return read_snapshot(snapshot, mmap_mode)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: could not map snapshot '{snapshot}' ({e}), keeping the parsed copy.")
+    return frame, version
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+# --- Reverse Geocoding for Data Cleaning ---
+
+EARTH_RADIUS_KM = 6371.0088
+
+GAZETTEER_PATH = 'data/gazetteer.csv'
+GEOCODE_CACHE_PATH = 'data/geocode_cache.json'
+
+# USGS place strings such as "12 km SSW of Hualien City, Taiwan"
+DISTANCE_PREFIX = re.compile(r'^\s*\d+(?:\.\d+)?\s*km\s+[NSEW]{1,3}\s+of\s+', re.IGNORECASE)
+
+
+def unit_vectors(lat, lon):
+    """Latitude/longitude in degrees to points on the unit sphere."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    """Straight-line distance between unit vectors to great-circle kilometres."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+
+def load_gazetteer(path):
+    """Read a 'name,latitude,longitude' CSV of places (extra columns are ignored)."""
+    return pd.read_csv(path, usecols=['name', 'latitude', 'longitude'])
+
+
+def file_digest(path):
+    """Short content hash identifying a gazetteer file in cache keys."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def strip_distance_prefix(names):
+    """'12 km SSW of Hualien City, Taiwan' -> 'Hualien City, Taiwan'."""
+    return names.astype('string').str.replace(DISTANCE_PREFIX, '', regex=True)
+
+
+class OfflineGeocoder:
+    """
+    Nearest gazetteer place to each point, found in bulk with a KD-tree over
+    unit-sphere vectors (Euclidean chord order equals great-circle order).
+    Points farther than `max_distance_km` from every place stay unresolved.
+    `cache_name` identifies the gazetteer in the persistent cache; None keeps
+    its answers out of the cache.
+    """
+
+    def __init__(self, gazetteer, max_distance_km=300.0, cache_name=None):
+        gazetteer = gazetteer.dropna(subset=['name', 'latitude', 'longitude'])
+        gazetteer = gazetteer[gazetteer['name'].str.lower() != 'unknown']
+        self.names = gazetteer['name'].astype(str).to_numpy()
+        self.max_distance_km = max_distance_km
+        self.cache_name = cache_name
+        self.tree = KDTree(unit_vectors(gazetteer['latitude'], gazetteer['longitude'])) if len(self.names) else None
+
+    def reverse_many(self, lat, lon):
+        names = np.full(len(lat), None, dtype=object)
+        if self.tree is None or len(lat) == 0:
+            return names
+        chord, index = self.tree.query(unit_vectors(lat, lon), k=1)
+        close = chord_to_km(chord[:, 0]) <= self.max_distance_km
+        names[close] = self.names[index[close, 0]]
+        return names
+
+
+class NominatimGeocoder:
+    """Online reverse geocoding through Nominatim, one rate-limited request per point."""
+
+    cache_name = 'nominatim'
+
+    def __init__(self, user_agent='earthquake_app_geocoding', min_delay_seconds=1):
+        # geopy is only needed when the online backend is actually used
+        from geopy.geocoders import Nominatim
+        from geopy.extra.rate_limiter import RateLimiter
+
+        geolocator = Nominatim(user_agent=user_agent)
+        # Rate limit requests to 1 second between calls to comply with Nominatim policy
+        self.geocode = RateLimiter(geolocator.reverse, min_delay_seconds=min_delay_seconds)
+
+    def reverse_many(self, lat, lon):
+        names = np.full(len(lat), None, dtype=object)
+        for i, (y, x) in enumerate(zip(lat, lon)):
+            try:
+                location = self.geocode(f"{y}, {x}", language='en')
+            except Exception as e:
+                print(f"Error geocoding {y},{x}: {e}")
+                continue
+            if location and location.address:
+                names[i] = location.address
+        return names
+
+
+class CachedGeocoder:
+    """
+    Resolves points through a chain of backends behind a persistent JSON cache
+    keyed by backend and lat/lon rounded to `precision` decimals (3 decimals is
+    ~110 m). Each distinct rounded point is looked up at most once per backend,
+    and only resolved names are cached, so a later run can still try the
+    fallback and a new gazetteer is never shadowed by another backend's names.
+    """
+
+    def __init__(self, backends, cache_path=GEOCODE_CACHE_PATH, precision=3):
+        self.backends = backends
+        self.cache_path = cache_path
+        self.precision = precision
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+    def _keys(self, lat, lon):
+        lat = np.round(np.asarray(lat, dtype=np.float64), self.precision)
+        lon = np.round(np.asarray(lon, dtype=np.float64), self.precision)
+        return np.array([f'{y:.{self.precision}f},{x:.{self.precision}f}' for y, x in zip(lat, lon)], dtype=object)
+
+    @staticmethod
+    def _backend_key(backend, key):
+        return f'{backend.cache_name}|{key}'
+
+    def reverse(self, lat, lon):
+        """Place names aligned with the inputs; None where no backend resolves a point."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        names = np.full(len(lat), None, dtype=object)
+        valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        if len(valid) == 0:
+            return names
+
+        keys, first, inverse = np.unique(self._keys(lat[valid], lon[valid]), return_index=True, return_inverse=True)
+        resolved = np.full(len(keys), None, dtype=object)
+        print(f"Geocoding {len(valid)} points ({len(keys)} distinct).")
+
+        new_entries = {}
+        for backend in self.backends:
+            pending = np.flatnonzero(pd.isna(resolved))
+            if backend.cache_name is not None and len(pending):
+                resolved[pending] = [self.cache.get(self._backend_key(backend, keys[i])) for i in pending]
+                print(f"{type(backend).__name__} had {int(pd.notna(resolved[pending]).sum())} of {len(pending)} points cached.")
+                pending = pending[pd.isna(resolved[pending])]
+            if len(pending) == 0:
+                continue
+            rows = valid[first[pending]]
+            found = backend.reverse_many(lat[rows], lon[rows])
+            resolved[pending] = found
+            print(f"{type(backend).__name__} resolved {int(pd.notna(found).sum())} of {len(pending)} points.")
+            if backend.cache_name is not None:
+                new_entries.update({self._backend_key(backend, keys[i]): name
+                                    for i, name in zip(pending, found) if pd.notna(name)})
+
+        if new_entries and self.cache_path:
+            self.cache.update(new_entries)
+            self._save()
+
+        names[valid] = resolved[inverse]
+        return names
+
+    def _save(self):
+        # Write to a temporary file first so an interrupted run never truncates the cache
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.cache, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.cache_path)
+
+
+def build_geocoder(known_locations=None):
+    """
+    Geocoder configured from the environment:
+    GEOCODER_BACKEND ('offline' or 'nominatim'), GEOCODER_FALLBACK ('nominatim'
+    or empty), GAZETTEER_PATH, GEOCODER_MAX_DISTANCE_KM and GEOCODE_CACHE_PATH.
+    Without a gazetteer file the offline backend uses `known_locations`, a
+    frame of already-named events (location, latitude, longitude), with any
+    "12 km SSW of" prefix removed. Those names are not cached because they
+    depend on the dataset being cleaned.
+    """
+    backend = os.environ.get('GEOCODER_BACKEND', 'offline').lower()
+    fallback = os.environ.get('GEOCODER_FALLBACK', '').lower()
+
+    backends = []
+    if backend == 'offline':
+        gazetteer_path = os.environ.get('GAZETTEER_PATH', GAZETTEER_PATH)
+        if os.path.exists(gazetteer_path):
+            gazetteer = load_gazetteer(gazetteer_path)
+            cache_name = f'gazetteer:{file_digest(gazetteer_path)}'
+            print(f"Using gazetteer '{gazetteer_path}' with {len(gazetteer)} places.")
+        elif known_locations is not None:
+            gazetteer = known_locations.rename(columns={'location': 'name'})
+            gazetteer = gazetteer.assign(name=strip_distance_prefix(gazetteer['name']))
+            cache_name = None
+            print(f"Gazetteer '{gazetteer_path}' not found; using {len(gazetteer)} already-named events.")
+        else:
+            gazetteer = pd.DataFrame(columns=['name', 'latitude', 'longitude'])
+            cache_name = None
+        max_distance = float(os.environ.get('GEOCODER_MAX_DISTANCE_KM', 300))
+        if cache_name is not None:
+            cache_name = f'{cache_name}:{max_distance:g}km'
+        backends.append(OfflineGeocoder(gazetteer, max_distance_km=max_distance, cache_name=cache_name))
+    elif backend == 'nominatim':
+        backends.append(NominatimGeocoder())
+    else:
+        raise ValueError(f"Unknown GEOCODER_BACKEND '{backend}'; use 'offline' or 'nominatim'.")
+
+    if fallback == 'nominatim' and backend != 'nominatim':
+        backends.append(NominatimGeocoder())
+
+    return CachedGeocoder(backends, cache_path=os.environ.get('GEOCODE_CACHE_PATH', GEOCODE_CACHE_PATH))
@@ -0,0 +1,443 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from metrics import phase
+
+# Rows scored per model call in batch mode; keeps peak memory bounded for large uploads
+BATCH_CHUNK_SIZE = 10000
+
+# Largest number of events accepted by a single batch request
+MAX_BATCH_ROWS = 1000000
+
+
+def risk_label(prediction):
+    return 'High Risk' if prediction == 1 else 'Low Risk'
+
+
+def categorical_columns(model, model_columns):
+    """Columns the pipeline one-hot encodes; everything else is numeric."""
+    try:
+        preprocessor = model.named_steps['preprocessor']
+        for name, _, columns in preprocessor.transformers_:
+            if name == 'cat':
+                return [c for c in columns if c in model_columns]
+    except (AttributeError, KeyError):
+        pass
+    return ['magType']
+
+
+# --- Batch Input Validation ---
+
+def validate_events(frame, model_columns, categorical):
+    """
+    Coerce a frame of raw events to model inputs.
+    Returns (clean_frame, errors) where errors maps row position -> message;
+    rows with errors are excluded from clean_frame.
+    """
+    errors = {}
+    missing = [c for c in model_columns if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}.")
+
+    clean = pd.DataFrame(index=frame.index)
+    bad = np.zeros(len(frame), dtype=bool)
+    for col in model_columns:
+        if col in categorical:
+            values = frame[col]
+            invalid = values.isna().to_numpy() | (values.astype(str).str.strip() == '').to_numpy()
+            clean[col] = values.astype(str).str.strip()
+            reason = f"'{col}' is required"
+        else:
+            values = pd.to_numeric(frame[col], errors='coerce')
+            invalid = ~np.isfinite(values.to_numpy(dtype=np.float64))
+            clean[col] = values
+            reason = f"'{col}' must be a finite number"
+        for pos in np.flatnonzero(invalid):
+            errors.setdefault(int(pos), []).append(reason)
+        bad |= invalid
+
+    messages = {pos: '; '.join(reasons) + '.' for pos, reasons in errors.items()}
+    return clean[~bad], messages
+
+
+# --- Vectorized Batch Inference ---
+
+def model_stages(model):
+    """
+    Split a compiled model or a preprocessing + classifier Pipeline into
+    (transform, score) so each stage can be timed; score(X) returns
+    (labels, class probabilities or None).
+    """
+    if hasattr(model, 'predict_transformed'):
+        return model.transform, model.predict_transformed
+    if hasattr(model, 'steps') and len(model.steps) > 1:
+        transform, model = model[:-1].transform, model[-1]
+    else:
+        transform = None
+    classes = getattr(model, 'classes_', None)
+    if hasattr(model, 'predict_proba') and classes is not None:
+        def score(X):
+            # One model pass gives both outputs: the label is the most probable class
+            proba = model.predict_proba(X)
+            return classes[np.argmax(proba, axis=1)], proba
+    else:
+        def score(X):
+            return model.predict(X), None
+    return transform or (lambda frame: frame), score
+
+
+def predict_batch(model, frame, chunk_size=BATCH_CHUNK_SIZE):
+    """Score a validated frame in chunks. Returns (labels, tsunami probabilities)."""
+    labels = np.empty(len(frame), dtype=np.int64)
+    probabilities = np.full(len(frame), np.nan)
+    classes = getattr(model, 'classes_', None)
+    positive = list(classes).index(1) if classes is not None and 1 in classes else None
+    transform, score = model_stages(model)
+    for start in range(0, len(frame), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size]
+        with phase('model_transform'):
+            X = transform(chunk)
+        with phase('model_predict'):
+            chunk_labels, proba = score(X)
+        labels[start:start + len(chunk)] = chunk_labels
+        if positive is not None and proba is not None:
+            probabilities[start:start + len(chunk)] = proba[:, positive]
+    return labels, probabilities
+
+
+# --- Compiled Single-Event Inference ---
+
+class UnsupportedModelError(ValueError):
+    """Raised when a saved pipeline cannot be compiled; callers fall back to sklearn."""
+
+
+def _pack_trees(trees):
+    """Concatenate fitted sklearn Tree objects into flat node arrays with global child indices."""
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+    left, right = [], []
+    for offset, tree in zip(offsets, trees):
+        own = np.arange(tree.node_count) + offset
+        is_leaf = tree.children_left == -1
+        # Leaves point at themselves so every tree can be walked for the same number of steps
+        left.append(np.where(is_leaf, own, tree.children_left + offset))
+        right.append(np.where(is_leaf, own, tree.children_right + offset))
+    return {
+        'roots': offsets.astype(np.intp),
+        'left': np.concatenate(left).astype(np.intp),
+        'right': np.concatenate(right).astype(np.intp),
+        'feature': np.concatenate([np.maximum(tree.feature, 0) for tree in trees]).astype(np.intp),
+        'threshold': np.concatenate([tree.threshold for tree in trees]),
+        'missing_left': np.concatenate([
+            getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8)) for tree in trees
+        ]).astype(bool),
+        'value': np.concatenate([tree.value[:, 0, :] for tree in trees]),
+        'depth': max(tree.max_depth for tree in trees),
+    }
+
+
+def _apply_trees(packed, X):
+    """Leaf index reached in every tree for every row, walking all trees in lockstep."""
+    # sklearn trees compare float32 features against float64 thresholds
+    X32 = X.astype(np.float32)
+    nodes = np.broadcast_to(packed['roots'], (X.shape[0], len(packed['roots']))).copy()
+    for _ in range(packed['depth']):
+        values = np.take_along_axis(X32, packed['feature'][nodes], axis=1)
+        go_left = np.where(np.isnan(values), packed['missing_left'][nodes], values <= packed['threshold'][nodes])
+        nodes = np.where(go_left, packed['left'][nodes], packed['right'][nodes])
+    return nodes
+
+
+def _sequential_sum(terms):
+    """Sum along axis 1 strictly left to right, matching sklearn's in-place accumulation."""
+    return np.cumsum(terms, axis=1)[:, -1]
+
+
+class CompiledModel:
+    """
+    A saved preprocessing + classifier Pipeline compiled to plain NumPy.
+    RobustScaler statistics and the magType one-hot mapping are folded into
+    arrays, and the ensemble is evaluated directly on the feature matrix, so
+    single events skip DataFrame construction and ColumnTransformer dispatch.
+    Outputs are bit-for-bit identical to the sklearn pipeline.
+    """
+
+    def __init__(self, pipeline, model_columns):
+        try:
+            preprocessor = pipeline.named_steps['preprocessor']
+            classifier = pipeline.named_steps['classifier']
+        except (AttributeError, KeyError):
+            raise UnsupportedModelError('Expected a Pipeline with preprocessor and classifier steps.')
+
+        self.model_columns = list(model_columns)
+        self.classes_ = classifier.classes_
+        self.classifier_name = type(classifier).__name__
+        self._compile_preprocessor(preprocessor)
+        self._score = self._compile_classifier(classifier)
+
+    # Preprocessing
+
+    def _compile_preprocessor(self, preprocessor):
+        self.numeric_blocks = []
+        self.onehot_blocks = []
+        width = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == 'drop' or len(columns) == 0:
+                continue
+            columns = list(columns)
+            if type(transformer).__name__ == 'RobustScaler':
+                center = transformer.center_ if transformer.with_centering else None
+                scale = transformer.scale_ if transformer.with_scaling else None
+                self.numeric_blocks.append((columns, width, center, scale))
+                width += len(columns)
+            elif type(transformer).__name__ == 'OneHotEncoder' and transformer.handle_unknown == 'ignore' \
+                    and transformer.drop is None and len(columns) == 1:
+                categories = transformer.categories_[0]
+                lookup = {category: i for i, category in enumerate(categories)}
+                self.onehot_blocks.append((columns[0], width, lookup, pd.Index(categories)))
+                width += len(categories)
+            else:
+                raise UnsupportedModelError(f"Cannot compile transformer '{name}' ({type(transformer).__name__}).")
+        self.n_features = width
+
+    def transform_event(self, event):
+        """Encode one event dict as a 1 x n_features float64 matrix."""
+        X = np.zeros((1, self.n_features))
+        for columns, start, center, scale in self.numeric_blocks:
+            values = np.array([np.nan if event[col] is None else float(event[col]) for col in columns])
+            if center is not None:
+                values -= center
+            if scale is not None:
+                values /= scale
+            X[0, start:start + len(columns)] = values
+        for column, start, lookup, _ in self.onehot_blocks:
+            code = lookup.get(event[column])
+            if code is not None:
+                X[0, start + code] = 1.0
+        return X
+
+    def transform_frame(self, frame):
+        """Encode a DataFrame of events as an n x n_features float64 matrix."""
+        X = np.zeros((len(frame), self.n_features))
+        for columns, start, center, scale in self.numeric_blocks:
+            values = frame[columns].to_numpy(dtype=np.float64, copy=True)
+            if center is not None:
+                values -= center
+            if scale is not None:
+                values /= scale
+            X[:, start:start + len(columns)] = values
+        for column, start, _, categories in self.onehot_blocks:
+            codes = categories.get_indexer(frame[column])
+            known = np.flatnonzero(codes >= 0)
+            X[known, start + codes[known]] = 1.0
+        return X
+
+    def transform(self, data):
+        return self.transform_event(data) if isinstance(data, dict) else self.transform_frame(data)
+
+    # Classifiers
+
+    def _compile_classifier(self, classifier):
+        name = type(classifier).__name__
+        if len(self.classes_) != 2:
+            raise UnsupportedModelError('Only binary classifiers can be compiled.')
+        if name == 'XGBClassifier':
+            return self._compile_xgboost(classifier)
+        if name == 'RandomForestClassifier':
+            return self._compile_forest(classifier)
+        if name == 'GradientBoostingClassifier':
+            return self._compile_gradient_boosting(classifier)
+        raise UnsupportedModelError(f"Cannot compile classifier '{name}'.")
+
+    def _compile_xgboost(self, classifier):
+        booster = classifier.get_booster()
+        try:
+            # Early-stopped models predict with their best iteration, as XGBClassifier does
+            iteration_range = (0, classifier.best_iteration + 1)
+        except AttributeError:
+            iteration_range = (0, 0)
+        missing = classifier.missing
+
+        def score(X):
+            positive = booster.inplace_predict(
+                X, iteration_range=iteration_range, predict_type='value', missing=missing,
+                validate_features=False,
+            )
+            proba = np.vstack((1.0 - positive, positive)).transpose()
+            encoded = (positive > 0.5).astype(np.intp)
+            return proba, encoded
+
+        return score
+
+    def _compile_forest(self, classifier):
+        packed = _pack_trees([estimator.tree_ for estimator in classifier.estimators_])
+        n_classes = len(self.classes_)
+        n_trees = len(classifier.estimators_)
+
+        def score(X):
+            leaves = _apply_trees(packed, X)
+            tree_proba = packed['value'][leaves][:, :, :n_classes]
+            normalizer = tree_proba.sum(axis=2, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            tree_proba = tree_proba / normalizer
+            proba = np.stack([_sequential_sum(tree_proba[:, :, k]) for k in range(n_classes)], axis=1)
+            proba /= n_trees
+            return proba, np.argmax(proba, axis=1)
+
+        return score
+
+    def _compile_gradient_boosting(self, classifier):
+        from scipy.special import expit
+
+        if classifier.estimators_.shape[1] != 1:
+            raise UnsupportedModelError('Only binary gradient boosting can be compiled.')
+        packed = _pack_trees([estimator.tree_ for estimator in classifier.estimators_[:, 0]])
+        # The prior (init estimator) contributes the same raw score to every row
+        init_raw = float(classifier._raw_predict_init(np.zeros((1, classifier.n_features_in_)))[0, 0])
+        learning_rate = classifier.learning_rate
+
+        def score(X):
+            if np.isnan(X).any():
+                raise ValueError('Input X contains NaN.')
+            leaves = _apply_trees(packed, X)
+            terms = np.empty((X.shape[0], leaves.shape[1] + 1))
+            terms[:, 0] = init_raw
+            terms[:, 1:] = learning_rate * packed['value'][leaves][:, :, 0]
+            raw = _sequential_sum(terms)
+            proba = np.empty((X.shape[0], 2))
+            proba[:, 1] = expit(raw)
+            proba[:, 0] = 1 - proba[:, 1]
+            return proba, (raw >= 0).astype(np.intp)
+
+        return score
+
+    # sklearn-style interface
+
+    def predict_proba(self, data):
+        return self._score(self.transform(data))[0]
+
+    def predict(self, data):
+        return self.classes_[self._score(self.transform(data))[1]]
+
+    def predict_with_proba(self, data):
+        """Labels and class probabilities from a single pass over the ensemble."""
+        return self.predict_transformed(self.transform(data))
+
+    def predict_transformed(self, X):
+        """Labels and class probabilities for an already transformed matrix."""
+        proba, encoded = self._score(X)
+        return self.classes_[encoded], proba
+
+
+def compile_model(pipeline, model_columns):
+    """Compile a pipeline for fast inference, or return None when it is not supported."""
+    try:
+        return CompiledModel(pipeline, model_columns)
+    except UnsupportedModelError as e:
+        print(f"Compiled inference unavailable, using the sklearn pipeline: {e}")
+        return None
+
+
+# --- Prediction Cache ---
+
+def parse_quantization(spec):
+    """Parse 'magnitude=0.1,depth=5' into {'magnitude': 0.1, 'depth': 5.0}."""
+    steps = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, step = item.partition('=')
+        try:
+            steps[name.strip()] = float(step)
+        except ValueError:
+            raise ValueError(f"Invalid quantization step '{item}', expected column=step.")
+        if steps[name.strip()] <= 0:
+            raise ValueError(f"Quantization step for '{name.strip()}' must be positive.")
+    return steps
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a TTL in front of the model, keyed on the normalized
+    feature tuple. Continuous inputs can be snapped to a grid (`quantize`) so
+    near-identical requests share an entry; the model is then scored on the
+    snapped values so a key always maps to the same answer.
+    """
+
+    def __init__(self, max_entries=4096, ttl=3600.0, quantize=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.quantize = dict(quantize or {})
+        self.model_version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def normalize(self, event, model_columns, categorical):
+        """Return (key, normalized event) for an input dict; raises KeyError/ValueError like the model would."""
+        normalized = {}
+        for col in model_columns:
+            value = event[col]
+            if col in categorical:
+                value = None if value is None else str(value).strip()
+            else:
+                value = float('nan') if value is None else float(value)
+                step = self.quantize.get(col)
+                if step and np.isfinite(value):
+                    value = round(round(value / step) * step, 10)
+            normalized[col] = value
+        # NaN never equals itself, so key it by its text form
+        key = tuple(v if not (isinstance(v, float) and v != v) else 'nan' for v in normalized.values())
+        return key, normalized
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl <= 0 or time.monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, model_version):
+        """Cache a prediction made by `model_version`; results of a replaced model are dropped."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            # A request that scored with the old model can finish after the reload's invalidate()
+            if model_version != self.model_version:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model_version=None):
+        """Drop every entry; called whenever a model file is (re)loaded."""
+        with self._lock:
+            self._entries.clear()
+            self.model_version = model_version
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'quantize': self.quantize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'model_version': self.model_version,
+            }
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning import CleaningSummary, as_text, clean_chunk, extract_magnitude_from_title
+from geocoding import build_geocoder
+
+# --- Incremental Ingest ---
+#
+# The cleaned store keeps one CSV per year next to a sorted array of event
+# identity hashes, so a new batch only touches the partitions of the years it
+# contains. Summary statistics and the offline gazetteer are updated from the
+# new rows alone.
+
+CLEANED_PATH = 'data/earthquake_cleaned.csv'
+STORE_PATH = 'data/earthquake_store'
+
+# Identity precision: coordinates to ~10 m, magnitude to one decimal
+COORD_DECIMALS = 4
+MAGNITUDE_DECIMALS = 1
+
+
+def event_keys(date_time, latitude, longitude, magnitude):
+    """Deterministic 64-bit identity of each event (time + coordinates + magnitude)."""
+    identity = pd.DataFrame({
+        'time': pd.to_datetime(date_time).to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'lat': np.round(np.asarray(latitude, dtype=np.float64) * 10**COORD_DECIMALS),
+        'lon': np.round(np.asarray(longitude, dtype=np.float64) * 10**COORD_DECIMALS),
+        'mag': np.round(np.asarray(magnitude, dtype=np.float64) * 10**MAGNITUDE_DECIMALS),
+    })
+    return pd.util.hash_pandas_object(identity, index=False).to_numpy(dtype=np.uint64).view(np.int64)
+
+
+def raw_event_keys(raw):
+    """Identity of raw USGS rows, using the same magnitude fallback as the cleaner."""
+    magnitude = pd.to_numeric(raw['magnitude'], errors='coerce').fillna(extract_magnitude_from_title(raw['title']))
+    date_time = pd.to_datetime(raw['date_time'], format='%d-%m-%Y %H:%M')
+    keys = event_keys(date_time, pd.to_numeric(raw['latitude'], errors='coerce'),
+                      pd.to_numeric(raw['longitude'], errors='coerce'), magnitude)
+    return keys, date_time.dt.year.to_numpy()
+
+
+class PartitionedStore:
+    """Per-year cleaned CSV partitions plus identity keys, summary and gazetteer."""
+
+    def __init__(self, root=STORE_PATH):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def partition_path(self, year):
+        return self._path(f'year={year}.csv')
+
+    def keys_path(self, year):
+        return self._path(f'year={year}.keys.npy')
+
+    def exists(self):
+        return os.path.exists(self._path('summary.json'))
+
+    def load_keys(self, year):
+        path = self.keys_path(year)
+        return np.load(path) if os.path.exists(path) else np.empty(0, dtype=np.int64)
+
+    def load_summary(self):
+        with open(self._path('summary.json')) as f:
+            return CleaningSummary.from_dict(json.load(f))
+
+    def load_gazetteer(self):
+        path = self._path('gazetteer.csv')
+        return pd.read_csv(path) if os.path.exists(path) else None
+
+    def append(self, cleaned, columns):
+        """Append cleaned rows to their year partitions and record their keys."""
+        keys = event_keys(cleaned['date_time'], cleaned['latitude'], cleaned['longitude'], cleaned['magnitude'])
+        years = cleaned['date_time'].dt.year.to_numpy()
+        for year in np.unique(years):
+            in_year = years == year
+            path = self.partition_path(year)
+            cleaned.loc[in_year, columns].to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+            self._save_array(self.keys_path(year), np.union1d(self.load_keys(year), keys[in_year]))
+
+    def append_gazetteer(self, cleaned):
+        named = cleaned.loc[cleaned['location'].str.lower() != 'unknown', ['location', 'latitude', 'longitude']]
+        named = named.round({'latitude': 3, 'longitude': 3}).drop_duplicates()
+        path = self._path('gazetteer.csv')
+        named.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+    def save_summary(self, summary):
+        self._write_text(self._path('summary.json'), json.dumps(summary.to_dict(), indent=2))
+
+    def _save_array(self, path, values):
+        tmp_path = f'{path}.tmp.npy'
+        np.save(tmp_path, values)
+        os.replace(tmp_path, path)
+
+    def _write_text(self, path, text):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+def build_store(cleaned_path=CLEANED_PATH, store=None, chunksize=100_000):
+    """One-time split of an existing cleaned catalogue into the partitioned store."""
+    store = store or PartitionedStore()
+    os.makedirs(store.root, exist_ok=True)
+    columns = pd.read_csv(cleaned_path, nrows=0).columns.tolist()
+    summary = CleaningSummary()
+    for chunk in pd.read_csv(cleaned_path, chunksize=chunksize):
+        chunk['date_time'] = pd.to_datetime(chunk['date_time'])
+        store.append(chunk, columns)
+        store.append_gazetteer(chunk)
+        summary.update(chunk)
+    store.save_summary(summary)
+    print(f"Built store '{store.root}' from {summary.total} cleaned events.")
+    return store
+
+
+def ingest(raw_file, cleaned_path=CLEANED_PATH, store_path=STORE_PATH):
+    """
+    Clean and append only the events of `raw_file` that are not already stored.
+    Work is proportional to the new rows plus the key arrays of the years they touch.
+    """
+    start = time.perf_counter()
+    store = PartitionedStore(store_path)
+    if not store.exists():
+        build_store(cleaned_path, store)
+
+    raw = pd.read_csv(raw_file)
+    keys, years = raw_event_keys(raw)
+
+    # Drop repeats inside the batch, then anything already in the touched partitions
+    new = ~pd.Series(keys).duplicated().to_numpy()
+    for year in np.unique(years):
+        in_year = years == year
+        new[in_year] &= ~np.isin(keys[in_year], store.load_keys(year))
+    print(f"Read {len(raw)} raw events: {int(new.sum())} new, {len(raw) - int(new.sum())} already stored.")
+    if not new.any():
+        return None
+
+    # Only the delta is cleaned; its unknown locations are resolved against the store's gazetteer
+    geocoder = None
+    delta = raw[new].reset_index(drop=True)
+    if (as_text(delta['location']).str.lower() == 'unknown').any():
+        geocoder = build_geocoder(known_locations=store.load_gazetteer())
+    cleaned = clean_chunk(delta, geocoder)
+    if cleaned.empty:
+        print("No new events survived cleaning (missing essential fields).")
+        return None
+
+    columns = pd.read_csv(cleaned_path, nrows=0).columns.tolist()
+    store.append(cleaned, columns)
+    store.append_gazetteer(cleaned)
+    # The app reads the flat cleaned CSV; appending changes its version so the next load rebuilds the snapshot
+    cleaned[columns].to_csv(cleaned_path, mode='a', header=False, index=False)
+
+    summary = store.load_summary().update(cleaned)
+    store.save_summary(summary)
+    print(f"Ingested {len(cleaned)} events in {time.perf_counter() - start:.2f}s; "
+          f"the catalogue now holds {summary.total} events.")
+    return cleaned
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Append new raw USGS events to the cleaned catalogue.')
+    parser.add_argument('raw_file', help='CSV of new raw events in the USGS export format')
+    parser.add_argument('--cleaned', default=CLEANED_PATH, help='Flat cleaned CSV read by the app')
+    parser.add_argument('--store', default=STORE_PATH, help='Directory of the per-year cleaned store')
+    args = parser.parse_args()
+    ingest(args.raw_file, args.cleaned, args.store)
@@ -0,0 +1,273 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+
+# --- Prometheus Metrics ---
+#
+# A small in-process registry rendered in the Prometheus text format. Recording
+# a sample is a bisect plus a few additions under a lock, so the timers stay on
+# in production. Each gunicorn worker keeps its own registry; /metrics reports
+# the worker that answered the scrape (its pid is exported as a gauge).
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; request phases range from sub-millisecond cache hits to multi-second payload builds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per combination of label values."""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (plus +Inf), sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in sorted(self._series.items())]
+        for label_values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ('le',), label_values + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Last-set value per combination of label values."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        """{label values: value} for every series set so far."""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Gauge):
+    """A monotonically increasing value, read from an existing counter at scrape time."""
+
+    kind = 'counter'
+
+
+class Registry:
+    """Metrics recorded as they happen plus collectors sampled at scrape time."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """`collect()` returns metrics (Gauge, Counter or Histogram) filled in at scrape time."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            try:
+                for metric in collect():
+                    lines.extend(metric.render())
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                print(f"Error while collecting metrics: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'app_request_duration_seconds', 'Time to produce each response, by route, method and status.',
+    ('route', 'method', 'status'),
+))
+PHASE_SECONDS = registry.register(Histogram(
+    'app_request_phase_duration_seconds', 'Time spent in each phase of a request, by route and phase.',
+    ('route', 'phase'),
+))
+LOAD_PHASE_SECONDS = registry.register(Gauge(
+    'app_load_phase_seconds', 'Duration of the latest run of each data or model load phase (startup or reload).',
+    ('phase',),
+))
+
+
+def current_route():
+    """The matched URL rule of the request being handled, so labels stay low-cardinality."""
+    if not has_request_context():
+        return ''
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+@contextmanager
+def phase(name):
+    """Time a block of request handling into the phase histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - start, current_route(), name)
+
+
+@contextmanager
+def load_phase(name):
+    """Time a block of data or model loading; the latest duration is exported."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        LOAD_PHASE_SECONDS.set(time.perf_counter() - start, name)
+
+
+def observe_request(response, start):
+    REQUEST_SECONDS.observe(time.perf_counter() - start, current_route(), request.method, str(response.status_code))
+
+
+# --- Process Metrics ---
+
+def resident_memory_bytes():
+    """Current RSS from /proc, or the peak RSS where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def collect_process():
+    rss = Gauge('process_resident_memory_bytes', 'Resident memory size in bytes.')
+    rss.set(resident_memory_bytes())
+    times = os.times()
+    cpu = Counter('process_cpu_seconds_total', 'User and system CPU time spent by this worker in seconds.')
+    cpu.set(times.user + times.system)
+    pid = Gauge('process_pid', 'Process id of the worker that answered the scrape.')
+    pid.set(os.getpid())
+    return [rss, cpu, pid]
+
+
+def cache_metrics(caches):
+    """Hit, miss and size metrics for {name: stats dict} as returned by LRUCache.stats() and PredictionCache.stats()."""
+    hits = Counter('app_cache_hits_total', 'Cache hits since the cache was created.', ('cache',))
+    misses = Counter('app_cache_misses_total', 'Cache misses since the cache was created.', ('cache',))
+    ratio = Gauge('app_cache_hit_ratio', 'Hits over lookups since the cache was created.', ('cache',))
+    entries = Gauge('app_cache_entries', 'Entries currently held.', ('cache',))
+    for name, stats in caches.items():
+        hits.set(stats['hits'], name)
+        misses.set(stats['misses'], name)
+        ratio.set(stats['hit_rate'], name)
+        entries.set(stats['entries'], name)
+    return [hits, misses, ratio, entries]
+
+
+registry.add_collector(collect_process)
+
+
+# --- Single-Request Profiling ---
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper
+    thread and counts identical stacks, so only the profiled request pays for it.
+    """
+
+    def __init__(self, thread_id, interval=0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope, most frequent first."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
@@ -1,138 +1,131 @@
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder, RobustScaler
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.metrics import accuracy_score, classification_report
+from sklearn.metrics import classification_report
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 import xgboost as xgb
-import joblib
+import argparse
 import warnings
 import os
 
+from training import build_preprocessor, save_atomic, search_models, train_models
+
 warnings.filterwarnings('ignore')
 
 # --- Main Script ---
 
-# 1. Load Data
 # Correctly pathing to the data file from the project root.
 DATA_PATH = os.path.join('Earthquake-app', 'data', 'earthquake_cleaned.csv')
 MODELS_DIR = os.path.join('Earthquake-app', 'models')
 
-print("Loading and preparing data...")
-df = pd.read_csv(DATA_PATH)
-
-# Handle potential infinite values and drop rows with missing essential data
-df.replace([np.inf, -np.inf], np.nan, inplace=True)
-df.dropna(subset=['magnitude', 'depth', 'latitude', 'longitude', 'sig', 'magType', 'tsunami'], inplace=True)
-
-
-# 2. Define Features and Target
 numeric_features = ['magnitude', 'depth', 'latitude', 'longitude', 'sig']
 categorical_features = ['magType']
 features = numeric_features + categorical_features
 target = 'tsunami'
 
-X = df[features]
-y = df[target]
-
-print(f"Features selected for modeling: {features}")
-
-
-# 3. Train/Test Split
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.25, random_state=42, stratify=y
-)
-
-
-# 4. Create a Preprocessing Pipeline
-numeric_transformer = RobustScaler()
-categorical_transformer = OneHotEncoder(handle_unknown='ignore')
-
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', numeric_transformer, numeric_features),
-        ('cat', categorical_transformer, categorical_features)
-    ],
-    remainder='passthrough'
-)
 
-
-# 5. Define Models to Compare
-base_models = {
-    'XGBoost': xgb.XGBClassifier(
-        objective='binary:logistic', eval_metric='logloss', use_label_encoder=False,
-        random_state=42, n_estimators=200, learning_rate=0.1, max_depth=5
-    ),
-    'RandomForest': RandomForestClassifier(
-        random_state=42, n_estimators=200, max_depth=10, n_jobs=-1
-    ),
-    'GradientBoosting': GradientBoostingClassifier(
-        random_state=42, n_estimators=200, learning_rate=0.1, max_depth=5
+def load_training_data(data_path):
+    """Cleaned catalogue rows with every feature and the target present."""
+    df = pd.read_csv(data_path)
+    # Handle potential infinite values and drop rows with missing essential data
+    df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    df.dropna(subset=features + [target], inplace=True)
+    return df[features], df[target]
+
+
+def candidate_models():
+    """Models to compare; thread counts are capped per task by the training runner."""
+    return {
+        'XGBoost': xgb.XGBClassifier(
+            objective='binary:logistic', eval_metric='logloss',
+            random_state=42, n_estimators=200, learning_rate=0.1, max_depth=5
+        ),
+        'RandomForest': RandomForestClassifier(
+            random_state=42, n_estimators=200, max_depth=10, n_jobs=-1
+        ),
+        'GradientBoosting': GradientBoostingClassifier(
+            random_state=42, n_estimators=200, learning_rate=0.1, max_depth=5
+        )
+    }
+
+
+def main(data_path=DATA_PATH, models_dir=MODELS_DIR, n_splits=5, workers=None,
+         search=False, budget_seconds=300, max_latency_ms=None):
+    # 1. Load Data
+    print("Loading and preparing data...")
+    X, y = load_training_data(data_path)
+    print(f"Features selected for modeling: {features}")
+
+    # 2. Train/Test Split
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.25, random_state=42, stratify=y
     )
-}
-
-best_model = None
-best_model_name = ""
-best_accuracy = 0.0
-
-# 6. Train, Evaluate, and Compare Models
-for name, model in base_models.items():
-    print(f"\n--- Training and Evaluating {name} ---")
-    
-    pipeline = Pipeline(steps=[
-        ('preprocessor', preprocessor),
-        ('classifier', model)
-    ])
-    
-    pipeline.fit(X_train, y_train)
-    
-    y_pred = pipeline.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred)
-    
-    print(f"Accuracy: {accuracy:.4f}")
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred, digits=4))
-    
-    if accuracy > best_accuracy:
-        best_accuracy = accuracy
-        best_model = pipeline
-        best_model_name = name
-
-print("-" * 50)
-print(f"\n🏆 Best performing model: '{best_model_name}' with an accuracy of {best_accuracy:.4f}.")
-print("-" * 50)
-
-# 7. Save the Best Model and Columns
-if best_model:
-    print(f"\nSaving the best model ('{best_model_name}')...")
-    os.makedirs(MODELS_DIR, exist_ok=True)
-
-    joblib.dump(best_model, os.path.join(MODELS_DIR, 'earthquake_model.pkl'))
-    joblib.dump(features, os.path.join(MODELS_DIR, 'model_columns.pkl'))
-
-    print(f"Model and columns saved successfully in the '{MODELS_DIR}' directory.")
-else:
-    print("Could not determine the best model. Nothing was saved.")
-
 
-# 8. Feature Importance Analysis for the Best Model
-if best_model and hasattr(best_model.named_steps['classifier'], 'feature_importances_'):
-    print("\n--- Feature Importance of Best Model ---")
-    try:
-        ohe_feature_names = best_model.named_steps['preprocessor'].named_transformers_['cat'].get_feature_names_out(categorical_features)
-        final_feature_names = numeric_features + list(ohe_feature_names)
-        importances = best_model.named_steps['classifier'].feature_importances_
-
-        feature_importance_df = pd.DataFrame({
-            'feature': final_feature_names,
-            'importance': importances
-        }).sort_values('importance', ascending=False)
-
-        print(feature_importance_df.head(10))
-
-    except Exception as e:
-        print(f"Could not display feature importance: {e}")
-
-print("\nPrediction script finished successfully.")
\ No newline at end of file
+    # 3. Cross-validate and test every candidate in parallel, with fixed or searched hyperparameters
+    preprocessor = build_preprocessor(numeric_features, categorical_features)
+    if search:
+        summary, best_model_name, best_model = search_models(
+            preprocessor, X_train, y_train, X_test, y_test, features, budget_seconds=budget_seconds,
+            n_splits=n_splits, workers=workers, max_latency_ms=max_latency_ms
+        )
+    else:
+        summary, best_model_name, best_model = train_models(
+            candidate_models(), preprocessor, X_train, y_train, X_test, y_test, n_splits=n_splits, workers=workers
+        )
+
+    for name, result in summary.items():
+        print(f"\n--- Held-out Evaluation of {name} ---")
+        print(f"Accuracy: {result['holdout_accuracy']:.4f}")
+        print("\nClassification Report:")
+        print(classification_report(y_test, result['y_pred'], digits=4))
+
+    best = summary[best_model_name]
+    print("-" * 50)
+    print(f"\n🏆 Best performing model: '{best_model_name}' with a {n_splits}-fold CV accuracy of "
+          f"{best['cv_mean']:.4f} ± {best['cv_std']:.4f} (held-out accuracy {best['holdout_accuracy']:.4f}).")
+    print("-" * 50)
+
+    # 4. Save the Best Model and Columns
+    print(f"\nSaving the best model ('{best_model_name}')...")
+    os.makedirs(models_dir, exist_ok=True)
+    # Columns first: the app reloads both files when the model file changes
+    save_atomic(features, os.path.join(models_dir, 'model_columns.pkl'))
+    save_atomic(best_model, os.path.join(models_dir, 'earthquake_model.pkl'))
+    print(f"Model and columns saved successfully in the '{models_dir}' directory.")
+
+    # 5. Feature Importance Analysis for the Best Model
+    if hasattr(best_model.named_steps['classifier'], 'feature_importances_'):
+        print("\n--- Feature Importance of Best Model ---")
+        try:
+            ohe_feature_names = best_model.named_steps['preprocessor'].named_transformers_['cat'].get_feature_names_out(categorical_features)
+            final_feature_names = numeric_features + list(ohe_feature_names)
+            importances = best_model.named_steps['classifier'].feature_importances_
+
+            feature_importance_df = pd.DataFrame({
+                'feature': final_feature_names,
+                'importance': importances
+            }).sort_values('importance', ascending=False)
+
+            print(feature_importance_df.head(10))
+
+        except Exception as e:
+            print(f"Could not display feature importance: {e}")
+
+    print("\nPrediction script finished successfully.")
+    return best_model
+
+
+# The guard keeps worker processes from re-running training when they import this module
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train and compare the tsunami risk models.')
+    parser.add_argument('--data', default=DATA_PATH, help='Cleaned catalogue CSV')
+    parser.add_argument('--models-dir', default=MODELS_DIR, help='Directory the best model is saved to')
+    parser.add_argument('--folds', type=int, default=None, help='Cross-validation folds (default: 5, or 3 with --search)')
+    parser.add_argument('--workers', type=int, default=None, help='Training processes (default: one per core)')
+    parser.add_argument('--search', action='store_true', help='Search hyperparameters instead of using the fixed models')
+    parser.add_argument('--budget', type=float, default=300, help='Wall-clock budget of the search in seconds')
+    parser.add_argument('--max-latency-ms', type=float, default=None,
+                        help='Only choose searched models whose single-event prediction is this fast')
+    args = parser.parse_args()
+    folds = args.folds or (3 if args.search else 5)
+    main(args.data, args.models_dir, folds, args.workers, args.search, args.budget, args.max_latency_ms)
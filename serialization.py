@@ -0,0 +1,212 @@
+import gzip
+import hashlib
+import json
+import zlib
+
+import numpy as np
+import pandas as pd
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; gzip is always available from the standard library.
+    brotli = None
+
+
+# --- Record Serialization ---
+
+def frame_to_records(frame):
+    """Convert a DataFrame slice to JSON-ready records (string dates, NaN as None)."""
+    data_to_send = frame.copy()
+    if 'date_time' in data_to_send.columns:
+        # Convert datetime to string for JSON
+        data_to_send['date_time'] = data_to_send['date_time'].astype(str)
+    # Replace NaN with None so the frontend never sees a bare NaN token
+    data_to_send = data_to_send.astype(object).where(pd.notnull(data_to_send), None)
+    return data_to_send.to_dict(orient='records')
+
+
+def columns_to_lists(columns):
+    """Convert a dict of NumPy arrays to JSON-ready lists, with NaN as None."""
+    out = {}
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if values.dtype.kind == 'f':
+            out[name] = [None if v != v else v for v in values.tolist()]
+        else:
+            out[name] = values.tolist()
+    return out
+
+
+# --- Pre-serialized Payloads ---
+
+class CompressedPayload:
+    """A response body serialized once and kept in every encoding we can serve."""
+
+    def __init__(self, body, version, mimetype='application/json'):
+        self.version = version
+        self.mimetype = mimetype
+        digest = hashlib.sha1(body).hexdigest()
+
+        # Each encoding is a different byte sequence, so each gets its own strong ETag.
+        self.encodings = {'identity': (body, digest)}
+        self.encodings['gzip'] = (gzip.compress(body, compresslevel=6), f'{digest}-gz')
+        if brotli is not None:
+            self.encodings['br'] = (brotli.compress(body, quality=5), f'{digest}-br')
+
+    def choose_encoding(self, accept_encodings):
+        """Pick the smallest encoding the client accepts."""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+
+def make_payload_response(payload, request):
+    """Serve a CompressedPayload, answering 304 when the client's copy is current."""
+    encoding = payload.choose_encoding(request.accept_encodings)
+    body, etag = payload.encodings[encoding]
+
+    response = Response(mimetype=payload.mimetype)
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Let browsers keep the body but revalidate it on every page view.
+    response.headers['Cache-Control'] = 'no-cache'
+
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+
+    response.set_data(body)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# --- Streaming NDJSON ---
+
+# Records serialized per chunk; server memory per stream is bounded by one batch
+NDJSON_BATCH_ROWS = 5000
+
+
+def iter_ndjson(frame, dumps, batch_rows=NDJSON_BATCH_ROWS):
+    """Yield a frame as newline-delimited JSON records, one encoded batch at a time."""
+    for start in range(0, len(frame), batch_rows):
+        records = frame_to_records(frame.iloc[start:start + batch_rows])
+        yield ''.join(dumps(record, separators=(',', ':')) + '\n' for record in records).encode('utf-8')
+
+
+def iter_gzip(chunks, compresslevel=6):
+    """Gzip a stream, flushing after every chunk so the client can decode each batch as it arrives."""
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def make_ndjson_response(frame, version, dumps, request):
+    """Stream a frame as NDJSON (gzipped when accepted), answering 304 for the version the client holds."""
+    encoding = 'gzip' if request.accept_encodings['gzip'] else 'identity'
+    etag = f'{version}-ndjson' + ('-gz' if encoding == 'gzip' else '')
+
+    response = Response(mimetype='application/x-ndjson')
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    # Lets the client show progress before the last batch arrives
+    response.headers['X-Record-Count'] = str(len(frame))
+
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+
+    chunks = iter_ndjson(frame, dumps)
+    if encoding == 'gzip':
+        chunks = iter_gzip(chunks)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.response = chunks
+    return response
+
+
+# --- Columnar Binary Payload ---
+#
+# Layout: a little-endian uint32 header length, a UTF-8 JSON header, then one
+# buffer per column, each starting on an 8-byte boundary so the browser can
+# wrap it in a typed-array view without copying. The header lists every
+# column's name, type, byte offset and row count, plus:
+#   encoding 'dictionary': int codes into a list of strings (-1 is missing)
+#   encoding 'bool':       uint8 0/1
+#   encoding 'epoch_ms':   naive wall-clock datetimes as milliseconds since
+#                          1970-01-01, stored as float64 (NaN is missing) so
+#                          they are exact without BigInt
+
+COLUMNAR_FORMAT = 1
+
+COLUMNAR_MIMETYPE = 'application/vnd.earthquake.columnar'
+
+# Float columns the dashboard filters or plots exactly; the remaining float columns are
+# only displayed rounded and are sent as float32
+FLOAT64_COLUMNS = {'magnitude', 'depth', 'latitude', 'longitude', 'seismic_energy'}
+
+_ALIGNMENT = 8
+
+
+def _code_dtype(n_values):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _column_buffer(name, series):
+    """(header entry, little-endian array) for one column."""
+    entry = {'name': name}
+    if isinstance(series.dtype, pd.CategoricalDtype) or not (
+            pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype)):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, dictionary = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, dictionary = pd.factorize(series, use_na_sentinel=True)
+        values = np.asarray(codes, dtype=_code_dtype(len(dictionary)))
+        entry.update(encoding='dictionary', dictionary=[str(v) for v in dictionary])
+    elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+        ns = series.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        values = np.where(ns == np.iinfo(np.int64).min, np.nan, ns // 10**6).astype(np.float64)
+        entry['encoding'] = 'epoch_ms'
+    elif pd.api.types.is_bool_dtype(series.dtype):
+        values = series.to_numpy(dtype=np.uint8)
+        entry['encoding'] = 'bool'
+    elif pd.api.types.is_integer_dtype(series.dtype):
+        values = series.to_numpy()
+    else:
+        values = series.to_numpy(dtype=np.float64 if name in FLOAT64_COLUMNS else np.float32)
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+    entry['type'] = values.dtype.name
+    return entry, values
+
+
+def frame_to_columnar(frame, version=None):
+    """Encode a frame in the columnar binary layout described above."""
+    entries, buffers = [], []
+    offset = 0
+    for name in frame.columns:
+        entry, values = _column_buffer(name, frame[name])
+        entry['offset'] = offset
+        entries.append(entry)
+        buffers.append(values)
+        offset += -(-values.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+    header = json.dumps({'format': COLUMNAR_FORMAT, 'version': version, 'rows': len(frame),
+                         'columns': entries}, separators=(',', ':')).encode('utf-8')
+    # Pad the header so the first buffer starts 8-byte aligned
+    header += b' ' * (-(4 + len(header)) % _ALIGNMENT)
+
+    body = bytearray(4 + len(header) + offset)
+    body[:4] = np.uint32(len(header)).astype('<u4').tobytes()
+    body[4:4 + len(header)] = header
+    start = 4 + len(header)
+    for entry, values in zip(entries, buffers):
+        position = start + entry['offset']
+        body[position:position + values.nbytes] = values.tobytes()
+    return bytes(body)
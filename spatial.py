@@ -0,0 +1,292 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from aggregations import LRUCache
+from geocoding import EARTH_RADIUS_KM
+
+# --- Grid Pyramid for Heatmap Tiles ---
+
+MAX_ZOOM = 12
+
+# Cells per 360 degrees of longitude at zoom 0; each zoom level halves the cell size
+BASE_CELLS = 16
+
+# Finest zoom precomputed over the whole catalogue; finer levels are aggregated per bounding box
+PRECOMPUTED_MAX_ZOOM = 6
+
+CELL_FIELDS = ['lat', 'lon', 'count', 'max_magnitude', 'mean_magnitude', 'mean_depth', 'mean_sig',
+               'energy', 'tsunami']
+
+
+def cell_size(zoom):
+    """Cell edge in degrees at a zoom level (22.5 deg at zoom 0, ~0.005 deg at MAX_ZOOM)."""
+    return 360.0 / (BASE_CELLS * 2 ** zoom)
+
+
+def parse_bbox(value):
+    """Parse a Leaflet 'west,south,east,north' bounding box string."""
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        raise ValueError(f"Parameter 'bbox' must be 'west,south,east,north', got '{value}'.")
+    if south > north:
+        raise ValueError("Parameter 'bbox' has south greater than north.")
+    return west, south, east, north
+
+
+def bbox_mask(lat, lon, bbox):
+    """Points inside a bounding box, handling maps panned across the antimeridian."""
+    if bbox is None:
+        return np.ones(len(lat), dtype=bool)
+    west, south, east, north = bbox
+    mask = (lat >= south) & (lat <= north)
+    if east - west >= 360:
+        return mask
+    # Leaflet reports longitudes beyond +/-180 after panning; wrap them back
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    if west <= east:
+        return mask & (lon >= west) & (lon <= east)
+    return mask & ((lon >= west) | (lon <= east))
+
+
+def _group_sum(values, order, starts):
+    """Per-group sums ignoring NaN, plus the number of non-NaN values in each group."""
+    values = values[order]
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+    counts = np.add.reduceat(valid.astype(np.int64), starts)
+    return sums, counts
+
+
+def aggregate_cells(columns, zoom):
+    """
+    Bin events into lat/lon cells at `zoom` in one sort + reduceat pass.
+    `columns` maps latitude/longitude/magnitude/depth/sig/seismic_energy/tsunami
+    to equal-length float arrays. Returns a dict of per-cell arrays (CELL_FIELDS).
+    """
+    lat = columns['latitude']
+    lon = columns['longitude']
+    size = cell_size(zoom)
+    n_cols = int(round(360.0 / size))
+    n_rows = int(round(180.0 / size))
+    iy = np.clip(np.floor((lat + 90.0) / size), 0, n_rows - 1).astype(np.int64)
+    ix = np.clip(np.floor((lon + 180.0) / size), 0, n_cols - 1).astype(np.int64)
+    cell = iy * n_cols + ix
+
+    if len(cell) == 0:
+        return {field: np.empty(0) for field in CELL_FIELDS}
+
+    order = np.argsort(cell, kind='stable')
+    sorted_cells = cell[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    count = np.diff(np.r_[starts, len(sorted_cells)])
+
+    lat_sum, _ = _group_sum(lat, order, starts)
+    lon_sum, _ = _group_sum(lon, order, starts)
+    mag_sum, mag_count = _group_sum(columns['magnitude'], order, starts)
+    depth_sum, depth_count = _group_sum(columns['depth'], order, starts)
+    sig_sum, sig_count = _group_sum(columns['sig'], order, starts)
+    energy_sum, _ = _group_sum(columns['seismic_energy'], order, starts)
+    tsunami_sum, _ = _group_sum(columns['tsunami'], order, starts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            # Cells are drawn at the centroid of their events rather than the cell centre
+            'lat': lat_sum / count,
+            'lon': lon_sum / count,
+            'count': count,
+            'max_magnitude': np.fmax.reduceat(columns['magnitude'][order], starts),
+            'mean_magnitude': mag_sum / mag_count,
+            'mean_depth': depth_sum / depth_count,
+            'mean_sig': sig_sum / sig_count,
+            'energy': energy_sum,
+            'tsunami': tsunami_sum.astype(np.int64),
+        }
+
+
+class GridPyramid:
+    """
+    Heatmap cells per zoom level. Coarse levels are precomputed over the whole
+    catalogue; finer ones, and every filtered request, are aggregated on the fly
+    from the rows inside the requested bounding box, found by binary search on
+    latitude. Unfiltered fine-zoom views are kept in an LRU cache.
+    """
+
+    def __init__(self, frame, max_zoom=MAX_ZOOM, precomputed_zoom=PRECOMPUTED_MAX_ZOOM, cache_size=256):
+        self.max_zoom = max_zoom
+        self.columns = {}
+        for col in ['latitude', 'longitude', 'magnitude', 'depth', 'sig', 'seismic_energy', 'tsunami']:
+            if col in frame.columns:
+                self.columns[col] = pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=np.float64)
+            else:
+                self.columns[col] = np.full(len(frame), np.nan)
+
+        lat = self.columns['latitude']
+        located = np.flatnonzero(~(np.isnan(lat) | np.isnan(self.columns['longitude'])))
+        self.located_rows = located[np.argsort(lat[located], kind='stable')]
+        self.located_lat = lat[self.located_rows]
+        located_columns = {col: values[self.located_rows] for col, values in self.columns.items()}
+        self.levels = [aggregate_cells(located_columns, zoom) for zoom in range(min(precomputed_zoom, max_zoom) + 1)]
+        self.cache = LRUCache(cache_size)
+
+    def clamp_zoom(self, zoom):
+        return int(min(max(zoom, 0), self.max_zoom))
+
+    def rows_in_bbox(self, bbox):
+        """Located rows inside `bbox`, scanning only its latitude band."""
+        if bbox is None:
+            return self.located_rows
+        start = np.searchsorted(self.located_lat, bbox[1], side='left')
+        stop = np.searchsorted(self.located_lat, bbox[3], side='right')
+        band = self.located_rows[start:stop]
+        return band[bbox_mask(self.located_lat[start:stop], self.columns['longitude'][band], bbox)]
+
+    def aggregate(self, rows, zoom):
+        return aggregate_cells({col: values[rows] for col, values in self.columns.items()}, zoom)
+
+    def query(self, zoom, bbox=None, rows=None):
+        """Cells at `zoom` inside `bbox`; pass `rows` to aggregate only those dataset rows."""
+        zoom = self.clamp_zoom(zoom)
+        if rows is not None:
+            return self.aggregate(np.intersect1d(rows, self.rows_in_bbox(bbox), assume_unique=True), zoom)
+
+        if zoom < len(self.levels):
+            cells = self.levels[zoom]
+            inside = bbox_mask(cells['lat'], cells['lon'], bbox)
+            return {field: values[inside] for field, values in cells.items()}
+
+        key = (zoom, bbox)
+        cells = self.cache.get(key)
+        if cells is None:
+            cells = self.aggregate(self.rows_in_bbox(bbox), zoom)
+            self.cache.put(key, cells)
+        return cells
+
+
+# --- Haversine Spatial Index ---
+
+# Half the Earth's circumference covers every point
+MAX_RADIUS_KM = 20038.0
+# Events returned by one radius or nearest-neighbour query
+MAX_SPATIAL_RESULTS = 1000
+DEFAULT_HISTORY_RADIUS_KM = 300.0
+
+
+def parse_point(args):
+    """Validate the 'lat' and 'lon' query parameters of a spatial query."""
+    try:
+        lat = float(args['lat'])
+        lon = float(args['lon'])
+    except KeyError:
+        raise ValueError("Parameters 'lat' and 'lon' are required.")
+    except ValueError:
+        raise ValueError("Parameters 'lat' and 'lon' must be numbers.")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Parameter 'lat' must be within [-90, 90] and 'lon' within [-180, 180].")
+    return lat, lon
+
+
+def parse_radius(args, default=DEFAULT_HISTORY_RADIUS_KM):
+    """Validate the 'radius_km' query parameter."""
+    try:
+        radius_km = float(args.get('radius_km', default))
+    except ValueError:
+        raise ValueError("Parameter 'radius_km' must be a number.")
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise ValueError(f"Parameter 'radius_km' must be greater than 0 and at most {MAX_RADIUS_KM:.0f}.")
+    return radius_km
+
+
+class SpatialIndex:
+    """
+    BallTree over event coordinates with the haversine metric, so radius and
+    nearest-neighbour queries cost O(log n + matches) instead of a catalogue
+    scan. Filtered queries intersect the tree's hits with the filter rows.
+    Nearby-history statistics are cached per ~1 km point and radius, which
+    makes them cheap enough to compute for every prediction.
+    """
+
+    def __init__(self, frame, cache_size=4096):
+        lat = pd.to_numeric(frame['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+        lon = pd.to_numeric(frame['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+        self.located_rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        self.tree = None
+        if len(self.located_rows):
+            self.tree = BallTree(np.radians(np.column_stack([lat, lon])[self.located_rows]), metric='haversine')
+        self.columns = {}
+        for col in ['magnitude', 'depth', 'tsunami']:
+            values = frame[col] if col in frame.columns else pd.Series(np.nan, index=frame.index)
+            self.columns[col] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+        self.history_cache = LRUCache(cache_size)
+
+    @staticmethod
+    def _query_point(lat, lon):
+        return np.radians([[lat, lon]])
+
+    def _restrict(self, hits, distances, rows):
+        if rows is None:
+            return hits, distances
+        keep = np.isin(hits, rows)
+        return hits[keep], distances[keep]
+
+    def within(self, lat, lon, radius_km, rows=None):
+        """Dataset rows within `radius_km` of a point, nearest first, with their distances in km."""
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        index, distance = self.tree.query_radius(self._query_point(lat, lon), r=radius_km / EARTH_RADIUS_KM,
+                                                 return_distance=True, sort_results=True)
+        hits, distances = self._restrict(self.located_rows[index[0]], distance[0] * EARTH_RADIUS_KM, rows)
+        return hits, distances
+
+    def nearest(self, lat, lon, k, rows=None):
+        """The `k` nearest dataset rows (among `rows` when given), nearest first, with distances in km."""
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        available = len(self.located_rows)
+        # Filtered queries widen the neighbourhood until enough matching rows are found
+        fetch = min(k, available)
+        while True:
+            distance, index = self.tree.query(self._query_point(lat, lon), k=fetch)
+            hits, distances = self._restrict(self.located_rows[index[0]], distance[0] * EARTH_RADIUS_KM, rows)
+            if len(hits) >= k or fetch == available:
+                return hits[:k], distances[:k]
+            fetch = min(fetch * 4, available)
+
+    def history(self, lat, lon, radius_km=DEFAULT_HISTORY_RADIUS_KM):
+        """Count, magnitude/depth summary, tsunami rate and nearest distance of events within `radius_km`."""
+        # Points are snapped to 0.01 degrees (about 1 km) and the summary is
+        # computed at the snapped point, so every caller sharing a key gets the
+        # same answer whichever of them filled the cache
+        lat, lon = round(lat, 2), round(lon, 2)
+        key = (lat, lon, radius_km)
+        result = self.history_cache.get(key)
+        if result is None:
+            rows, distances = self.within(lat, lon, radius_km)
+            result = self.summarize(rows, distances)
+            result['radius_km'] = radius_km
+            self.history_cache.put(key, result)
+        return result
+
+    def summarize(self, rows, distances):
+        magnitude = self.columns['magnitude'][rows]
+        depth = self.columns['depth'][rows]
+        tsunami = self.columns['tsunami'][rows]
+        tsunami = tsunami[~np.isnan(tsunami)]
+
+        def stat(reduce, values):
+            values = values[~np.isnan(values)]
+            return float(reduce(values)) if len(values) else None
+
+        return {
+            'count': int(len(rows)),
+            'max_magnitude': stat(np.max, magnitude),
+            'mean_magnitude': stat(np.mean, magnitude),
+            'mean_depth': stat(np.mean, depth),
+            'tsunami_count': int(tsunami.sum()),
+            'tsunami_rate': float(tsunami.mean()) if len(tsunami) else None,
+            'nearest_km': float(distances[0]) if len(distances) else None,
+        }
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from aggregations import CorrelationEngine, RollupEngine
+from anomalies import AnomalyDetector
+from dataset import QueryIndex, appended_to, file_tail, load_dataset, source_version
+from inference import categorical_columns, compile_model
+from metrics import load_phase
+from serialization import COLUMNAR_MIMETYPE, CompressedPayload, frame_to_columnar, frame_to_records
+from spatial import GridPyramid, SpatialIndex
+
+# --- Versioned Application State ---
+#
+# Everything derived from one version of the dataset (or model) lives on one
+# object. Reloading builds a complete new object and replaces the module-level
+# reference in a single assignment, so a request that already holds the old
+# object finishes against a consistent old version.
+
+def _memory_mapped(values):
+    """True when an array's memory ultimately belongs to a np.memmap."""
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+
+class DataState:
+    """
+    The cleaned dataset of one version plus every index and engine built from it.
+    When `previous` holds the leading rows of `df`, the anomaly detector is
+    extended with the appended rows instead of being rebuilt.
+    """
+
+    def __init__(self, df, version, previous=None, source_tail=None):
+        self.df = df
+        self.version = version
+        self.source_tail = source_tail
+        self.loaded_at = time.time()
+        if df.empty:
+            self.query_index = self.grid_pyramid = self.spatial_index = self.rollup_engine = None
+            self.correlation_engine = self.anomaly_detector = None
+        else:
+            self.query_index = QueryIndex(df)
+            self.grid_pyramid = GridPyramid(df)
+            self.spatial_index = SpatialIndex(df)
+            self.rollup_engine = RollupEngine(df, self.query_index)
+            self.correlation_engine = CorrelationEngine(df, self.query_index)
+            if previous is not None and previous.anomaly_detector is not None:
+                self.anomaly_detector = previous.anomaly_detector.append(df)
+            else:
+                self.anomaly_detector = AnomalyDetector(df)
+        self._payload = None
+        self._columnar_payload = None
+        self._payload_lock = threading.Lock()
+
+    @classmethod
+    def empty(cls):
+        return cls(pd.DataFrame(), None)
+
+    def payload(self, dumps):
+        """The compressed /api/data body, serialized once per version on first use."""
+        if self._payload is None:
+            with self._payload_lock:
+                if self._payload is None:
+                    records = frame_to_records(self.df)
+                    body = dumps(records, separators=(',', ':')).encode('utf-8')
+                    self._payload = CompressedPayload(body, self.version)
+                    print(f"Built /api/data payload for data version {self.version} ({len(body)} bytes).")
+        return self._payload
+
+    def columnar_payload(self):
+        """The compressed columnar binary body, built once per version on first use."""
+        if self._columnar_payload is None:
+            with self._payload_lock:
+                if self._columnar_payload is None:
+                    body = frame_to_columnar(self.df, self.version)
+                    self._columnar_payload = CompressedPayload(body, self.version, mimetype=COLUMNAR_MIMETYPE)
+                    print(f"Built columnar payload for data version {self.version} ({len(body)} bytes).")
+        return self._columnar_payload
+
+    def info(self):
+        mapped = [col for col in self.df.columns
+                  if not isinstance(self.df[col].dtype, pd.CategoricalDtype) and _memory_mapped(self.df[col].to_numpy())]
+        return {
+            'version': self.version,
+            'rows': len(self.df),
+            'loaded_at': self.loaded_at,
+            'memory_mapped_columns': len(mapped),
+        }
+
+
+class ModelState:
+    """The prediction pipeline of one version with its compiled fast path."""
+
+    def __init__(self, model, model_columns, version):
+        self.model = model
+        self.model_columns = model_columns
+        self.version = version
+        self.loaded_at = time.time()
+        self.compiled_model = compile_model(model, model_columns) if model is not None else None
+        self.categorical = categorical_columns(model, model_columns) if model is not None else []
+
+    @classmethod
+    def empty(cls):
+        return cls(None, None, None)
+
+    def info(self):
+        return {
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'compiled': self.compiled_model is not None,
+        }
+
+
+def load_data_state(data_path, mmap=True, previous=None):
+    """
+    Load the dataset (memory-mapped from its shared snapshot when `mmap`) and
+    build its state. `previous` is the state being replaced; if the file has
+    only had rows appended since, its running statistics are carried over.
+    """
+    start = time.perf_counter()
+    appended = previous is not None and appended_to(data_path, previous.source_tail)
+    tail = file_tail(data_path)
+    df, version = load_dataset(data_path, mmap_mode='r' if mmap else None)
+    if appended and len(df) <= len(previous.df):
+        appended = False
+    with load_phase('index_build'):
+        state = DataState(df, version, previous=previous if appended else None, source_tail=tail)
+    if appended:
+        print(f"Extended anomaly statistics with {len(df) - len(previous.df)} appended rows.")
+    print(f"Successfully loaded data version {version} with {len(df)} rows in {time.perf_counter() - start:.3f}s "
+          f"({df.memory_usage(deep=True).sum() / 1e6:.1f} MB, {state.info()['memory_mapped_columns']} columns mapped).")
+    return state
+
+
+def files_version(paths):
+    """One version for files that are only meaningful together, such as the model and its columns."""
+    return '+'.join(source_version(path) for path in paths)
+
+
+def load_model_state(model_path, columns_path):
+    """Unpickle the model and its column list and compile the fast inference path."""
+    start = time.perf_counter()
+    version = files_version([model_path, columns_path])
+    with load_phase('model_unpickle'):
+        model = joblib.load(model_path)
+        model_columns = joblib.load(columns_path)
+    loaded = time.perf_counter()
+    with load_phase('model_compile'):
+        state = ModelState(model, model_columns, version)
+    print(f"Prediction model version {version} loaded in {loaded - start:.3f}s "
+          f"(compiled in {time.perf_counter() - loaded:.3f}s).")
+    return state
+
+
+# --- Background Reloading ---
+
+class VersionWatcher:
+    """
+    Reports the new version of one or more files once they have stopped
+    changing: a version must be seen on two consecutive polls, so half-written
+    files are never loaded.
+    """
+
+    def __init__(self, *paths, current=None):
+        self.paths = paths
+        self.current = current
+        self.candidate = None
+
+    def changed(self):
+        try:
+            version = files_version(self.paths)
+        except FileNotFoundError:
+            return None
+        if version == self.current:
+            self.candidate = None
+            return None
+        if version != self.candidate:
+            self.candidate = version
+            return None
+        return version
+
+
+class Reloader:
+    """Runs `check` every `interval` seconds on a daemon thread, once per process."""
+
+    def __init__(self, check, interval):
+        self.check = check
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # Threads do not survive fork, so each gunicorn worker starts its own
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='reloader', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                # Keep serving the current version; the next poll retries
+                print(f"Error while reloading: {e}")
@@ -37,41 +37,181 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-// Fetch data from backend API
-async function fetchData() {
+// Ensure date_time is parsed as Date objects and numeric values are numbers
+function processRecord(d) {
   try {
-    console.log("Attempting to fetch data...");
-    const res = await fetch('/api/data');
+    return {
+      ...d,
+      date_time: d.date_time ? new Date(d.date_time) : null, // Handle potential null date_time
+      magnitude: parseFloat(d.magnitude) || 0, // Default to 0 if parsing fails
+      depth: parseFloat(d.depth) || 0, // Default to 0 if parsing fails
+      tsunami: d.tsunami != null ? parseInt(d.tsunami) : null, // Keep tsunami as 0, 1, or null
+      significance: parseFloat(d.sig) || 0, // Use the correct 'sig' property from backend, default to 0 if parsing fails
+      latitude: parseFloat(d.latitude) || null, // Keep latitude as number or null
+      longitude: parseFloat(d.longitude) || null // Keep longitude as number or null
+    };
+  } catch (err) {
+    console.error('Error processing record:', d, err);
+    return null;
+  }
+}
+
+// How fetchData() loads the dataset: 'columnar' (typed column buffers), 'ndjson' (record
+// batches drawn as they stream in) or 'json'; override with ?transport= in the page URL
+const DATA_TRANSPORT = new URLSearchParams(window.location.search).get('transport') || 'columnar';
+
+const COLUMNAR_ARRAY_TYPES = {
+  float64: Float64Array, float32: Float32Array, int8: Int8Array, int16: Int16Array,
+  int32: Int32Array, uint8: Uint8Array
+};
+
+// Wrap each column of a /api/data?format=columnar body in a typed-array view; nothing is parsed per row.
+// Buffers are little-endian, the byte order of every platform browsers run on.
+function decodeColumnar(buffer) {
+  const headerLength = new DataView(buffer).getUint32(0, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+  const start = 4 + headerLength;
+  const columns = {};
+  header.columns.forEach(col => {
+    columns[col.name] = { ...col, values: new COLUMNAR_ARRAY_TYPES[col.type](buffer, start + col.offset, header.rows) };
+  });
+  return { rows: header.rows, version: header.version, columns };
+}
 
-    if (!res.ok) {
-      throw new Error(`HTTP error! status: ${res.status}`);
+// Dashboard records built straight from the column views, with the same conventions as processRecord()
+function columnarToRecords(table) {
+  const readers = Object.values(table.columns).map(col => {
+    const values = col.values;
+    if (col.encoding === 'dictionary') {
+      const dictionary = col.dictionary;
+      return [col.name, i => (values[i] < 0 ? null : dictionary[values[i]])];
+    }
+    if (col.encoding === 'epoch_ms') {
+      // Naive wall-clock times, read as local time like the JSON date strings
+      return [col.name, i => {
+        if (Number.isNaN(values[i])) return null;
+        const t = new Date(values[i]);
+        return new Date(t.getUTCFullYear(), t.getUTCMonth(), t.getUTCDate(), t.getUTCHours(), t.getUTCMinutes(), t.getUTCSeconds());
+      }];
+    }
+    if (col.encoding === 'bool') {
+      return [col.name, i => values[i] === 1];
+    }
+    if (values instanceof Float32Array || values instanceof Float64Array) {
+      return [col.name, i => (Number.isNaN(values[i]) ? null : values[i])];
     }
+    return [col.name, i => values[i]];
+  });
 
-    const data = await res.json();
-    console.log("Raw data received:", data.slice(0, 2)); // Log first two records
+  const records = new Array(table.rows);
+  for (let i = 0; i < table.rows; i++) {
+    const d = {};
+    for (const [name, read] of readers) d[name] = read(i);
+    d.magnitude = d.magnitude || 0;
+    d.depth = d.depth || 0;
+    d.significance = d.sig || 0;
+    d.latitude = d.latitude || null;
+    d.longitude = d.longitude || null;
+    records[i] = d;
+  }
+  return records;
+}
 
-    if (!Array.isArray(data) || data.length === 0) {
-      throw new Error('No data received or invalid data format');
-    }
+async function fetchColumnarRecords() {
+  const res = await fetch('/api/data?format=columnar');
+  if (!res.ok) {
+    throw new Error(`HTTP error! status: ${res.status}`);
+  }
+  return columnarToRecords(decodeColumnar(await res.arrayBuffer()));
+}
+
+// Minimum time between progressive redraws while the dataset is streaming in
+const STREAM_RENDER_INTERVAL_MS = 300;
+
+// Read /api/data as NDJSON, handing each batch of processed records to onBatch
+async function streamRecords(onBatch) {
+  const res = await fetch('/api/data?format=ndjson');
+  if (!res.ok) {
+    throw new Error(`HTTP error! status: ${res.status}`);
+  }
+  const expected = parseInt(res.headers.get('X-Record-Count')) || null;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let pending = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    pending += decoder.decode(value || new Uint8Array(), { stream: !done });
+    // Only complete lines are parsed; a partial record waits for the next chunk
+    const lines = pending.split('\n');
+    pending = done ? '' : lines.pop();
+    const batch = lines.filter(line => line.trim()).map(line => processRecord(JSON.parse(line))).filter(d => d !== null);
+    if (batch.length) onBatch(batch, expected);
+    if (done) break;
+  }
+}
+
+// Summary cards from running totals of the records received so far, until the server rollups arrive
+function updateStreamingSummary(totals, batch, expected) {
+  batch.forEach(d => {
+    totals.count += 1;
+    totals.magSum += d.magnitude;
+    totals.depthSum += d.depth;
+  });
+  if (totals.count === 0) return;
+  document.getElementById('totalEarthquakes').textContent =
+    expected ? `${totals.count} / ${expected}` : totals.count;
+  document.getElementById('avgMagnitude').textContent = (totals.magSum / totals.count).toFixed(2);
+  document.getElementById('avgDepth').textContent = (totals.depthSum / totals.count).toFixed(2);
+}
 
-    // Ensure date_time is parsed as Date objects and numeric values are numbers
-    rawData = data.map(d => {
-      try {
-        return {
-          ...d,
-          date_time: d.date_time ? new Date(d.date_time) : null, // Handle potential null date_time
-          magnitude: parseFloat(d.magnitude) || 0, // Default to 0 if parsing fails
-          depth: parseFloat(d.depth) || 0, // Default to 0 if parsing fails
-          tsunami: d.tsunami != null ? parseInt(d.tsunami) : null, // Keep tsunami as 0, 1, or null
-          significance: parseFloat(d.sig) || 0, // Use the correct 'sig' property from backend, default to 0 if parsing fails
-          latitude: parseFloat(d.latitude) || null, // Keep latitude as number or null
-          longitude: parseFloat(d.longitude) || null // Keep longitude as number or null
-        };
-      } catch (err) {
-        console.error('Error processing record:', d, err);
-        return null;
+// Fetch data from backend API
+async function fetchData() {
+  try {
+    console.log("Attempting to fetch data...");
+    rawData = [];
+    let unrendered = [];
+    let lastRender = 0;
+    const totals = { count: 0, magSum: 0, depthSum: 0 };
+
+    // Each redraw only handles the records that arrived since the previous one
+    const renderProgress = (expected) => {
+      updateStreamingSummary(totals, unrendered, expected);
+      if (!heatmapMap) {
+        initHeatmap(unrendered);
+      } else {
+        appendHeatmapRecords(unrendered);
       }
-    }).filter(d => d !== null); // Remove any records that failed to process
+      unrendered = [];
+      lastRender = performance.now();
+    };
+
+    if (DATA_TRANSPORT === 'columnar') {
+      rawData = await fetchColumnarRecords();
+    } else if (DATA_TRANSPORT === 'ndjson' && window.ReadableStream && window.TextDecoder) {
+      // Draw the map and summary cards as batches arrive instead of after the whole body
+      let expectedCount = null;
+      await streamRecords((batch, expected) => {
+        // A loop rather than push(...batch): large batches can exceed the argument limit
+        for (const d of batch) {
+          rawData.push(d);
+          unrendered.push(d);
+        }
+        expectedCount = expected;
+        if (performance.now() - lastRender >= STREAM_RENDER_INTERVAL_MS) renderProgress(expected);
+      });
+      if (unrendered.length) updateStreamingSummary(totals, unrendered, expectedCount);
+    } else {
+      const res = await fetch('/api/data');
+      if (!res.ok) {
+        throw new Error(`HTTP error! status: ${res.status}`);
+      }
+      const data = await res.json();
+      if (!Array.isArray(data)) {
+        throw new Error('No data received or invalid data format');
+      }
+      rawData = data.map(processRecord).filter(d => d !== null); // Remove any records that failed to process
+    }
 
     if (rawData.length === 0) {
       throw new Error('No valid records after processing');
@@ -83,21 +223,17 @@ async function fetchData() {
     // Add log to check magnitude_type in processed data
     console.log("Sample magnitude_type values:", rawData.slice(0, 10).map(d => d.magnitude_type));
 
-    // Initialize visualizations with the fetched data
-    updateSummaryCards(filteredData);
-    violinPlot(filteredData);
-    timeSeriesPlot(filteredData);
-    typePieChart(filteredData);
-    regionsBarChart(filteredData);
-    initHeatmap(filteredData); // Initialize enhanced heatmap
-    correlationHeatmap(filteredData); // Initialize correlation heatmap
+    // Initialize visualizations with the fetched data; aggregate charts are
+    // rendered from server rollups by applyFilters()
+    if (heatmapMap) {
+      updateHeatmapData(filteredData); // The map was already created while streaming
+    } else {
+      initHeatmap(filteredData); // Initialize enhanced heatmap
+    }
     depthDistributionPlots(filteredData);
     sigDistributionPlots(filteredData);
     magDepthScatterPlot(filteredData); // The preferred Magnitude vs Depth plot
     magSigScatterPlot(filteredData); // Magnitude vs Significance
-    magTypeDistributionPlots(filteredData); // Magnitude Measurement Type
-    tsunamiDistributionPlots(filteredData); // Tsunami Analysis
-    detailedCountryAnalysis(filteredData); // Detailed Country Analysis
 
   } catch (error) {
     console.error('Error fetching or processing data:', error);
@@ -127,6 +263,7 @@ function filterData() {
   const startDate = document.getElementById('startDate').value ? new Date(document.getElementById('startDate').value) : null;
   const endDate = document.getElementById('endDate').value ? new Date(document.getElementById('endDate').value) : null;
   const categoryFilter = document.getElementById('typeFilter').value;
+  const tsunamiFilter = document.getElementById('tsunamiFilter').value;
 
   filteredData = rawData.filter(d => {
     // Ensure magnitude, depth, and date_time are valid for filtering
@@ -157,8 +294,9 @@ function filterData() {
     }
 
     const categoryMatch = (categoryFilter === 'All') || (d.magnitude_category === categoryFilter);
+    const tsunamiMatch = (tsunamiFilter === 'All') || (d.tsunami === parseInt(tsunamiFilter));
 
-    return magnitudeMatch && depthMatch && dateMatch && categoryMatch;
+    return magnitudeMatch && depthMatch && dateMatch && categoryMatch && tsunamiMatch;
   });
   console.log("Filtered data:", filteredData.length, filteredData); // Log filtered data
 }
@@ -189,61 +327,68 @@ function animateCount(id, endValue, decimals = 0) {
   step();
 }
 
-// Update summary cards with filtered data
-function updateSummaryCards(data) {
-  if (data.length === 0) {
+// Update summary cards from the server rollup summary
+function updateSummaryCards(rollups) {
+  const summary = rollups.summary;
+  if (summary.count === 0) {
     document.getElementById('totalEarthquakes').textContent = '-';
     document.getElementById('avgMagnitude').textContent = '-';
     document.getElementById('avgDepth').textContent = '-';
     return;
   }
 
-  // Filter out non-numeric values before calculating averages
-  const validMagnitudeData = data.map(d => d.magnitude).filter(m => typeof m === 'number' && !isNaN(m));
-  const validDepthData = data.map(d => d.depth).filter(d => typeof d === 'number' && !isNaN(d));
-
-  const totalEarthquakes = data.length;
-  const avgMagnitude = validMagnitudeData.length > 0 ? validMagnitudeData.reduce((sum, m) => sum + m, 0) / validMagnitudeData.length : 0;
-  const avgDepth = validDepthData.length > 0 ? validDepthData.reduce((sum, d) => sum + d, 0) / validDepthData.length : 0;
-
-  animateCount('totalEarthquakes', totalEarthquakes);
-  animateCount('avgMagnitude', avgMagnitude, 2);
-  animateCount('avgDepth', avgDepth, 2);
+  animateCount('totalEarthquakes', summary.count);
+  animateCount('avgMagnitude', summary.avg_magnitude || 0, 2);
+  animateCount('avgDepth', summary.avg_depth || 0, 2);
 }
 
-// Violin plot: Magnitude Distribution
-function violinPlot(data) {
-  console.log("violinPlot called with data:", data.length);
-  // Filter out invalid data for violin plot
-  const validData = data.filter(d => d.magnitude != null && !isNaN(d.magnitude));
-   console.log("violinPlot - valid data points:", validData.length);
-
-  const magnitudeCategories = {
-      'Low': [0, 4.5],
-      'Medium': [4.5, 6.0],
-      'High': [6.0, 7.0],
-      'Critical': [7.0, Infinity]
-  };
-
-  const traces = Object.keys(magnitudeCategories).map(category => {
-      const [min, max] = magnitudeCategories[category];
-      const categoryData = validData.filter(d => d.magnitude >= min && d.magnitude < max); // Use validData
-      return {
-          type: 'violin',
-          y: categoryData.map(d => d.magnitude), // Use categoryData
-          name: `${category} (${min}-${max}${category === 'Critical' ? '>' : ''})`,
-          box: { visible: true },
-          meanline: { visible: true },
-          points: 'none', // Hide individual points for clarity
-          jitter: 0.05,
-          scalemode: 'count',
-          fillcolor: magnitudeColor(min + (max-min)/2, true), // Use fill color based on magnitude
-          line: { color: magnitudeColor(min + (max-min)/2, false) }
-      };
-  }).filter(trace => trace.y.length > 0); // Only include traces with data
+// Violin plot: Magnitude Distribution, drawn from server-side quantiles and density outlines
+function violinPlot(rollups) {
+  const bands = rollups.violin.filter(band => band.count > 0);
+  console.log("violinPlot called with bands:", bands.length);
+
+  const traces = [];
+  bands.forEach((band, i) => {
+      const [min, max] = band.range;
+      const upper = max === null ? Infinity : max;
+      const mid = upper === Infinity ? min + 0.5 : min + (upper - min) / 2;
+      const name = `${band.name} (${min}-${upper}${band.name === 'Critical' ? '>' : ''})`;
+      // Mirror the density around the band's slot on the x axis to draw the violin body
+      const peak = Math.max(...band.density.x) || 1;
+      const half = band.density.x.map(v => 0.4 * v / peak);
+      traces.push({
+          type: 'scatter',
+          mode: 'lines',
+          x: half.map(v => i + v).concat(half.map(v => i - v).reverse()),
+          y: band.density.y.concat([...band.density.y].reverse()),
+          fill: 'toself',
+          name: name,
+          legendgroup: band.name,
+          hoverinfo: 'skip',
+          fillcolor: magnitudeColor(mid, true),
+          line: { color: magnitudeColor(mid, false) }
+      });
+      traces.push({
+          type: 'box',
+          x: [i],
+          q1: [band.q1],
+          median: [band.median],
+          q3: [band.q3],
+          lowerfence: [band.lowerfence],
+          upperfence: [band.upperfence],
+          mean: [band.mean],
+          width: 0.1,
+          name: name,
+          legendgroup: band.name,
+          showlegend: false,
+          fillcolor: 'white',
+          line: { color: magnitudeColor(mid, false) }
+      });
+  });
 
   const layout = {
     title: 'Magnitude Distribution by Category',
+    xaxis: { tickvals: bands.map((_, i) => i), ticktext: bands.map(band => band.name) },
     yaxis: { title: 'Magnitude', zeroline: false },
     height: 360,
     margin: { t: 40, r: 20, b: 60, l: 60 },
@@ -264,41 +409,12 @@ function violinPlot(data) {
   if(chartDiv) Plotly.newPlot(chartDiv, traces, layout, { responsive: true });
 }
 
-// Time series plot: Earthquake Frequency Over Time
-function timeSeriesPlot(data, period = 'day') {
-  console.log("timeSeriesPlot called with data:", data.length, "period:", period);
-  // Aggregate data by selected period
-  const counts = {};
-  // Filter out records with invalid date_time before aggregation
-  const validData = data.filter(d => d.date_time instanceof Date && !isNaN(d.date_time));
-  console.log("timeSeriesPlot - valid data points after date check:", validData.length);
+// Time series plot: Earthquake Frequency Over Time, counts come pre-bucketed from the server
+function timeSeriesPlot(rollups, period = 'day') {
+  console.log("timeSeriesPlot called with period:", period);
+  const series = rollups.time_series[period];
+  const sortedKeys = series.x;
 
-  validData.forEach(d => {
-      let key;
-      if (period === 'day') key = d.date_time.toDateString();
-      else if (period === 'week') { 
-        const date = new Date(d.date_time.getFullYear(), d.date_time.getMonth(), d.date_time.getDate());
-        const dayOfWeek = date.getDay();
-        const startOfWeek = new Date(date);
-        startOfWeek.setDate(date.getDate() - dayOfWeek);
-        key = startOfWeek.toDateString();
-      } else if (period === 'month') key = `${d.date_time.getFullYear()}-${d.date_time.getMonth() + 1}`;
-      else if (period === 'year') key = `${d.date_time.getFullYear()}`;
-      
-      // Ensure key is a string or a consistent type for grouping
-      if (key) {
-        counts[key] = (counts[key] || 0) + 1;
-      }
-  });
-  
-  console.log("timeSeriesPlot - generated counts:", counts);
-
-  // Sort dates/keys correctly
-  const sortedKeys = Object.keys(counts).sort((a, b) => {
-      if (period === 'month' || period === 'year') return a.localeCompare(b); // String comparison for year/month strings
-      return new Date(a) - new Date(b); // Date object comparison for day/week strings
-  });
-  
    const chartDiv = document.getElementById('chart-time-series');
 
   if (!sortedKeys || sortedKeys.length === 0) {
@@ -308,8 +424,8 @@ function timeSeriesPlot(data, period = 'day') {
       return;
   }
 
-  const x = sortedKeys.map(key => period === 'month' || period === 'year' ? key : new Date(key));
-  const y = sortedKeys.map(key => counts[key]);
+  const x = sortedKeys;
+  const y = series.y;
 
   const trace = {
     x: x,
@@ -341,40 +457,20 @@ function timeSeriesPlot(data, period = 'day') {
 }
 
 // Pie chart: Magnitude Category Distribution
-function typePieChart(data) {
-  console.log("typePieChart called with data:", data.length);
-  
-  // Filter out invalid data points and count types
-  const typeCounts = {};
-  const validData = data.filter(d => d.magnitude_category != null && d.magnitude_category !== '' && d.magnitude_category !== 'Unknown'); // Also exclude 'Unknown'
-  console.log("typePieChart - valid data points:", validData.length);
+function typePieChart(rollups) {
+  const labels = rollups.magnitude_category.labels;
+  const values = rollups.magnitude_category.values;
+  console.log("typePieChart called with categories:", labels.length);
 
    const chartDiv = document.getElementById('chart-type-pie');
 
-  if (!validData || validData.length === 0) {
+  if (labels.length === 0) {
       console.warn("No valid data points for magnitude category distribution pie chart");
       if(chartDiv) Plotly.purge(chartDiv);
       if(chartDiv) chartDiv.innerHTML = '<div class="no-data-message">No data available for Magnitude Category Distribution</div>';
       return;
   }
 
-  validData.forEach(d => {
-    // Ensure category is a string before using as a key
-    const category = String(d.magnitude_category);
-    typeCounts[category] = (typeCounts[category] || 0) + 1;
-  });
-
-  console.log("Type counts:", typeCounts);
-
-  // Sort types by count in descending order
-  const sortedTypes = Object.entries(typeCounts)
-     .map(([label, value]) => [label, typeof value === 'number' ? value : parseFloat(value)]) // Ensure values are numbers
-     .filter(([label, value]) => Number.isFinite(value) && label !== null && label !== '') // Filter out non-finite values and invalid labels
-     .sort(([, a], [, b]) => b - a);
-
-  const labels = sortedTypes.map(([label]) => label);
-  const values = sortedTypes.map(([, value]) => value);
-
   // Using colors that roughly correspond to magnitude danger levels or a diverse palette
   const colors = labels.map(label => {
       // Assign colors based on the magnitude categories generated in the backend
@@ -420,34 +516,14 @@ function typePieChart(data) {
 }
 
 // Bar chart: Top Affected Regions (Countries)
-function regionsBarChart(data) {
-  console.log("regionsBarChart called with data:", data.length);
-  const regionCounts = {};
-   const validData = data.filter(d => d.country != null && d.country !== '' && d.country !== 'Unknown'); // Exclude Unknown
-   console.log("regionsBarChart - valid data points:", validData.length);
+function regionsBarChart(rollups) {
+  const countries = rollups.countries;
+  console.log("regionsBarChart called with countries:", countries.country.length);
 
     const chartDiv = document.getElementById('chart-regions-bar');
 
-    if (!validData || validData.length === 0) {
-      console.warn("No valid data points for regions bar chart");
-      if(chartDiv) Plotly.purge(chartDiv);
-      if(chartDiv) chartDiv.innerHTML = '<div class="no-data-message">No data available for Top Affected Regions</div>';
-      return;
-  }
-
-  validData.forEach(d => {
-    // Ensure country is a string before using as a key
-    const country = String(d.country);
-    regionCounts[country] = (regionCounts[country] || 0) + 1;
-  });
-
-  console.log("Region counts:", regionCounts);
-
-  const sortedRegions = Object.entries(regionCounts).sort(([, a], [, b]) => b - a);
   const topN = 10; // Display top 10 regions
-  const topRegions = sortedRegions.slice(0, topN);
-
-  console.log("Top regions:", topRegions);
+  const topRegions = countries.country.slice(0, topN).map((country, i) => [country, countries.count[i]]);
 
   if (!topRegions || topRegions.length === 0) {
       console.warn("No top regions found after counting");
@@ -562,6 +638,25 @@ let heatmapMap;
 let heatmapLayer;
 let markerLayer;
 let currentHeatmapData = [];
+let heatmapCells = null;
+
+// Fetch pre-aggregated heatmap cells for the visible map area; binning happens on the server
+async function loadHeatmapCells() {
+  if (!heatmapMap) return;
+  const params = getFilterParams();
+  params.set('zoom', Math.round(heatmapMap.getZoom()));
+  params.set('bbox', heatmapMap.getBounds().toBBoxString());
+  try {
+    const response = await fetch(`/api/heatmap?${params}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    heatmapCells = await response.json();
+    updateHeatmap();
+  } catch (error) {
+    console.error('Error loading heatmap cells:', error);
+  }
+}
 
 function initHeatmap(data) {
   console.log("initHeatmap called with data:", data.length);
@@ -602,8 +697,10 @@ function initHeatmap(data) {
   heatmapLayer.addTo(heatmapMap);
   markerLayer.addTo(heatmapMap);
   
-  // Update heatmap with default settings
+  // Update heatmap with default settings, then refresh cells whenever the view changes
   updateHeatmap();
+  heatmapMap.on('moveend', loadHeatmapCells);
+  loadHeatmapCells();
   
   // Add event listeners for controls
   addHeatmapEventListeners();
@@ -647,35 +744,18 @@ function updateHeatmap() {
   let heatmapData = [];
   let maxValue = 0;
 
-  if (metric === 'count') {
-    // Count earthquakes in each location (group by lat/lon)
-    const locationCounts = {};
-    currentHeatmapData.forEach(d => {
-      const key = `${d.latitude.toFixed(3)},${d.longitude.toFixed(3)}`;
-      locationCounts[key] = (locationCounts[key] || 0) + 1;
-    });
-    
-    Object.entries(locationCounts).forEach(([key, count]) => {
-      const [lat, lon] = key.split(',').map(Number);
-      heatmapData.push([lat, lon, count]);
-      maxValue = Math.max(maxValue, count);
-    });
-  } else {
-    // Use the selected metric value
-    currentHeatmapData.forEach(d => {
-      let value = 0;
-      switch (metric) {
-        case 'magnitude':
-          value = d.magnitude || 0;
-          break;
-        case 'depth':
-          value = d.depth || 0;
-          break;
-        case 'significance':
-          value = d.significance || 0;
-          break;
-      }
-      heatmapData.push([d.latitude, d.longitude, value]);
+  if (heatmapCells) {
+    // Each server cell already holds the aggregate for its area at the current zoom
+    const cells = heatmapCells.cells;
+    const field = {
+      count: 'count',
+      magnitude: 'max_magnitude',
+      depth: 'mean_depth',
+      significance: 'mean_sig'
+    }[metric];
+    cells.lat.forEach((lat, i) => {
+      const value = cells[field][i] || 0;
+      heatmapData.push([lat, cells.lon[i], value]);
       maxValue = Math.max(maxValue, value);
     });
   }
@@ -693,28 +773,7 @@ function updateHeatmap() {
 
   // Add individual markers if enabled
   if (showMarkers) {
-    currentHeatmapData.forEach(d => {
-      const color = magnitudeColor(d.magnitude);
-      const radius = Math.max(3, (d.magnitude || 0) * 1.5);
-
-      const marker = L.circleMarker([d.latitude, d.longitude], {
-        color: color,
-        fillColor: color,
-        fillOpacity: 0.7,
-        radius: radius,
-        weight: 1.5
-      })
-      .bindPopup(
-        `<b>Magnitude: ${typeof d.magnitude === 'number' ? d.magnitude.toFixed(2) : 'N/A'}</b><br>
-         Depth: ${typeof d.depth === 'number' ? d.depth.toFixed(2) : 'N/A'} km<br>
-         Significance: ${typeof d.significance === 'number' ? d.significance.toFixed(2) : 'N/A'}<br>
-         Location: ${d.location || 'N/A'}<br>
-         Time: ${d.date_time instanceof Date && !isNaN(d.date_time) ? d.date_time.toLocaleString() : 'N/A'}<br>
-         Tsunami: ${d.tsunami === 1 ? 'Yes' : (d.tsunami === 0 ? 'No' : 'N/A')}`
-      );
-      
-      markerLayer.addLayer(marker);
-    });
+    currentHeatmapData.forEach(d => markerLayer.addLayer(createEventMarker(d)));
     markerLayer.addTo(heatmapMap);
   }
 
@@ -722,6 +781,37 @@ function updateHeatmap() {
   updateHeatmapLegend(metric, maxValue);
 }
 
+// Circle marker with a details popup for one event
+function createEventMarker(d) {
+  const color = magnitudeColor(d.magnitude);
+  const radius = Math.max(3, (d.magnitude || 0) * 1.5);
+
+  return L.circleMarker([d.latitude, d.longitude], {
+    color: color,
+    fillColor: color,
+    fillOpacity: 0.7,
+    radius: radius,
+    weight: 1.5
+  })
+  .bindPopup(
+    `<b>Magnitude: ${typeof d.magnitude === 'number' ? d.magnitude.toFixed(2) : 'N/A'}</b><br>
+     Depth: ${typeof d.depth === 'number' ? d.depth.toFixed(2) : 'N/A'} km<br>
+     Significance: ${typeof d.significance === 'number' ? d.significance.toFixed(2) : 'N/A'}<br>
+     Location: ${d.location || 'N/A'}<br>
+     Time: ${d.date_time instanceof Date && !isNaN(d.date_time) ? d.date_time.toLocaleString() : 'N/A'}<br>
+     Tsunami: ${d.tsunami === 1 ? 'Yes' : (d.tsunami === 0 ? 'No' : 'N/A')}`
+  );
+}
+
+// Add markers for newly received records without redrawing the ones already on the map
+function appendHeatmapRecords(records) {
+  const validData = records.filter(d => d.latitude != null && d.longitude != null && !isNaN(d.latitude) && !isNaN(d.longitude));
+  for (const d of validData) currentHeatmapData.push(d);
+  if (markerLayer && document.getElementById('showMarkers').checked) {
+    validData.forEach(d => markerLayer.addLayer(createEventMarker(d)));
+  }
+}
+
 function updateHeatmapLegend(metric, maxValue) {
   const legendText = document.querySelector('.legend-text');
   if (legendText) {
@@ -789,69 +879,54 @@ function updateHeatmapData(data) {
   }
 
   currentHeatmapData = validData;
-  updateHeatmap();
+  loadHeatmapCells();
 }
 
 // Correlation Heatmap functionality
-function correlationHeatmap(data) {
-  console.log("correlationHeatmap called with data:", data.length);
-  
+let correlationRequest = 0;
+
+// Correlation matrix for the current filters; ranking and the matrix product run on the server
+async function correlationHeatmap() {
   const chartDiv = document.getElementById('correlation-heatmap');
   if (!chartDiv) {
     console.warn("Correlation heatmap div not found.");
     return;
   }
 
-  // Filter out invalid data points
-  const validData = data.filter(d => 
-    d.magnitude != null && !isNaN(d.magnitude) &&
-    d.depth != null && !isNaN(d.depth) &&
-    d.significance != null && !isNaN(d.significance) &&
-    d.latitude != null && !isNaN(d.latitude) &&
-    d.longitude != null && !isNaN(d.longitude)
-  );
-  
-  console.log("correlationHeatmap - valid data points:", validData.length);
-  
-  if (validData.length === 0) {
-    console.warn("No valid data points for correlation heatmap");
-    if(chartDiv) Plotly.purge(chartDiv);
-    if(chartDiv) chartDiv.innerHTML = '<div class="no-data-message">No data available for Correlation Matrix</div>';
-    return;
-  }
-
-  // Prepare data for correlation analysis
-  const correlationData = {
-    magnitude: validData.map(d => d.magnitude),
-    depth: validData.map(d => d.depth),
-    significance: validData.map(d => d.significance),
-    latitude: validData.map(d => Math.abs(d.latitude)), // Use absolute latitude
-    longitude: validData.map(d => Math.abs(d.longitude)) // Use absolute longitude
-  };
-
-  const parameters = ['magnitude', 'depth', 'significance', 'latitude', 'longitude'];
-  const parameterLabels = ['Magnitude', 'Depth', 'Significance', 'Latitude', 'Longitude'];
-  
-  // Calculate correlation matrix
-  const correlationMatrix = [];
+  const request = ++correlationRequest;
   const method = document.getElementById('correlationMethod').value;
   const showValues = document.getElementById('showCorrelationValues').checked;
+  const params = getFilterParams();
+  params.set('method', method);
+  // Absolute latitude/longitude, so distance from the equator/meridian is what gets correlated
+  params.set('columns', 'magnitude,depth,sig,abs_latitude,abs_longitude');
+  const parameterLabels = ['Magnitude', 'Depth', 'Significance', 'Latitude', 'Longitude'];
 
-  for (let i = 0; i < parameters.length; i++) {
-    correlationMatrix[i] = [];
-    for (let j = 0; j < parameters.length; j++) {
-      if (i === j) {
-        correlationMatrix[i][j] = 1.0; // Perfect correlation with itself
-      } else {
-        correlationMatrix[i][j] = calculateCorrelation(
-          correlationData[parameters[i]], 
-          correlationData[parameters[j]], 
-          method
-        );
-      }
+  let result;
+  try {
+    const response = await fetch(`/api/correlation?${params}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
     }
+    result = await response.json();
+  } catch (error) {
+    console.error('Error loading correlation matrix:', error);
+    return;
+  }
+  // Ignore responses that arrive after a newer filter change
+  if (request !== correlationRequest) return;
+
+  console.log("correlationHeatmap - rows:", result.rows);
+
+  if (result.rows === 0) {
+    console.warn("No valid data points for correlation heatmap");
+    Plotly.purge(chartDiv);
+    chartDiv.innerHTML = '<div class="no-data-message">No data available for Correlation Matrix</div>';
+    return;
   }
 
+  const correlationMatrix = result.matrix;
+
   // Create heatmap trace
   const trace = {
     z: correlationMatrix,
@@ -876,7 +951,7 @@ function correlationHeatmap(data) {
   // Add text annotations if enabled
   if (showValues) {
     trace.text = correlationMatrix.map(row => 
-      row.map(val => val.toFixed(3))
+      row.map(val => val === null ? 'n/a' : val.toFixed(3))
     );
     trace.texttemplate = '%{text}';
     trace.textfont = {
@@ -898,66 +973,7 @@ function correlationHeatmap(data) {
   };
 
   console.log("Plotting Correlation Heatmap with data:", correlationMatrix.length, "parameters");
-  if(chartDiv) Plotly.newPlot(chartDiv, [trace], layout, { responsive: true });
-}
-
-function calculateCorrelation(x, y, method) {
-  const n = x.length;
-  if (n !== y.length || n === 0) return 0;
-
-  if (method === 'pearson') {
-    // Calculate Pearson correlation coefficient
-    const sumX = x.reduce((a, b) => a + b, 0);
-    const sumY = y.reduce((a, b) => a + b, 0);
-    const sumXY = x.reduce((sum, xi, i) => sum + xi * y[i], 0);
-    const sumX2 = x.reduce((sum, xi) => sum + xi * xi, 0);
-    const sumY2 = y.reduce((sum, yi) => sum + yi * yi, 0);
-
-    const numerator = n * sumXY - sumX * sumY;
-    const denominator = Math.sqrt((n * sumX2 - sumX * sumX) * (n * sumY2 - sumY * sumY));
-    
-    return denominator === 0 ? 0 : numerator / denominator;
-  } else if (method === 'spearman') {
-    // Calculate Spearman rank correlation coefficient
-    const rankX = getRanks(x);
-    const rankY = getRanks(y);
-    
-    const sumD2 = rankX.reduce((sum, rx, i) => sum + Math.pow(rx - rankY[i], 2), 0);
-    const rs = 1 - (6 * sumD2) / (n * (n * n - 1));
-    
-    return rs;
-  }
-  
-  return 0;
-}
-
-function getRanks(arr) {
-  // Create array of indices sorted by values
-  const indices = arr.map((val, index) => ({ val, index }))
-    .sort((a, b) => a.val - b.val)
-    .map((item, rank) => ({ ...item, rank: rank + 1 }));
-  
-  // Handle ties by averaging ranks
-  const ranks = new Array(arr.length);
-  for (let i = 0; i < indices.length; i++) {
-    const current = indices[i];
-    let sumRank = current.rank;
-    let count = 1;
-    
-    // Check for ties
-    for (let j = i + 1; j < indices.length && indices[j].val === current.val; j++) {
-      sumRank += indices[j].rank;
-      count++;
-    }
-    
-    const avgRank = sumRank / count;
-    for (let j = 0; j < count; j++) {
-      ranks[indices[i + j].index] = avgRank;
-    }
-    i += count - 1;
-  }
-  
-  return ranks;
+  Plotly.newPlot(chartDiv, [trace], layout, { responsive: true });
 }
 
 async function initDashboard() {
@@ -981,6 +997,7 @@ async function initDashboard() {
   document.getElementById('startDate').addEventListener('change', applyFilters);
   document.getElementById('endDate').addEventListener('change', applyFilters);
   document.getElementById('typeFilter').addEventListener('change', applyFilters);
+  document.getElementById('tsunamiFilter').addEventListener('change', applyFilters);
 
   // Add event listeners for time series period buttons
   document.querySelectorAll('.time-series-btn').forEach(button => {
@@ -991,7 +1008,7 @@ async function initDashboard() {
       this.classList.add('active');
       const selectedPeriod = this.dataset.period; // Correctly get the period
       console.log("Calling timeSeriesPlot with period:", selectedPeriod);
-      timeSeriesPlot(filteredData, selectedPeriod); // Pass filteredData and the period
+      if (currentRollups) timeSeriesPlot(currentRollups, selectedPeriod);
     });
   });
 
@@ -1006,6 +1023,7 @@ async function initDashboard() {
     document.getElementById('startDate').value = '';
     document.getElementById('endDate').value = '';
     document.getElementById('typeFilter').value = 'All';
+    document.getElementById('tsunamiFilter').value = 'All';
 
     // Apply filters to update visualizations (resets to all data)
     applyFilters();
@@ -1013,6 +1031,7 @@ async function initDashboard() {
 
   // Anomaly detection event listeners
   document.getElementById('anomalyMetric').addEventListener('change', applyFilters);
+  document.getElementById('anomalyMethod').addEventListener('change', applyFilters);
 
   document.getElementById('anomalyThreshold').addEventListener('input', (e) => {
     document.getElementById('thresholdValue').textContent = e.target.value;
@@ -1026,165 +1045,76 @@ async function initDashboard() {
 }
 
 // Anomaly Detection Functions
-function calculateMean(arr) {
-  console.log("calculateMean called");
-   if (!arr || arr.length === 0) return 0; // Handle empty array
-  return arr.reduce((a, b) => a + b, 0) / arr.length;
-}
-
-function calculateStdDev(arr, mean) {
-  console.log("calculateStdDev called");
-  if (!arr || arr.length === 0) return 0; // Handle empty array
-  const squareDiffs = arr.map(value => {
-    const diff = value - mean;
-    return diff * diff;
-  });
-  return Math.sqrt(calculateMean(squareDiffs));
-}
-
-function detectAnomalies(data, metric, threshold) {
-  console.log("detectAnomalies called with data:", data.length, "metric:", metric, "threshold:", threshold);
-  // Ensure the metric exists in the data and filter out non-numeric values
-  const values = data.map(d => d[metric]).filter(v => typeof v === 'number' && !isNaN(v));
-  console.log(`Anomaly detection for ${metric}: found ${values.length} valid numeric values.`);
+let anomalyRequest = 0;
 
+// Fetch only the flagged events for the current filters; scoring runs on the server
+async function updateAnomalyChart(metric, threshold) {
+  console.log("updateAnomalyChart called with metric:", metric, "threshold:", threshold);
   const anomalyChartDiv = document.getElementById('chart-anomaly');
   const anomalyListDiv = document.getElementById('anomalyItems');
 
-  if (!values || values.length === 0) {
-    console.warn("No valid numeric values for anomaly detection.");
-     if(anomalyChartDiv) Plotly.purge(anomalyChartDiv);
-     if(anomalyChartDiv) anomalyChartDiv.innerHTML = '<div class="no-data-message">No data available for Anomaly Detection</div>';
-     if(anomalyListDiv) anomalyListDiv.innerHTML = '<div class="list-group-item">No data available for anomaly detection</div>';
-    return data.map(d => ({ ...d, isAnomaly: false, zScore: 0, deviation: 0 }));
-  }
-
-  const mean = calculateMean(values);
-  const stdDev = calculateStdDev(values, mean);
-  console.log(`${metric} - Mean: ${mean}, StdDev: ${stdDev}`);
-
-  // Handle cases where stdDev is zero to avoid division by zero
-  if (stdDev === 0) {
-    console.log("StdDev is zero, no anomalies detected by Z-score.");
-     if(anomalyChartDiv) Plotly.purge(anomalyChartDiv);
-     if(anomalyChartDiv) anomalyChartDiv.innerHTML = '<div class="no-data-message">No anomalies detected (Std Dev is Zero)</div>';
-     if(anomalyListDiv) anomalyListDiv.innerHTML = '<div class="list-group-item">No anomalies detected</div>';
-    return data.map(d => ({ ...d, isAnomaly: false, zScore: 0, deviation: (typeof d[metric] === 'number' && !isNaN(d[metric]) ? d[metric] - mean : 0) }));
-  }
+  const request = ++anomalyRequest;
+  const params = getFilterParams();
+  params.set('metric', metric);
+  params.set('threshold', threshold);
+  params.set('method', document.getElementById('anomalyMethod').value);
 
-  return data.map((d) => {
-    const value = d[metric];
-    let zScore = 0;
-    let deviation = 0;
-    if (typeof value === 'number' && !isNaN(value)) {
-        deviation = value - mean;
-        zScore = Math.abs(deviation / stdDev);
-    }
-
-    return {
-      ...d,
-      isAnomaly: zScore > threshold,
-      zScore: zScore,
-      deviation: deviation
-    };
-  });
-}
-
-function updateAnomalyChart(data, metric, threshold) {
-  console.log("updateAnomalyChart called with data:", data.length, "metric:", metric, "threshold:", threshold);
-  const anomaliesData = detectAnomalies(data, metric, threshold);
-   // Ensure anomaliesData is valid before filtering values
-  const values = anomaliesData.map(d => d[metric]).filter(v => typeof v === 'number' && !isNaN(v)); // Use anomaliesData here
-
-  const anomalyChartDiv = document.getElementById('chart-anomaly');
-  const anomalyListDiv = document.getElementById('anomalyItems');
-
-   if (!anomaliesData || anomaliesData.length === 0 || !values || values.length === 0) {
-       console.log("updateAnomalyChart: No valid data or anomaliesData is empty.");
-       if(anomalyChartDiv) Plotly.purge(anomalyChartDiv);
-       if(anomalyChartDiv) anomalyChartDiv.innerHTML = '<div class="no-data-message">No data available for Anomaly Detection</div>';
-       if(anomalyListDiv) anomalyListDiv.innerHTML = '<div class="list-group-item">No anomalies detected</div>';
-       return;
+  let result;
+  try {
+    const response = await fetch(`/api/anomalies?${params}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
     }
+    result = await response.json();
+  } catch (error) {
+    console.error('Error loading anomalies:', error);
+    return;
+  }
+  // Ignore responses that arrive after a newer filter change
+  if (request !== anomalyRequest) return;
+
+  if (result.scored === 0) {
+    console.log("updateAnomalyChart: No valid data to score.");
+    if(anomalyChartDiv) Plotly.purge(anomalyChartDiv);
+    if(anomalyChartDiv) anomalyChartDiv.innerHTML = '<div class="no-data-message">No data available for Anomaly Detection</div>';
+    if(anomalyListDiv) anomalyListDiv.innerHTML = '<div class="list-group-item">No anomalies detected</div>';
+    return;
+  }
 
-  const mean = calculateMean(values);
-  const stdDev = calculateStdDev(values, mean);
-
-  const upperBound = mean + (threshold * stdDev);
-  const lowerBound = mean - (threshold * stdDev);
-
-  console.log(`Anomaly Chart Bounds for ${metric}: Upper=${upperBound}, Lower=${lowerBound}, Mean=${mean}`);
+  const anomalies = result.events;
+  const label = metric.replace(/_/g, ' ');
+  const locationOf = a => a.location || a.country || a.date_time || 'N/A';
 
   const trace = {
-    x: anomaliesData.map(d => d.location || d.country || (d.date_time instanceof Date && !isNaN(d.date_time) ? d.date_time.toLocaleString() : 'N/A')), // Use location or country or time as x-axis
-    y: anomaliesData.map(d => d[metric]),
+    x: anomalies.map(a => a.date_time),
+    y: anomalies.map(a => a.value),
     type: 'scatter',
     mode: 'markers',
-    name: 'Values',
+    name: 'Anomalies',
     marker: {
       size: 8,
       opacity: 0.7,
-      color: anomaliesData.map(a => a.isAnomaly ? '#d62728' : '#2196F3'), // Red for anomaly, Blue for non-anomaly
+      color: '#d62728', // Red for anomaly
       line: {
         width: 1,
         color: 'var(--surface)'
       }
     },
-    text: anomaliesData.map(a => `Location: ${a.location || a.country || (a.date_time instanceof Date && !isNaN(a.date_time) ? a.date_time.toLocaleString() : 'N/A')}<br>${metric.replace(/_/g, ' ')}: ${typeof a[metric] === 'number' ? a[metric].toFixed(2) : 'N/A'}<br>Anomaly: ${a.isAnomaly ? 'Yes (' + a.zScore.toFixed(2) + 'σ)' : 'No'}`), // Use 'a' here as it's the anomaly object
+    text: anomalies.map(a => `Location: ${locationOf(a)}<br>${label}: ${a.value.toFixed(2)}<br>Score: ${a.score.toFixed(2)}σ`),
     hoverinfo: 'text'
   };
 
-  const upperBoundTrace = {
-    x: anomaliesData.map(d => d.location || d.country || (d.date_time instanceof Date && !isNaN(d.date_time) ? d.date_time.toLocaleString() : 'N/A')),
-    y: Array(anomaliesData.length).fill(upperBound),
-    type: 'scatter',
-    mode: 'lines',
-    name: `Upper Bound (${threshold}σ)`,
-    line: {
-      color: '#FF9800', // Orange for warning/bounds
-      dash: 'dash',
-      width: 1
-    }
-  };
-
-  const lowerBoundTrace = {
-    x: anomaliesData.map(d => d.location || d.country || (d.date_time instanceof Date && !isNaN(d.date_time) ? d.date_time.toLocaleString() : 'N/A')),
-    y: Array(anomaliesData.length).fill(lowerBound),
-    type: 'scatter',
-    mode: 'lines',
-    name: `Lower Bound (${threshold}σ)`,
-    line: {
-      color: '#FF9800', // Orange for warning/bounds
-      dash: 'dash',
-      width: 1
-    }
-  };
-  
-  const meanTrace = {
-    x: anomaliesData.map(d => d.location || d.country || (d.date_time instanceof Date && !isNaN(d.date_time) ? d.date_time.toLocaleString() : 'N/A')),
-    y: Array(anomaliesData.length).fill(mean),
-    type: 'scatter',
-    mode: 'lines',
-    name: 'Mean',
-    line: {
-        color: '#757575', // Medium grey for text-secondary
-        dash: 'dot',
-        width: 1
-    }
-  };
-
   const layout = {
-    title: `${metric.replace(/_/g, ' ')} Anomaly Detection`,
+    title: `${label} Anomaly Detection (${result.flagged} of ${result.scored} events)`,
     xaxis: {
-      title: 'Location / Time',
-      tickangle: -45,
+      title: 'Time',
       automargin: true
     },
     yaxis: {
-      title: metric.replace(/_/g, ' '),
+      title: label,
       automargin: true
     },
-    margin: { t: 50, r: 30, b: 200, l: 70 },
+    margin: { t: 50, r: 30, b: 80, l: 70 },
     height: 550,
     showlegend: true,
     legend: {
@@ -1192,33 +1122,43 @@ function updateAnomalyChart(data, metric, threshold) {
       y: 1.1,
       orientation: 'h'
     },
-    shapes: [
-        { // Shading for the normal range
-            type: 'rect',
-            xref: 'paper',
-            yref: 'y',
-            x0: 0,
-            y0: lowerBound,
-            x1: 1,
-            y1: upperBound,
-            fillcolor: 'rgba(255, 255, 0, 0.1)', // Light yellow shading
-            line: { width: 0 },
-            layer: 'below'
-        }
-    ]
+    shapes: []
   };
 
-   // Check if main trace has data before plotting
-   if (!trace.x || trace.x.length === 0 || !trace.y || trace.y.length === 0) {
-       console.warn("Anomaly chart trace has no data.");
-        if(anomalyChartDiv) Plotly.purge(anomalyChartDiv);
-        if(anomalyChartDiv) anomalyChartDiv.innerHTML = '<div class="no-data-message">No data available for Anomaly Detection</div>';
-   } else {
-      console.log("Plotting Anomaly Chart with data:", trace.x.length);
-      if(anomalyChartDiv) Plotly.newPlot(anomalyChartDiv, [trace, upperBoundTrace, lowerBoundTrace, meanTrace], layout, { responsive: true });
-   }
+  // Global methods have fixed bounds; rolling scores compare each event to its own window
+  if (result.lower !== null && result.upper !== null) {
+    const line = (y, color, dash) => ({
+      type: 'line', xref: 'paper', yref: 'y', x0: 0, x1: 1, y0: y, y1: y,
+      line: { color: color, dash: dash, width: 1 }
+    });
+    layout.shapes.push(
+      { // Shading for the normal range
+        type: 'rect',
+        xref: 'paper',
+        yref: 'y',
+        x0: 0,
+        y0: result.lower,
+        x1: 1,
+        y1: result.upper,
+        fillcolor: 'rgba(255, 255, 0, 0.1)', // Light yellow shading
+        line: { width: 0 },
+        layer: 'below'
+      },
+      line(result.upper, '#FF9800', 'dash'),
+      line(result.lower, '#FF9800', 'dash'),
+      line(result.center, '#757575', 'dot')
+    );
+  }
 
-  updateAnomalyList(anomaliesData.filter(a => a.isAnomaly), metric); // Pass only anomalies to the list
+  if (anomalies.length === 0) {
+    if(anomalyChartDiv) Plotly.purge(anomalyChartDiv);
+    if(anomalyChartDiv) anomalyChartDiv.innerHTML = '<div class="no-data-message">No anomalies detected</div>';
+  } else {
+    console.log("Plotting Anomaly Chart with anomalies:", anomalies.length);
+    if(anomalyChartDiv) Plotly.newPlot(anomalyChartDiv, [trace], layout, { responsive: true });
+  }
+
+  updateAnomalyList(anomalies, metric); // Events arrive sorted by score, highest first
 }
 
 function updateAnomalyList(anomalies, metric) {
@@ -1236,12 +1176,11 @@ function updateAnomalyList(anomalies, metric) {
   console.log("Rendering anomaly list for", anomalies.length, "anomalies.");
 
   anomalyItems.innerHTML = anomalies
-    .sort((a, b) => b.zScore - a.zScore) // Sort by z-score descending
     .map(a => {
-        const locationText = a.location || a.country || (a.date_time instanceof Date && !isNaN(a.date_time) ? a.date_time.toLocaleString() : 'N/A');
-        const valueText = typeof a[metric] === 'number' ? a[metric].toFixed(2) : 'N/A';
-        const deviationText = typeof a.deviation === 'number' ? `${a.deviation > 0 ? '+' : ''}${a.deviation.toFixed(2)} from mean` : '';
-        const zScoreText = typeof a.zScore === 'number' ? `${a.zScore.toFixed(2)}σ` : '';
+        const locationText = a.location || a.country || a.date_time || 'N/A';
+        const valueText = typeof a.value === 'number' ? a.value.toFixed(2) : 'N/A';
+        const deviationText = typeof a.deviation === 'number' ? `${a.deviation > 0 ? '+' : ''}${a.deviation.toFixed(2)} from expected` : '';
+        const zScoreText = typeof a.score === 'number' ? `${a.score.toFixed(2)}σ` : '';
 
         return `
           <div class="list-group-item d-flex justify-content-between align-items-center">
@@ -1260,44 +1199,75 @@ function updateAnomalyList(anomalies, metric) {
     console.log("Anomaly list rendered.");
 }
 
+let currentRollups = null;
+let rollupRequest = 0;
 
-// Update applyFilters function to include anomaly detection and pass current period
-function applyFilters() {
-  console.log("Applying filters and updating visualizations..."); // Log filter application
-  filterData();
-  updateSummaryCards(filteredData);
-  // Call all chart plotting functions with filtered data
-  magDepthScatterPlot(filteredData);
-  violinPlot(filteredData);
+// Fetch chart aggregates for the current filters; the server caches them per filter set
+async function loadRollups() {
+  const request = ++rollupRequest;
+  const response = await fetch(`/api/rollups?${getFilterParams()}`);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const rollups = await response.json();
+  // Ignore responses that arrive after a newer filter change
+  return request === rollupRequest ? rollups : null;
+}
+
+// Render every chart that is drawn from server rollups
+function renderRollupCharts(rollups) {
+  currentRollups = rollups;
+  updateSummaryCards(rollups);
+  violinPlot(rollups);
 
   const selectedPeriodButton = document.querySelector('.time-series-btn.active');
   // Ensure a default period if no button is active (shouldn't happen with initial 'day' active)
   const period = selectedPeriodButton ? selectedPeriodButton.dataset.period : 'day';
-  console.log("applyFilters: Selected time series period:", period);
-  timeSeriesPlot(filteredData, period);
+  console.log("renderRollupCharts: Selected time series period:", period);
+  timeSeriesPlot(rollups, period);
+
+  typePieChart(rollups); // Magnitude Category Distribution
+  regionsBarChart(rollups);
+  magTypeDistributionPlots(rollups);
+  tsunamiDistributionPlots(rollups);
+
+  // Detailed Country Analysis
+  detailedCountryAnalysis(rollups);
+}
 
-  typePieChart(filteredData); // Magnitude Category Distribution
-  regionsBarChart(filteredData);
+// Update applyFilters function to include anomaly detection and server-side rollups
+function applyFilters() {
+  console.log("Applying filters and updating visualizations..."); // Log filter application
+  filterData();
+
+  // Aggregate charts are computed on the server
+  loadRollups()
+    .then(rollups => { if (rollups) renderRollupCharts(rollups); })
+    .catch(error => console.error('Error loading chart rollups:', error));
+
+  // Call the remaining chart plotting functions with filtered data
+  magDepthScatterPlot(filteredData);
   updateHeatmapData(filteredData); // Update heatmap with filtered data
-  correlationHeatmap(filteredData); // Update correlation heatmap with filtered data
+  correlationHeatmap(); // Update correlation heatmap for the current filters
 
-  // Distribution and Categorical charts
+  // Distribution charts
   depthDistributionPlots(filteredData);
   sigDistributionPlots(filteredData);
-  magTypeDistributionPlots(filteredData);
-  tsunamiDistributionPlots(filteredData);
 
   // Relationship plots
   magSigScatterPlot(filteredData);
 
-  // Detailed Country Analysis
-  detailedCountryAnalysis(filteredData);
-
   // Anomaly detection
   const metric = document.getElementById('anomalyMetric').value;
   const threshold = parseFloat(document.getElementById('anomalyThreshold').value);
   console.log("applyFilters: Anomaly detection metric:", metric, "threshold:", threshold);
-  updateAnomalyChart(filteredData, metric, threshold);
+  updateAnomalyChart(metric, threshold);
+
+  // Refresh the data table from the server with the new filters
+  if (tableLoaded) {
+    currentPage = 1;
+    loadEarthquakeData();
+  }
 }
 
 // Prediction page logic with loading spinner & colored badges
@@ -1401,6 +1371,7 @@ function initPrediction() {
             <div class="result-icon" style="color:${iconColor};">${iconHtml}</div>
             <div class="result-title">${result.prediction}</div>
             <div class="result-message">${riskMsg}</div>
+            ${nearbyHistoryHtml(result.nearby)}
           </div>
         `;
         resultDiv.style.display = 'block';
@@ -1424,6 +1395,19 @@ function initPrediction() {
     }
   });
 
+  // Past events around the predicted location, as reported by /api/predict
+  function nearbyHistoryHtml(nearby) {
+    if (!nearby) return '';
+    const radius = Math.round(nearby.radius_km);
+    if (nearby.count === 0) {
+      return `<div class="result-message small text-muted">No recorded events within ${radius} km.</div>`;
+    }
+    const parts = [`${nearby.count} past event${nearby.count === 1 ? '' : 's'}`];
+    if (nearby.max_magnitude !== null) parts.push(`up to magnitude ${nearby.max_magnitude.toFixed(1)}`);
+    if (nearby.tsunami_rate !== null) parts.push(`${Math.round(nearby.tsunami_rate * 100)}% with a tsunami`);
+    return `<div class="result-message small text-muted">Within ${radius} km: ${parts.join(', ')}.</div>`;
+  }
+
   clearBtn.addEventListener('click', () => {
     form.reset();
     resultDiv.innerHTML = '';
@@ -1724,18 +1708,17 @@ function magSigScatterPlot(data) {
 }
 
 // Magnitude Measurement Type Distribution
-function magTypeDistributionPlots(data) {
-  console.log("magTypeDistributionPlots called with data:", data.length);
-  
-  // Filter out invalid data points and count types
-  const typeCounts = {};
-  const validData = data.filter(d => d.magType != null && d.magType !== '');
-  console.log("magTypeDistributionPlots - valid data points BEFORE counting:", validData.length, validData);
-  
+function magTypeDistributionPlots(rollups) {
+  const magTypes = (rollups && rollups.mag_type) || { labels: [], values: [] };
+  const labels = magTypes.labels || [];
+  const values = magTypes.values || [];
+  console.log("magTypeDistributionPlots called with types:", labels.length);
+
   const barDiv = document.getElementById('chart-mag-type-bar');
   const pieDiv = document.getElementById('chart-mag-type-pie');
 
-  if (validData.length === 0) {
+  // An empty rollup (no events match the filters) has no types or only zero counts
+  if (labels.length === 0 || values.length === 0 || values.every(v => v === 0)) {
       console.warn("No valid data points for magnitude type distribution plots");
       if(barDiv) Plotly.purge(barDiv);
       if(pieDiv) Plotly.purge(pieDiv);
@@ -1744,34 +1727,10 @@ function magTypeDistributionPlots(data) {
       return;
   }
 
-  validData.forEach(d => {
-      typeCounts[d.magType] = (typeCounts[d.magType] || 0) + 1;
-  });
-  
-  console.log("magTypeDistributionPlots - type counts AFTER counting:", typeCounts);
-  
-  // Sort types by count in descending order
-  const sortedTypes = Object.entries(typeCounts)
-     .map(([label, value]) => [label, typeof value === 'number' ? value : parseFloat(value)]) // Ensure values are numbers
-     .filter(([label, value]) => Number.isFinite(value) && label !== null && label !== '') // Filter out non-finite values and invalid labels
-     .sort(([, a], [, b]) => b - a);
-
-  const labels = sortedTypes.map(([label]) => label);
-  const values = sortedTypes.map(([, value]) => value);
-
   // Add logs to check labels and values before plotting
   console.log("magTypeDistributionPlots - labels before plotting:", labels);
   console.log("magTypeDistributionPlots - values before plotting:", values);
 
-  if (labels.length === 0 || values.length === 0 || values.every(v => v === 0)) {
-    console.warn("No valid magnitude types found after counting or all counts are zero");
-      if(barDiv) Plotly.purge(barDiv);
-      if(pieDiv) Plotly.purge(pieDiv);
-      if(barDiv) barDiv.innerHTML = '<div class="no-data-message">No data available for Magnitude Type Bar Chart</div>';
-      if(pieDiv) pieDiv.innerHTML = '<div class="no-data-message">No data available for Magnitude Type Pie Chart</div>';
-    return;
-  }
-
   // Create bar chart trace
   const barTrace = {
     x: labels,
@@ -1841,35 +1800,15 @@ function magTypeDistributionPlots(data) {
 }
 
 // Tsunami Distribution Analysis
-function tsunamiDistributionPlots(data) {
-  console.log("tsunamiDistributionPlots called with data:", data.length);
-  
-  // Filter out invalid data points and count tsunami occurrences
-  const tsunamiCounts = { 'Yes': 0, 'No': 0 };
-   const validData = data.filter(d => d.tsunami != null && !isNaN(d.tsunami));
-   console.log("tsunamiDistributionPlots - valid data points:", validData.length);
+function tsunamiDistributionPlots(rollups) {
+  const labels = rollups.tsunami.labels;
+  const values = rollups.tsunami.values;
+  const tsunamiCounts = { 'Yes': values[0], 'No': values[1] };
+  console.log("tsunamiDistributionPlots - tsunami counts:", tsunamiCounts);
 
   const barDiv = document.getElementById('chart-tsunami-bar');
   const pieDiv = document.getElementById('chart-tsunami-pie');
 
-    if (validData.length === 0) {
-      console.warn("No valid data points for tsunami distribution plots");
-      if(barDiv) Plotly.purge(barDiv);
-      if(pieDiv) Plotly.purge(pieDiv);
-      if(barDiv) barDiv.innerHTML = '<div class="no-data-message">No data available for Tsunami Bar Chart</div>';
-      if(pieDiv) pieDiv.innerHTML = '<div class="no-data-message">No data available for Tsunami Pie Chart</div>';
-      return;
-  }
-
-  validData.forEach(d => {
-    tsunamiCounts[d.tsunami === 1 ? 'Yes' : 'No']++;
-  });
-  
-  console.log("tsunamiDistributionPlots - tsunami counts:", tsunamiCounts);
-  
-  const labels = Object.keys(tsunamiCounts);
-  const values = Object.values(tsunamiCounts);
-
   if (labels.length === 0 || (tsunamiCounts['Yes'] === 0 && tsunamiCounts['No'] === 0)) {
     console.warn("No valid tsunami data found after counting");
     if(barDiv) Plotly.purge(barDiv);
@@ -1932,13 +1871,9 @@ function tsunamiDistributionPlots(data) {
 }
 
 // Detailed Country Analysis
-function detailedCountryAnalysis(data) {
-  console.log("detailedCountryAnalysis called with data:", data.length);
-  
-  // Filter out invalid data points and group by country
-  const countryData = {};
-  const validData = data.filter(d => d.country != null && d.country !== '' && d.country !== 'Unknown'); // Exclude Unknown
-  console.log("detailedCountryAnalysis - valid data points:", validData.length);
+function detailedCountryAnalysis(rollups) {
+  const countries = rollups.countries;
+  console.log("detailedCountryAnalysis called with countries:", countries.country.length);
 
   const chartDiv = document.getElementById('chart-country-analysis');
   if (!chartDiv) {
@@ -1949,50 +1884,15 @@ function detailedCountryAnalysis(data) {
   // Clear previous content
   chartDiv.innerHTML = '';
 
-  if (validData.length === 0) {
-      console.warn("No valid data points for detailed country analysis");
-      chartDiv.innerHTML = '<div class="no-data-message col-12">No data available for Detailed Country Analysis</div>';
-      return;
-  }
-
-  validData.forEach(d => {
-    if (!countryData[d.country]) {
-      countryData[d.country] = {
-        count: 0,
-        magnitudes: [],
-        depths: [],
-        tsunamis: 0
-      };
-    }
-    countryData[d.country].count++;
-    if (d.magnitude != null && !isNaN(d.magnitude)) {
-      countryData[d.country].magnitudes.push(d.magnitude);
-    }
-    if (d.depth != null && !isNaN(d.depth)) {
-      countryData[d.country].depths.push(d.depth);
-    }
-    if (d.tsunami === 1) {
-      countryData[d.country].tsunamis++;
-    }
-  });
-  
-  console.log("detailedCountryAnalysis - country data after grouping:", countryData);
-  
-  const countryStats = Object.entries(countryData).map(([country, stats]) => ({
+  // Per-country statistics arrive sorted by count in descending order
+  const countryStats = countries.country.map((country, i) => ({
     country,
-    count: stats.count,
-    avgMagnitude: stats.magnitudes.length > 0 ? 
-      stats.magnitudes.reduce((a, b) => a + b, 0) / stats.magnitudes.length : 0,
-    avgDepth: stats.depths.length > 0 ? 
-      stats.depths.reduce((a, b) => a + b, 0) / stats.depths.length : 0,
-    tsunamiRate: stats.count > 0 ? (stats.tsunamis / stats.count) * 100 : 0
+    count: countries.count[i],
+    avgMagnitude: countries.avg_magnitude[i],
+    avgDepth: countries.avg_depth[i],
+    tsunamiRate: countries.tsunami_rate[i]
   }));
 
-  // Sort by count in descending order
-  countryStats.sort((a, b) => b.count - a.count);
-
-  console.log("detailedCountryAnalysis - country stats:", countryStats);
-
   if (countryStats.length === 0) {
       console.warn("No country stats generated.");
       chartDiv.innerHTML = '<div class="no-data-message col-12">No data available for Detailed Country Analysis</div>';
@@ -2082,12 +1982,45 @@ function detailedCountryAnalysis(data) {
 }
 
 // Data Table Functionality
-// Load earthquake data
+let tableTotal = 0;
+let tableLoaded = false;
+
+// Build query parameters for the server-side filters from the filter panel
+function getFilterParams() {
+  const params = new URLSearchParams();
+  const inputs = {
+    minMagnitude: 'min_magnitude',
+    maxMagnitude: 'max_magnitude',
+    minDepth: 'min_depth',
+    maxDepth: 'max_depth',
+    startDate: 'start_date',
+    endDate: 'end_date'
+  };
+  Object.entries(inputs).forEach(([id, name]) => {
+    const value = document.getElementById(id).value;
+    if (value !== '') params.set(name, value);
+  });
+  const category = document.getElementById('typeFilter').value;
+  if (category !== 'All') params.set('magnitude_category', category);
+  const tsunami = document.getElementById('tsunamiFilter').value;
+  if (tsunami !== 'All') params.set('tsunami', tsunami);
+  return params;
+}
+
+// Load one page of earthquake data; filtering, sorting and paging happen on the server
 async function loadEarthquakeData() {
   try {
-    const response = await fetch('/api/earthquake-data');
-    earthquakeData = await response.json();
-    filteredData = [...earthquakeData];
+    const params = getFilterParams();
+    params.set('page', currentPage);
+    params.set('per_page', entriesPerPage);
+    const response = await fetch(`/api/earthquake-data?${params}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const result = await response.json();
+    earthquakeData = result.records;
+    tableTotal = result.total;
+    tableLoaded = true;
     updateTable();
   } catch (error) {
     console.error('Error loading earthquake data:', error);
@@ -2097,12 +2030,9 @@ async function loadEarthquakeData() {
 // Update table with current data
 function updateTable() {
   const tableBody = document.querySelector('#earthquakeTable tbody');
-  const startIndex = (currentPage - 1) * entriesPerPage;
-  const endIndex = startIndex + entriesPerPage;
-  const pageData = filteredData.slice(startIndex, endIndex);
 
   tableBody.innerHTML = '';
-  pageData.forEach(quake => {
+  earthquakeData.forEach(quake => {
     const row = document.createElement('tr');
     row.innerHTML = `
       <td>${quake.date_time ? new Date(quake.date_time).toLocaleDateString() : '-'}</td>
@@ -2124,7 +2054,7 @@ function updateTable() {
 
 // Update pagination controls
 function updatePagination() {
-  const totalPages = Math.ceil(filteredData.length / entriesPerPage);
+  const totalPages = Math.ceil(tableTotal / entriesPerPage);
   const pagination = document.getElementById('tablePagination');
   pagination.innerHTML = '';
 
@@ -2158,10 +2088,10 @@ function updatePagination() {
 
 // Update table information
 function updateTableInfo() {
-  const start = (currentPage - 1) * entriesPerPage + 1;
-  const end = Math.min(currentPage * entriesPerPage, filteredData.length);
+  const start = tableTotal === 0 ? 0 : (currentPage - 1) * entriesPerPage + 1;
+  const end = Math.min(currentPage * entriesPerPage, tableTotal);
   document.getElementById('tableInfo').textContent = 
-    `Showing ${start} to ${end} of ${filteredData.length} entries`;
+    `Showing ${start} to ${end} of ${tableTotal} entries`;
 }
 
 // Event listeners
@@ -2172,7 +2102,7 @@ document.addEventListener('DOMContentLoaded', () => {
   document.getElementById('dataEntries').addEventListener('change', (e) => {
     entriesPerPage = parseInt(e.target.value);
     currentPage = 1;
-    updateTable();
+    loadEarthquakeData();
   });
 
   document.getElementById('tablePagination').addEventListener('click', (e) => {
@@ -2181,14 +2111,14 @@ document.addEventListener('DOMContentLoaded', () => {
       const page = parseInt(e.target.dataset.page);
       if (!isNaN(page) && page !== currentPage) {
         currentPage = page;
-        updateTable();
+        loadEarthquakeData();
       }
     }
   });
 
   // Load data when Data tab is clicked
   document.getElementById('data-tab').addEventListener('click', () => {
-    if (earthquakeData.length === 0) {
+    if (!tableLoaded) {
       loadEarthquakeData();
     }
   });
@@ -2197,14 +2127,10 @@ document.addEventListener('DOMContentLoaded', () => {
 // Add event listeners for correlation heatmap controls
 function addCorrelationHeatmapEventListeners() {
   document.getElementById('correlationMethod').addEventListener('change', function() {
-    if (currentHeatmapData && currentHeatmapData.length > 0) {
-      correlationHeatmap(currentHeatmapData);
-    }
+    correlationHeatmap();
   });
   
   document.getElementById('showCorrelationValues').addEventListener('change', function() {
-    if (currentHeatmapData && currentHeatmapData.length > 0) {
-      correlationHeatmap(currentHeatmapData);
-    }
+    correlationHeatmap();
   });
 }
\ No newline at end of file
@@ -0,0 +1,567 @@
+import abc
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, RobustScaler
+from threadpoolctl import threadpool_limits
+
+from inference import compile_model
+
+# --- Parallel Model Training ---
+#
+# Every candidate model is scored on the same k cross-validation folds plus the
+# held-out test split. The preprocessor is fitted once per split in the parent
+# and the transformed matrices are shared by all models, so a (model, split)
+# task is only the classifier fit. Tasks run across a process pool and each
+# task's thread count is capped so workers x threads never exceeds the cores.
+
+HOLDOUT = 'holdout'
+
+# Estimator parameters that control native thread pools
+THREAD_PARAMS = ('n_jobs', 'nthread', 'thread_count')
+
+
+def build_preprocessor(numeric_features, categorical_features):
+    """Robust-scaled numeric columns plus one-hot categoricals, as the saved pipeline expects."""
+    return ColumnTransformer(
+        transformers=[
+            ('num', RobustScaler(), numeric_features),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+        ],
+        remainder='passthrough'
+    )
+
+
+def prepare_splits(preprocessor, X_train, y_train, X_test, y_test, n_splits=5, random_state=42):
+    """
+    Fit the preprocessor once per split and cache the transformed matrices.
+    Returns ({split: (X_fit, y_fit, X_eval, y_eval)}, preprocessor fitted on the full training set).
+    """
+    y_train = np.asarray(y_train)
+    splits = {}
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for fold, (fit_rows, eval_rows) in enumerate(folds.split(X_train, y_train)):
+        fitted = clone(preprocessor).fit(X_train.iloc[fit_rows])
+        splits[fold] = (fitted.transform(X_train.iloc[fit_rows]), y_train[fit_rows],
+                        fitted.transform(X_train.iloc[eval_rows]), y_train[eval_rows])
+
+    fitted = clone(preprocessor).fit(X_train)
+    splits[HOLDOUT] = (fitted.transform(X_train), y_train, fitted.transform(X_test), np.asarray(y_test))
+    return splits, fitted
+
+
+def thread_budget(n_tasks, workers=None, cores=None):
+    """(pool workers, threads per task) so that workers * threads stays within the cores."""
+    cores = cores or os.cpu_count() or 1
+    workers = max(1, min(workers or cores, n_tasks, cores))
+    return workers, max(1, cores // workers)
+
+
+def set_threads(model, threads):
+    """Cap an estimator's native thread pool; estimators without one are left as they are."""
+    params = model.get_params(deep=False)
+    model.set_params(**{name: threads for name in THREAD_PARAMS if name in params})
+    return model
+
+
+# Splits shared with the worker processes (inherited or pickled once per worker, not per task)
+_SPLITS = None
+
+
+def _init_worker(splits, threads=None):
+    global _SPLITS
+    _SPLITS = splits
+    if threads is not None:
+        # BLAS/OpenMP pools used inside a pool worker obey the same cap as the estimators
+        threadpool_limits(threads)
+
+
+def _fit_task(name, model, split, threads):
+    X_fit, y_fit, X_eval, y_eval = _SPLITS[split]
+    model = set_threads(clone(model), threads)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    model.fit(X_fit, y_fit)
+    fit_wall, fit_cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_eval)
+    result = {
+        'name': name,
+        'split': split,
+        'accuracy': accuracy_score(y_eval, y_pred),
+        'fit_wall': fit_wall,
+        'fit_cpu': fit_cpu,
+        'predict_wall': time.perf_counter() - start,
+    }
+    # Only the held-out fit is kept; fold models are discarded in the worker
+    if split == HOLDOUT:
+        result['y_pred'] = y_pred
+        result['model'] = model
+    return result
+
+
+class TaskRunner:
+    """
+    Runs task functions over the prepared splits, in-process for a single worker
+    or across a process pool that stays up for every batch submitted to it.
+    """
+
+    def __init__(self, splits, n_tasks, workers=None):
+        self.workers, self.threads = thread_budget(n_tasks, workers)
+        self.pool = None
+        if self.workers == 1:
+            # No pool for a single worker: same code path, no process start-up or pickling.
+            # The thread cap is applied around each batch in map, not to this whole process
+            _init_worker(splits)
+        else:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(splits, self.threads))
+
+    def map(self, fn, tasks):
+        """Results of fn(*task, threads) in task order."""
+        if self.pool is None:
+            with threadpool_limits(self.threads):
+                return [fn(*task, self.threads) for task in tasks]
+        futures = [self.pool.submit(fn, *task, self.threads) for task in tasks]
+        return [future.result() for future in futures]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+        else:
+            # Release the in-process copy of the splits
+            _init_worker(None)
+
+
+def run_tasks(models, splits, workers=None):
+    """Fit every model on every split across a process pool; returns the task results."""
+    # Held-out fits train on the most rows, so they go first to balance the pool
+    order = [HOLDOUT] + [split for split in splits if split != HOLDOUT]
+    tasks = [(name, model, split) for split in order for name, model in models.items()]
+    with TaskRunner(splits, len(tasks), workers) as runner:
+        print(f"Running {len(tasks)} fits ({len(models)} models x {len(splits)} splits) "
+              f"on {runner.workers} worker(s) with {runner.threads} thread(s) each.")
+        return runner.map(_fit_task, tasks)
+
+
+def summarize(results, models):
+    """Per-model CV scores, held-out result and summed wall/CPU time."""
+    summary = {}
+    for name in models:
+        own = [r for r in results if r['name'] == name]
+        cv = [r['accuracy'] for r in own if r['split'] != HOLDOUT]
+        holdout = next(r for r in own if r['split'] == HOLDOUT)
+        summary[name] = {
+            'cv_scores': cv,
+            'cv_mean': float(np.mean(cv)) if cv else holdout['accuracy'],
+            'cv_std': float(np.std(cv)) if cv else 0.0,
+            'holdout_accuracy': holdout['accuracy'],
+            'y_pred': holdout['y_pred'],
+            'model': holdout['model'],
+            'fit_wall': sum(r['fit_wall'] for r in own),
+            'fit_cpu': sum(r['fit_cpu'] for r in own),
+            'predict_wall': sum(r['predict_wall'] for r in own),
+            'fits': len(own),
+        }
+    return summary
+
+
+def print_breakdown(summary, elapsed):
+    """Wall-clock/CPU table per model; CPU/wall above 1 means the model used several threads."""
+    print(f"\n{'Model':<18}{'CV accuracy':>18}{'Holdout':>10}{'Fits':>6}{'Fit wall':>11}"
+          f"{'Fit CPU':>10}{'CPU/wall':>10}{'Predict':>10}")
+    for name, s in summary.items():
+        ratio = s['fit_cpu'] / s['fit_wall'] if s['fit_wall'] > 0 else float('nan')
+        print(f"{name:<18}{s['cv_mean']:>10.4f} ± {s['cv_std']:.4f}{s['holdout_accuracy']:>10.4f}{s['fits']:>6}"
+              f"{s['fit_wall']:>10.2f}s{s['fit_cpu']:>9.2f}s{ratio:>10.2f}{s['predict_wall']:>9.3f}s")
+    cpu = sum(s['fit_cpu'] for s in summary.values())
+    print(f"Total: {elapsed:.2f}s wall, {cpu:.2f}s of fitting CPU "
+          f"({cpu / elapsed if elapsed > 0 else float('nan'):.2f} cores busy on average).")
+
+
+def train_models(models, preprocessor, X_train, y_train, X_test, y_test,
+                 n_splits=5, workers=None, random_state=42):
+    """
+    Cross-validate and hold-out-test every candidate in parallel.
+    Returns (summary per model, name of the best model by mean CV accuracy,
+    best pipeline fitted on the full training split).
+    """
+    start = time.perf_counter()
+    splits, fitted_preprocessor = prepare_splits(
+        preprocessor, X_train, y_train, X_test, y_test, n_splits, random_state)
+    print(f"Preprocessor fitted for {len(splits)} splits in {time.perf_counter() - start:.2f}s.")
+
+    results = run_tasks(models, splits, workers)
+    summary = summarize(results, models)
+    print_breakdown(summary, time.perf_counter() - start)
+
+    # Ties keep the order the candidates were given in
+    best_name = max(summary, key=lambda name: summary[name]['cv_mean'])
+    best = summary[best_name]['model']
+    # The saved model keeps the thread settings it was configured with, not the pool's cap
+    configured = models[best_name].get_params(deep=False)
+    best.set_params(**{name: configured[name] for name in THREAD_PARAMS if name in configured})
+    pipeline = Pipeline(steps=[('preprocessor', fitted_preprocessor), ('classifier', best)])
+    return summary, best_name, pipeline
+
+
+# --- Hyperparameter Search ---
+#
+# Hyperband: brackets of successive halving over randomly sampled configurations
+# of every model family. A rung scores its configurations on the CV folds using
+# a fraction of each fold's rows, keeps the best 1/eta and gives the survivors
+# eta times the rows. Boosted families stop adding trees once a validation
+# slice of their fit rows stops improving, so the tree count is learned rather
+# than fixed. The wall-clock budget is checked before each rung.
+
+MAX_BOOSTING_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 20
+VALIDATION_FRACTION = 0.1
+
+# Survivors per rung are 1/eta of the configurations; the first rung fits on min_fraction of the rows
+HYPERBAND_ETA = 3
+HYPERBAND_MIN_FRACTION = 1 / 9
+
+
+def _choice(rng, options):
+    return options[int(rng.integers(len(options)))]
+
+
+def _loguniform(rng, low, high):
+    # Three significant digits keep the reported parameters readable
+    return float(f'{np.exp(rng.uniform(np.log(low), np.log(high))):.3g}')
+
+
+def _validation_split(X, y):
+    """Hold out a stratified slice of the fit rows for early stopping."""
+    stratify = y if np.bincount(y).min() >= 2 else None
+    return train_test_split(X, y, test_size=VALIDATION_FRACTION, random_state=42, stratify=stratify)
+
+
+class SearchFamily(abc.ABC):
+    """One model family: its search space, how to fit it and how many trees it ended up with."""
+
+    name = None
+
+    @abc.abstractmethod
+    def sample(self, rng):
+        """Draw one configuration (a dict of parameters) from the family's search space."""
+
+    @abc.abstractmethod
+    def build(self, params):
+        """An unfitted classifier for a sampled configuration."""
+
+    def fit(self, model, X, y):
+        model.fit(X, y)
+
+    def iterations(self, model):
+        return None
+
+    def final_params(self, params, iterations):
+        """Parameters for the refit on the full training split, with the tree count the search found."""
+        return params
+
+
+class XGBoostFamily(SearchFamily):
+    name = 'XGBoost'
+
+    def sample(self, rng):
+        return {
+            'learning_rate': _loguniform(rng, 0.02, 0.3),
+            'max_depth': int(rng.integers(3, 9)),
+            'min_child_weight': _loguniform(rng, 1.0, 10.0),
+            'subsample': round(float(rng.uniform(0.6, 1.0)), 2),
+            'colsample_bytree': round(float(rng.uniform(0.6, 1.0)), 2),
+        }
+
+    def build(self, params):
+        defaults = {'n_estimators': MAX_BOOSTING_ROUNDS, 'early_stopping_rounds': EARLY_STOPPING_ROUNDS}
+        return xgb.XGBClassifier(objective='binary:logistic', eval_metric='logloss', tree_method='hist',
+                                 random_state=42, **{**defaults, **params})
+
+    def fit(self, model, X, y):
+        if model.get_params()['early_stopping_rounds'] is None:
+            model.fit(X, y)
+            return
+        X_fit, X_val, y_fit, y_val = _validation_split(X, y)
+        model.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+
+    def iterations(self, model):
+        try:
+            return model.best_iteration + 1
+        except AttributeError:
+            return model.get_params()['n_estimators']
+
+    def final_params(self, params, iterations):
+        return {**params, 'n_estimators': iterations, 'early_stopping_rounds': None}
+
+
+class HistGradientBoostingFamily(SearchFamily):
+    name = 'HistGradientBoosting'
+
+    def sample(self, rng):
+        return {
+            'learning_rate': _loguniform(rng, 0.02, 0.3),
+            'max_leaf_nodes': _choice(rng, [15, 31, 63]),
+            'max_depth': _choice(rng, [None, 3, 5, 8]),
+            'min_samples_leaf': _choice(rng, [5, 10, 20, 40]),
+            'l2_regularization': _loguniform(rng, 1e-4, 1.0),
+        }
+
+    def build(self, params):
+        defaults = {'max_iter': MAX_BOOSTING_ROUNDS, 'early_stopping': True}
+        return HistGradientBoostingClassifier(validation_fraction=VALIDATION_FRACTION,
+                                              n_iter_no_change=EARLY_STOPPING_ROUNDS,
+                                              random_state=42, **{**defaults, **params})
+
+    def iterations(self, model):
+        return model.n_iter_
+
+    def final_params(self, params, iterations):
+        return {**params, 'max_iter': iterations, 'early_stopping': False}
+
+
+class RandomForestFamily(SearchFamily):
+    name = 'RandomForest'
+
+    def sample(self, rng):
+        return {
+            'n_estimators': _choice(rng, [100, 200, 400]),
+            'max_depth': _choice(rng, [None, 6, 10, 16]),
+            'min_samples_leaf': _choice(rng, [1, 2, 4, 8]),
+            'max_features': _choice(rng, ['sqrt', 0.5, 1.0]),
+        }
+
+    def build(self, params):
+        return RandomForestClassifier(random_state=42, **params)
+
+    def iterations(self, model):
+        return len(model.estimators_)
+
+
+SEARCH_FAMILIES = [XGBoostFamily(), HistGradientBoostingFamily(), RandomForestFamily()]
+
+
+def _search_task(family, params, split, fraction, threads):
+    X_fit, y_fit, X_eval, y_eval = _SPLITS[split]
+    if fraction < 1:
+        # The same seed gives nested subsets, so a survivor's rows only grow between rungs
+        rows = np.random.default_rng(0).permutation(len(y_fit))[:max(2, int(round(fraction * len(y_fit))))]
+        X_fit, y_fit = X_fit[rows], y_fit[rows]
+    model = set_threads(family.build(params), threads)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    family.fit(model, X_fit, y_fit)
+    fit_wall, fit_cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    y_pred = model.predict(X_eval)
+    result = {
+        'accuracy': accuracy_score(y_eval, y_pred),
+        'iterations': family.iterations(model),
+        'fit_wall': fit_wall,
+        'fit_cpu': fit_cpu,
+    }
+    if split == HOLDOUT:
+        result['y_pred'] = y_pred
+        result['model'] = model
+    return result
+
+
+def _score_trials(runner, trials, folds, fraction):
+    """Evaluate every trial on every fold at `fraction` of the rows and record the mean accuracy."""
+    tasks = [(trial['family'], trial['params'], fold, fraction) for trial in trials for fold in folds]
+    results = runner.map(_search_task, tasks)
+    for i, trial in enumerate(trials):
+        own = results[i * len(folds):(i + 1) * len(folds)]
+        scores = [r['accuracy'] for r in own]
+        iterations = [r['iterations'] for r in own if r['iterations'] is not None]
+        trial.update({
+            'fraction': fraction,
+            'cv_mean': float(np.mean(scores)),
+            'cv_std': float(np.std(scores)),
+            'iterations': int(round(np.mean(iterations))) if iterations else None,
+            'fit_cpu': trial.get('fit_cpu', 0.0) + sum(r['fit_cpu'] for r in own),
+        })
+
+
+def _max_bracket(eta, min_fraction):
+    return int(round(np.log(1 / min_fraction) / np.log(eta)))
+
+
+def _bracket_configs(s, s_max, eta):
+    """Configurations sampled for bracket `s`, all scored in its first rung."""
+    return int(np.ceil((s_max + 1) / (s + 1) * eta ** s))
+
+
+def largest_rung(eta=HYPERBAND_ETA, min_fraction=HYPERBAND_MIN_FRACTION):
+    """Most configurations any rung scores at once (the first rung of the widest bracket)."""
+    s_max = _max_bracket(eta, min_fraction)
+    return max(_bracket_configs(s, s_max, eta) for s in range(s_max + 1))
+
+
+def hyperband(runner, splits, families, budget_seconds, eta=HYPERBAND_ETA, min_fraction=HYPERBAND_MIN_FRACTION,
+              seed=42):
+    """
+    Successive-halving brackets, from many configurations on few rows to a few on
+    all rows, repeated with fresh samples until the budget runs out.
+    Returns every trial with the score at the largest fraction it reached.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    folds = [split for split in splits if split != HOLDOUT]
+    s_max = _max_bracket(eta, min_fraction)
+    trials = []
+
+    def out_of_time():
+        # At least one rung always runs so there is something to choose from
+        return bool(trials) and time.perf_counter() - start > budget_seconds
+
+    while not out_of_time():
+        for s in range(s_max, -1, -1):
+            if out_of_time():
+                break
+            n = _bracket_configs(s, s_max, eta)
+            # Families take turns so every bracket samples all of them
+            bracket = []
+            for _ in range(n):
+                family = families[len(trials) % len(families)]
+                trial = {'family': family, 'params': family.sample(rng)}
+                trials.append(trial)
+                bracket.append(trial)
+
+            for i in range(s + 1):
+                if i > 0 and out_of_time():
+                    break
+                fraction = float(eta) ** (i - s)
+                _score_trials(runner, bracket, folds, fraction)
+                bracket.sort(key=lambda trial: -trial['cv_mean'])
+                leader = bracket[0]
+                print(f"Bracket {s}, rung {i}: {len(bracket)} configuration(s) on {fraction:.0%} of the rows; "
+                      f"best {leader['family'].name} {leader['cv_mean']:.4f} "
+                      f"({time.perf_counter() - start:.1f}s elapsed).")
+                bracket = bracket[:max(1, len(bracket) // eta)]
+    return [trial for trial in trials if 'cv_mean' in trial]
+
+
+def measure_inference(pipeline, model_columns, X_sample, repeats=200):
+    """
+    Pickled size and the latency of the path the app serves predictions with:
+    the compiled model when the classifier supports it, the sklearn pipeline otherwise.
+    """
+    compiled = compile_model(pipeline, model_columns)
+    events = X_sample[model_columns].head(repeats).to_dict(orient='records')
+
+    timings = []
+    for event in events:
+        start = time.perf_counter()
+        if compiled is not None:
+            compiled.predict_with_proba(event)
+        else:
+            pipeline.predict_proba(pd.DataFrame([event], columns=model_columns))
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    (compiled or pipeline).predict_proba(X_sample[model_columns])
+    batch = time.perf_counter() - start
+    return {
+        'size_bytes': len(pickle.dumps(pipeline, protocol=pickle.HIGHEST_PROTOCOL)),
+        'compiled': compiled is not None,
+        'latency_ms': float(np.median(timings)) * 1e3,
+        'batch_us_per_row': batch / len(X_sample) * 1e6,
+    }
+
+
+def print_tradeoffs(summary, best_name):
+    print(f"\n{'Model':<22}{'CV accuracy':>18}{'Rows':>6}{'Trees':>7}{'Holdout':>9}"
+          f"{'Size':>10}{'Latency':>10}{'Batch/row':>11}")
+    for name, s in summary.items():
+        marker = '*' if name == best_name else ' '
+        trees = s['iterations'] if s['iterations'] is not None else '-'
+        print(f"{marker}{name:<21}{s['cv_mean']:>10.4f} ± {s['cv_std']:.4f}{s['fraction']:>6.0%}{trees:>7}"
+              f"{s['holdout_accuracy']:>9.4f}{s['size_bytes'] / 1024:>8.0f}KB{s['latency_ms']:>8.2f}ms"
+              f"{s['batch_us_per_row']:>9.1f}us")
+        print(f"  {s['params']}")
+    print("Latency is the median single-event prediction on the path the app uses "
+          "(compiled when supported); * marks the chosen model.")
+
+
+def search_models(preprocessor, X_train, y_train, X_test, y_test, model_columns, budget_seconds=300,
+                  families=None, n_splits=3, workers=None, max_latency_ms=None, random_state=42):
+    """
+    Hyperband search over every family within `budget_seconds`. The best
+    configuration of each family is refit on the full training split and
+    measured for held-out accuracy, pickled size and prediction latency.
+    Returns (summary per family, chosen family, chosen pipeline); the chosen
+    model is the most accurate in CV among those within `max_latency_ms`.
+    """
+    families = families or SEARCH_FAMILIES
+    start = time.perf_counter()
+    splits, fitted_preprocessor = prepare_splits(
+        preprocessor, X_train, y_train, X_test, y_test, n_splits, random_state)
+
+    # Sized for the widest rung: every configuration of it on every fold
+    with TaskRunner(splits, largest_rung() * n_splits, workers) as runner:
+        print(f"Searching {', '.join(f.name for f in families)} for {budget_seconds:.0f}s "
+              f"on {runner.workers} worker(s) with {runner.threads} thread(s) each.")
+        trials = hyperband(runner, splits, families, budget_seconds, seed=random_state)
+
+        # Best configuration per family, preferring scores measured on more rows
+        finalists = {}
+        for trial in sorted(trials, key=lambda trial: (trial['fraction'], trial['cv_mean']), reverse=True):
+            finalists.setdefault(trial['family'].name, trial)
+        tasks = [(trial['family'], trial['family'].final_params(trial['params'], trial['iterations']), HOLDOUT, 1.0)
+                 for trial in finalists.values()]
+        refits = runner.map(_search_task, tasks)
+    print(f"Search finished in {time.perf_counter() - start:.1f}s after {len(trials)} configurations.")
+
+    summary = {}
+    for (name, trial), refit in zip(finalists.items(), refits):
+        pipeline = Pipeline(steps=[('preprocessor', fitted_preprocessor), ('classifier', refit['model'])])
+        summary[name] = {
+            'params': trial['params'],
+            'fraction': trial['fraction'],
+            'cv_mean': trial['cv_mean'],
+            'cv_std': trial['cv_std'],
+            'iterations': refit['iterations'],
+            'holdout_accuracy': refit['accuracy'],
+            'y_pred': refit['y_pred'],
+            'model': refit['model'],
+            'pipeline': pipeline,
+            **measure_inference(pipeline, model_columns, X_test),
+        }
+
+    eligible = [name for name in summary
+                if max_latency_ms is None or summary[name]['latency_ms'] <= max_latency_ms]
+    if not eligible:
+        print(f"No model predicts within {max_latency_ms}ms; choosing among all of them.")
+        eligible = list(summary)
+    best_name = max(eligible, key=lambda name: (summary[name]['fraction'], summary[name]['cv_mean']))
+    print_tradeoffs(summary, best_name)
+
+    best = summary[best_name]['model']
+    # Prediction threads are left to the library defaults, as for the fixed models
+    best.set_params(**{name: None for name in THREAD_PARAMS if name in best.get_params(deep=False)})
+    return summary, best_name, summary[best_name]['pipeline']
+
+
+def save_atomic(obj, path):
+    """joblib.dump through a temporary file so the app's reloader never sees a partial pickle."""
+    tmp_path = f'{path}.tmp'
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)